@@ -0,0 +1,849 @@
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from contextlib import contextmanager
+from functools import partial
+from sephora_setup import CORPUS_DIR, PRODUCT_LINK_CLASS, COMEDOGENIC_PATH
+from http_client import HttpClient, get_client, set_client
+import random
+import subprocess
+import tracemalloc
+import threading
+import platform
+import tempfile
+import sys
+import logging
+import json
+import time
+import os
+
+
+# layout of the frozen corpus (see corpus/README.md)
+SITE_DIR = "site" # saved Sephora pages, served by serve_corpus()
+INCI_PAGE = os.path.join("inci", "eu_inci.html")
+EXPECTED_FILE = "expected.json"
+
+SUBCATEGORY_LINK = "/shop/moisturizing-cream-oils-mists"
+
+# stages measured by run_benchmarks, in the order they are run
+STAGES = ["find_ingredients", "format_ingredients", "get_product_info",
+          "embedded_product_info", "fetch_under_faults", "make_dataframe",
+          "make_ingredient_table"]
+
+# how the stand-in server misbehaves in the fetch_under_faults stage
+# (see FaultInjector): slow, flaky, and throttling above 6 requests at once
+FAULTS = {"latency": 0.02, "error_rate": 0.05, "hang_rate": 0.01,
+          "hang_seconds": 2.0, "max_in_flight": 6}
+
+# a cold `cli.py screen` of a few strings must finish within this many seconds,
+# without importing any of these crawler modules (see check_startup)
+STARTUP_BUDGET = 1.5
+CRAWL_MODULES = ["selenium", "webdriver_manager", "requests", "bs4", "lxml",
+                 "selectolax", "browsers", "sephora"]
+
+
+
+# ---------------------------- < STAND-IN SERVER > ---------------------------- #
+class FaultInjector:
+    """
+    A class used to make the stand-in server misbehave like a real site
+    under load, to test how the fetch layer copes.
+
+    Attributes
+    ----------
+    latency: float
+        every response is delayed by up to this many seconds
+    error_rate: float
+        share of requests answered with 500
+    hang_rate: float
+        share of requests that stall for hang_seconds before answering
+        (longer than the client's read timeout)
+    hang_seconds: float
+    max_in_flight: int
+        requests beyond this many at once are answered with 429 and a
+        Retry-After header (None for no limit)
+    requests: dict
+        number of responses sent, by status code ("hang" for stalled ones)
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 hang_rate: float = 0.0, hang_seconds: float = 10.0,
+                 max_in_flight: int = None, retry_after: float = 0.05,
+                 seed: int = 0):
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.requests = {}
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+
+    def enter(self) -> tuple:
+        # (status to answer with instead of the page or None, seconds to wait)
+        with self._lock:
+            self._in_flight += 1
+            draw = self._random.random()
+            delay = self._random.uniform(0, self.latency)
+
+            if self.max_in_flight and self._in_flight > self.max_in_flight:
+                status = 429
+            elif draw < self.error_rate:
+                status = 500
+            elif draw < self.error_rate + self.hang_rate:
+                status, delay = None, self.hang_seconds
+                self.requests["hang"] = self.requests.get("hang", 0) + 1
+            else:
+                status = None
+
+            key = status or 200
+            self.requests[key] = self.requests.get(key, 0) + 1
+            return status, delay
+
+
+    def exit(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+
+class _CorpusHandler(SimpleHTTPRequestHandler):
+    # serves /product/<slug>?... from <slug>.html, like the real site
+
+    def __init__(self, *args, faults: FaultInjector = None, **kwargs):
+        self.faults = faults
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        if self.faults is None:
+            return super().do_GET()
+
+        status, delay = self.faults.enter()
+        try:
+            time.sleep(delay)
+            if status is None:
+                return super().do_GET()
+
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", str(self.faults.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        except (ConnectionError, OSError):
+            pass # the client gave up waiting
+        finally:
+            self.faults.exit()
+
+    def translate_path(self, path):
+        path = super().translate_path("/" + path.lstrip("/"))
+        if not os.path.exists(path) and os.path.exists(path + ".html"):
+            path += ".html"
+        return path
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_corpus(directory: str = None, faults: FaultInjector = None):
+    """
+    Description
+    -----------
+    Serve the saved Sephora pages on localhost, as a stand-in for
+    sephora.com, for as long as the context is open
+
+    Parameters
+    ----------
+    directory: str
+        defaults to the "site" directory of CORPUS_DIR
+    faults: FaultInjector
+        if given, the server injects latency, errors, and throttling
+
+    Returns
+    -------
+    context manager yielding the base url, e.g. "http://127.0.0.1:50123/"
+    """
+
+    directory = directory or os.path.join(CORPUS_DIR, SITE_DIR)
+    handler = partial(_CorpusHandler, directory = directory, faults = faults)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def _scratch_directory():
+    # make_dataframe and make_ingredient_table write .csv files to the
+    # working directory, so run them somewhere they can't overwrite real data
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "data"))
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+
+
+# ------------------------------ < MEASUREMENT > ------------------------------ #
+def measure(function, n_items: int, repeat: int = 3) -> dict:
+    """
+    Description
+    -----------
+    Time a function (best of repeat runs), then run it once more under
+    tracemalloc to find its peak memory use
+
+    Parameters
+    ----------
+    function: callable with no arguments
+    n_items: int
+        number of items (pages, strings, products...) one call processes
+    repeat: int
+
+    Returns
+    -------
+    dict with "items", "seconds", "items_per_sec", and "peak_memory_bytes"
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "items": n_items,
+        "seconds": best,
+        "items_per_sec": n_items / best if best else float("inf"),
+        "peak_memory_bytes": peak
+    }
+
+
+def load_corpus(corpus_dir: str = CORPUS_DIR) -> dict:
+    """
+    Description
+    -----------
+    Read the frozen corpus into memory
+
+    Parameters
+    ----------
+    corpus_dir: str
+
+    Returns
+    -------
+    dict with "site" (directory of the pages to serve),
+    "products" (list of (file name, bytes) tuples),
+    "product_links" (links as they appear on the subcategory page),
+    "inci" (bytes of the EU INCI page), and "expected" (the oracle)
+    """
+
+    import parsers
+
+    site = os.path.join(corpus_dir, SITE_DIR)
+    with open(os.path.join(site, SUBCATEGORY_LINK.strip("/") + ".html"), "rb") as f:
+        subcategory = f.read()
+    with open(os.path.join(corpus_dir, INCI_PAGE), "rb") as f:
+        inci = f.read()
+
+    expected = None
+    expected_path = os.path.join(corpus_dir, EXPECTED_FILE)
+    if os.path.exists(expected_path):
+        with open(expected_path) as f:
+            expected = json.load(f)
+
+    links = parsers.find_all_in_page(subcategory, "a", PRODUCT_LINK_CLASS)
+    return {
+        "site": site,
+        "products": parsers.load_pages(os.path.join(site, "product")),
+        "product_links": [a["href"] for a in links],
+        "inci": inci,
+        "expected": expected
+    }
+
+
+
+# ------------------------------- < BENCHMARKS > ------------------------------ #
+def bench_find_ingredients(corpus: dict, parser: str = None, repeat: int = 3) -> dict:
+    from sephora import Sephora
+    import parsers
+
+    sephora = Sephora(parser = parser)
+    sections = []
+    for _, content in corpus["products"]:
+        details = parsers.extract_product_fields(content, sephora.parser)["details"]
+        if len(details) > 2:
+            sections.append(details[2])
+
+    def run():
+        for section in sections:
+            sephora.find_ingredients(section)
+
+    return measure(run, len(sections), repeat)
+
+
+def bench_format_ingredients(corpus: dict, parser: str = None, repeat: int = 3,
+                             scale: int = 100) -> dict:
+    from sephora import Sephora
+
+    sephora = Sephora(parser = parser)
+    raw_strings = [record["raw ingredients"]
+                   for record in _parse_corpus(corpus, sephora).values()
+                   if record and record["raw ingredients"]] * scale
+
+    def run():
+        for raw in raw_strings:
+            sephora.format_ingredients(raw, "benchmark")
+
+    return measure(run, len(raw_strings), repeat)
+
+
+def bench_get_product_info(corpus: dict, parser: str = None, repeat: int = 3) -> dict:
+    from fetch import FetchEngine, get_engine, set_engine
+    from sephora import Sephora
+
+    links = corpus["product_links"]
+    previous_client = get_client()
+    previous_engine = get_engine()
+    set_client(HttpClient()) # no cache, so every page goes over the network
+    set_engine(FetchEngine(requests_per_second = None)) # no politeness delay
+
+    try:
+        with serve_corpus(corpus["site"]) as base_url:
+            sephora = Sephora(base_url = base_url, parser = parser)
+
+            def run():
+                sephora.product_info = []
+                for link in links:
+                    sephora.get_product_info(link)
+
+            return measure(run, len(links), repeat)
+    finally:
+        get_client().close()
+        set_client(previous_client)
+        set_engine(previous_engine)
+
+
+def bench_embedded_product_info(corpus: dict, parser: str = None, repeat: int = 3) -> dict:
+    from sephora import Sephora
+
+    sephora = Sephora(parser = parser)
+    pages = embedded_corpus(corpus)["products"]
+
+    def parse(pages):
+        for name, content in pages:
+            sephora.parse_product_page(name, content)
+
+    # the same pages without their embedded data, for comparison
+    html = measure(lambda: parse(corpus["products"]), len(pages), repeat)
+
+    result = measure(lambda: parse(pages), len(pages), repeat)
+    result["html_items_per_sec"] = html["items_per_sec"]
+    return result
+
+
+def bench_fetch_under_faults(corpus: dict, parser: str = None, repeat: int = 3,
+                             faults: dict = FAULTS, scale: int = 10) -> dict:
+    from fetch import FetchEngine
+
+    links = corpus["product_links"] * scale
+    injector = FaultInjector(**faults)
+    client = HttpClient(timeout = (1.0, 0.5), max_connections_per_host = 32)
+    failures = []
+
+    try:
+        with serve_corpus(corpus["site"], injector) as base_url:
+            urls = [base_url + link.lstrip("/") for link in links]
+
+            def run():
+                # a new engine each run, so every run starts from the same
+                # concurrency limit and a closed circuit
+                engine = FetchEngine(max_workers = 32, requests_per_second = None,
+                                     retries = 8, backoff = 0.05, max_backoff = 1.0,
+                                     client = client)
+                failures[:] = [url for url, content in engine.fetch_all(urls)
+                               if content is None]
+
+            result = measure(run, len(urls), repeat)
+    finally:
+        client.close()
+
+    result["failures"] = len(failures)
+    result["responses"] = {str(k): v for k, v in sorted(injector.requests.items(),
+                                                         key = lambda item: str(item[0]))}
+    return result
+
+
+def bench_make_dataframe(corpus: dict, parser: str = None, repeat: int = 3,
+                         scale: int = 300) -> dict:
+    from sephora import Sephora, make_dataframe
+
+    records = [record for record in _parse_corpus(corpus, Sephora(parser = parser)).values()
+               if record is not None] * scale
+
+    def run():
+        with _scratch_directory():
+            make_dataframe(records, "ingredients")
+            make_dataframe(records, "products")
+
+    return measure(run, len(records), repeat)
+
+
+def bench_make_ingredient_table(corpus: dict, parser: str = None, repeat: int = 3) -> dict:
+    from scrape_ingredient_database import make_ingredient_table
+    import parsers
+
+    soup = parsers.make_soup(corpus["inci"], parser)
+    n_rows = len(soup.find("tbody").find_all("tr")) - 1 # minus the header row
+
+    def run():
+        with _scratch_directory():
+            make_ingredient_table(soup)
+
+    return measure(run, n_rows, repeat)
+
+
+BENCHMARKS = {
+    "find_ingredients": bench_find_ingredients,
+    "format_ingredients": bench_format_ingredients,
+    "get_product_info": bench_get_product_info,
+    "embedded_product_info": bench_embedded_product_info,
+    "fetch_under_faults": bench_fetch_under_faults,
+    "make_dataframe": bench_make_dataframe,
+    "make_ingredient_table": bench_make_ingredient_table
+}
+
+
+
+# ---------------------------------- < ORACLE > ------------------------------- #
+def embed_product_data(content: bytes) -> bytes:
+    """
+    Description
+    -----------
+    Add to a saved product page the JSON that live product pages embed:
+    a JSON-LD Product in the head, and the page state (as the site's own
+    javascript reads it) at the end of the body, holding the same details
+    as the html, including the ingredients section's html
+
+    Parameters
+    ----------
+    content: bytes
+        raw html of a product page
+
+    Returns
+    -------
+    bytes
+    """
+
+    import parsers
+
+    fields = parsers.extract_product_fields(content, "html.parser")
+    details = fields["details"]
+
+    json_ld = {"@context": "https://schema.org", "@type": "Product",
+               "name": fields["name"],
+               "brand": {"@type": "Brand", "name": fields["brand"]},
+               "offers": {"@type": "Offer", "priceCurrency": "USD",
+                          "price": (fields["price"] or "").lstrip("$")}}
+    state = {"page": {"product": {
+        "parentCategory": {"displayName": fields["product_type"]},
+        "productDetails": {
+            "displayName": fields["name"],
+            "brand": {"displayName": fields["brand"]},
+            "longDescription": details[0].get_text() if details else None
+        },
+        "currentSku": {
+            "listPrice": fields["price"],
+            "ingredientDesc": details[2].decode_contents() if len(details) > 2 else None
+        }
+    }}}
+
+    def script(data, attributes):
+        # "</" would end the script tag early
+        blob = json.dumps(data).replace("</", "<\\/")
+        return f'<script {attributes}>{blob}</script>'.encode("utf-8")
+
+    content = content.replace(
+        b"</head>", script(json_ld, 'type="application/ld+json"') + b"</head>", 1)
+    return content.replace(
+        b"</body>", script(state, 'id="linkStore" type="text/json"') + b"</body>", 1)
+
+
+def embedded_corpus(corpus: dict) -> dict:
+    """
+    Returns
+    -------
+    a copy of corpus with embed_product_data applied to every product page
+    """
+
+    return dict(corpus, products = [(name, embed_product_data(content))
+                                    for name, content in corpus["products"]])
+
+
+def _parse_corpus(corpus: dict, sephora) -> dict:
+    # file name -> record, with the link made relative so it doesn't
+    # depend on where the pages were served from
+    records = {}
+    for name, content in corpus["products"]:
+        record = sephora.parse_product_page(name, content)
+        if record is not None:
+            record = dict(record, link = name)
+        records[name] = record
+    return records
+
+
+def extraction_results(corpus: dict, parser: str = None) -> dict:
+    """
+    Description
+    -----------
+    Everything the oracle checks: the product links found on the
+    subcategory page, and the record parsed from each product page
+
+    Parameters
+    ----------
+    corpus: dict
+        returned by load_corpus
+    parser: str
+        html parser backend, one of parsers.BACKENDS
+
+    Returns
+    -------
+    dict with "product_links" and "products" (file name -> record)
+    """
+
+    from sephora import Sephora
+
+    return {
+        "product_links": sorted(corpus["product_links"]),
+        "products": json.loads(json.dumps(_parse_corpus(corpus, Sephora(parser = parser))))
+    }
+
+
+def check_corpus(corpus: dict, backends: list = None) -> dict:
+    """
+    Description
+    -----------
+    Compare what each parser backend extracts from the corpus with the
+    expected results saved in corpus/expected.json
+
+    Parameters
+    ----------
+    corpus: dict
+        returned by load_corpus
+    backends: list of str
+        defaults to every available backend
+
+    Returns
+    -------
+    mismatches: dict
+        backend -> list of product file names (or "product_links")
+        whose result differs from the expected one, and "embedded" ->
+        those whose result differs when the page embeds its data as JSON
+    """
+
+    import parsers
+
+    assert corpus["expected"] is not None, (
+        f"no {EXPECTED_FILE} in the corpus, run with --update-expected first")
+
+    expected = corpus["expected"]
+    mismatches = {}
+    for backend in backends or parsers.available_backends():
+        results = extraction_results(corpus, backend)
+        wrong = [name for name in sorted(set(expected["products"]) | set(results["products"]))
+                 if results["products"].get(name) != expected["products"].get(name)]
+        if results["product_links"] != expected["product_links"]:
+            wrong.insert(0, "product_links")
+        mismatches[backend] = wrong
+
+    # pages with embedded JSON must give the same records as the html alone
+    results = extraction_results(embedded_corpus(corpus))
+    mismatches["embedded"] = [name for name in sorted(expected["products"])
+                              if results["products"].get(name) != expected["products"][name]]
+    return mismatches
+
+
+def update_expected(corpus_dir: str = CORPUS_DIR):
+    """
+    Description
+    -----------
+    Save the current extraction results (using html.parser) as the expected
+    ones; run this only after checking that a change in results is intended
+    """
+
+    results = extraction_results(load_corpus(corpus_dir), "html.parser")
+    with open(os.path.join(corpus_dir, EXPECTED_FILE), "w") as f:
+        json.dump(results, f, indent = 2, sort_keys = True)
+        f.write("\n")
+
+
+
+# ------------------------------ < STARTUP TIME > ----------------------------- #
+def startup_time(argv: list, cwd: str = None, repeat: int = 3) -> dict:
+    """
+    Description
+    -----------
+    Time a cold invocation of cli.py, in a new interpreter each time
+
+    Parameters
+    ----------
+    argv: list of str
+        arguments to cli.py, e.g. ["screen", "strings.txt"]
+    cwd: str
+        working directory of the command
+    repeat: int
+        the fastest of this many runs is kept
+
+    Returns
+    -------
+    dict with "seconds" (wall time), "import_seconds", and "modules" (the
+    top-level packages imported)
+    """
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", script, *argv],
+                                cwd = cwd, capture_output = True, text = True)
+        seconds = time.perf_counter() - start
+
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines()
+                      if not line.startswith("import time:")]
+            raise RuntimeError(f"cli.py {' '.join(argv)} failed:\n" + "\n".join(errors))
+
+        if best is None or seconds < best[0]:
+            best = (seconds, result.stderr)
+
+    seconds, stderr = best
+    modules = set()
+    import_microseconds = 0
+
+    # lines look like "import time:  self [us] | cumulative | <indent>package"
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip().split(".")[0])
+        if not name[1:].startswith(" "): # imported directly, not by another module
+            import_microseconds += int(cumulative)
+
+    return {"seconds": seconds, "import_seconds": import_microseconds / 1e6,
+            "modules": sorted(modules)}
+
+
+def check_startup(budget: float = STARTUP_BUDGET, repeat: int = 3) -> tuple:
+    """
+    Description
+    -----------
+    Check that the screening path stays fast to start: a cold
+    `cli.py screen` must finish within budget seconds and import none of
+    CRAWL_MODULES, and `cli.py --help` and `cli.py screen --help` must not
+    import pandas either
+
+    Parameters
+    ----------
+    budget: float
+    repeat: int
+
+    Returns
+    -------
+    (results, problems): startup_time results for "screen", "help" and
+    "screen_help", and
+    a list of problems (empty if the check passed)
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        comedogenic_path = os.path.join(directory, COMEDOGENIC_PATH)
+        os.makedirs(os.path.dirname(comedogenic_path), exist_ok = True)
+        with open(comedogenic_path, "w") as f:
+            f.write("ingredient,rating\nisopropyl myristate,5\ncoconut oil,4\n")
+        with open(os.path.join(directory, "strings.txt"), "w") as f:
+            f.write("Water, Isopropyl Myristate, Glycerin\nAqua, Coconut Oil\n")
+
+        results = {
+            "screen": startup_time(["screen", "strings.txt", "--output", "scores.csv"],
+                                   directory, repeat),
+            "help": startup_time(["--help"], directory, repeat),
+            "screen_help": startup_time(["screen", "--help"], directory, repeat)
+        }
+
+    problems = []
+    if results["screen"]["seconds"] > budget:
+        problems.append(f"cold screen took {results['screen']['seconds']:.2f}s "
+                        f"(budget {budget:.2f}s)")
+
+    light = CRAWL_MODULES + ["pandas", "numpy", "scipy"]
+    for command, forbidden in [("screen", CRAWL_MODULES), ("help", light),
+                               ("screen_help", light)]:
+        imported = [m for m in forbidden if m in results[command]["modules"]]
+        if imported:
+            problems.append(f"{command} imported {', '.join(imported)}")
+
+    return results, problems
+
+
+
+# --------------------------------- < RESULTS > ------------------------------- #
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd = os.path.dirname(os.path.abspath(__file__)),
+                              capture_output = True, text = True,
+                              check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(corpus_dir: str = CORPUS_DIR, stages: list = None,
+                   parser: str = None, repeat: int = 3) -> dict:
+    """
+    Description
+    -----------
+    Run the benchmarks on the frozen corpus
+
+    Parameters
+    ----------
+    corpus_dir: str
+    stages: list of str
+        any of STAGES (defaults to all of them)
+    parser: str
+        html parser backend (None for parsers.default_backend())
+    repeat: int
+        the best of this many runs is reported
+
+    Returns
+    -------
+    dict with the commit, environment, and a result for each stage
+    (see measure), which can be saved and compared with compare_results
+    """
+
+    import parsers
+
+    corpus = load_corpus(corpus_dir)
+    parser = parser or parsers.default_backend()
+
+    results = {}
+    for stage in stages or STAGES:
+        results[stage] = BENCHMARKS[stage](corpus, parser = parser, repeat = repeat)
+
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "parser": parser,
+        "results": results
+    }
+
+
+def compare_results(before: dict, after: dict) -> dict:
+    """
+    Description
+    -----------
+    Compare two saved benchmark runs, e.g. from two commits
+
+    Parameters
+    ----------
+    before: dict
+    after: dict
+        both returned by run_benchmarks
+
+    Returns
+    -------
+    dict: stage -> {"speedup": after / before items_per_sec,
+                    "memory_ratio": after / before peak memory}
+    """
+
+    changes = {}
+    for stage, new in after["results"].items():
+        old = before["results"].get(stage)
+        if old is None:
+            continue
+        changes[stage] = {
+            "speedup": new["items_per_sec"] / old["items_per_sec"],
+            "memory_ratio": (new["peak_memory_bytes"] / old["peak_memory_bytes"]
+                             if old["peak_memory_bytes"] else float("inf"))
+        }
+    return changes
+
+
+def main(argv: list = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Benchmarks on the frozen corpus")
+    parser.add_argument("--corpus", default = CORPUS_DIR)
+    parser.add_argument("--stage", action = "append", choices = STAGES,
+                        help = "run only this stage (can be repeated)")
+    parser.add_argument("--parser", default = None)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--output", help = "save the results to this .json file")
+    parser.add_argument("--compare", help = "compare with results saved by --output")
+    parser.add_argument("--check", action = "store_true",
+                        help = "only check extraction results against the oracle")
+    parser.add_argument("--update-expected", action = "store_true",
+                        help = "save the current extraction results as the oracle")
+    parser.add_argument("--startup", action = "store_true",
+                        help = "only check the cold start time of the screening path")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO) # the scraper logs every product
+
+    if args.startup:
+        results, problems = check_startup(repeat = args.repeat)
+        for command, result in results.items():
+            print(f"{command:11s} {result['seconds']:6.3f}s "
+                  f"({result['import_seconds']:.3f}s importing)")
+        for problem in problems:
+            print(problem)
+        raise SystemExit(1 if problems else 0)
+
+    if args.update_expected:
+        update_expected(args.corpus)
+        print(f"saved {os.path.join(args.corpus, EXPECTED_FILE)}")
+        raise SystemExit(0)
+
+    mismatches = check_corpus(load_corpus(args.corpus))
+    for backend, names in mismatches.items():
+        status = "ok" if not names else f"{len(names)} mismatches: {names}"
+        print(f"{backend:12s} {status}")
+    if args.check:
+        raise SystemExit(1 if any(mismatches.values()) else 0)
+
+    run = run_benchmarks(args.corpus, args.stage, args.parser, args.repeat)
+    print(f"\ncommit {run['commit']}, python {run['python']}, parser {run['parser']}")
+    for stage, result in run["results"].items():
+        print(f"{stage:22s} {result['items_per_sec']:12.1f} items/sec "
+              f"{result['peak_memory_bytes'] / 1024 ** 2:9.1f} MB peak")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent = 2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print(f"\ncompared with commit {before['commit']}")
+        for stage, change in compare_results(before, run).items():
+            print(f"{stage:22s} {change['speedup']:6.2f}x speed "
+                  f"{change['memory_ratio']:6.2f}x memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium import webdriver
+import threading
+import logging
+import queue
+import time
+
+
+# records the time of the latest change to the page, and counts the requests
+# the page's scripts still have in flight (performance entries only list
+# finished requests), so we can wait for the page to go quiet instead of
+# sleeping for a fixed time
+INSTALL_MUTATION_OBSERVER = """
+    if (window.__lastMutation === undefined) {
+        window.__lastMutation = Date.now();
+        new MutationObserver(function () { window.__lastMutation = Date.now(); })
+            .observe(document.documentElement, {childList: true, subtree: true});
+
+        window.__pending = 0;
+        function done() { window.__pending = Math.max(0, window.__pending - 1); }
+
+        if (window.fetch) {
+            var fetch = window.fetch;
+            window.fetch = function () {
+                window.__pending += 1;
+                return fetch.apply(this, arguments).then(
+                    function (response) { done(); return response; },
+                    function (error) { done(); throw error; });
+            };
+        }
+
+        var send = XMLHttpRequest.prototype.send;
+        XMLHttpRequest.prototype.send = function () {
+            window.__pending += 1;
+            this.addEventListener("loadend", done);
+            return send.apply(this, arguments);
+        };
+    }"""
+
+# milliseconds since the page last changed (or was scrolled), and requests
+# still loading
+PAGE_ACTIVITY = """
+    return [Date.now() - window.__lastMutation, window.__pending || 0];"""
+
+# a scroll counts as a change, so the page is only quiet once `quiet` seconds
+# have passed without the next batch loading
+SCROLL_TO_BOTTOM = """
+    window.__lastMutation = Date.now();
+    window.scrollTo(0, document.body.scrollHeight);
+    return document.body.scrollHeight;"""
+
+
+
+class BrowserPool:
+    """
+    A class used to reuse a few headless Chrome sessions across
+    subcategory pages, instead of starting (and re-installing the driver
+    for) a new browser every time.
+
+    Attributes
+    ----------
+    size: int
+        maximum number of browser sessions
+    headless: bool
+    """
+
+    def __init__(self, size: int = 2, headless: bool = True):
+        assert size >= 1, "size must be at least 1"
+
+        self.size = size
+        self.headless = headless
+
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._driver_path = None
+
+
+    def _new_browser(self):
+        # install the driver once per pool, not once per browser
+        if self._driver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+            self._driver_path = ChromeDriverManager().install()
+
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument("--headless=new")
+        options.add_argument("--window-size=1400,1000")
+
+        return webdriver.Chrome(service = Service(self._driver_path),
+                                options = options)
+
+
+    def acquire(self):
+        """
+        Description
+        -----------
+        Take a browser from the pool, starting a new one if the pool
+        isn't full yet, or waiting for one to be released if it is
+
+        Returns
+        -------
+        selenium webdriver
+        """
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.size:
+                browser = self._new_browser()
+                self._all.append(browser)
+                return browser
+
+        return self._idle.get()
+
+
+    def release(self, browser, broken: bool = False):
+        """
+        Description
+        -----------
+        Return a browser to the pool
+
+        Parameters
+        ----------
+        browser: selenium webdriver
+        broken: bool
+            if true, the browser is shut down instead of being reused
+        """
+
+        if broken:
+            with self._lock:
+                if browser in self._all: # close() may have emptied the pool
+                    self._all.remove(browser)
+            try:
+                browser.quit()
+            except WebDriverException:
+                pass
+            return
+
+        self._idle.put(browser)
+
+
+    def session(self):
+        """
+        Description
+        -----------
+        Context manager that acquires a browser and releases it afterwards
+        (shutting it down if an error occurred while it was in use)
+
+        Returns
+        -------
+        context manager yielding a selenium webdriver
+        """
+
+        pool = self
+
+        class _Session:
+            def __enter__(self):
+                self.browser = pool.acquire()
+                return self.browser
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                pool.release(self.browser, broken = exc_type is not None)
+
+        return _Session()
+
+
+    def close(self):
+        with self._lock:
+            browsers, self._all = self._all, []
+        for browser in browsers:
+            try:
+                browser.quit()
+            except WebDriverException:
+                pass
+
+
+
+# ------------------------------- < HELPERS > -------------------------------- #
+def wait_until_quiet(browser, quiet: float = 1.0, timeout: float = 15.0):
+    """
+    Description
+    -----------
+    Wait until the page has stopped changing for `quiet` seconds
+    and no requests are still loading
+
+    Parameters
+    ----------
+    browser: selenium webdriver
+    quiet: float
+        seconds without any DOM changes
+    timeout: float
+        give up waiting after this many seconds
+    """
+
+    browser.execute_script(INSTALL_MUTATION_OBSERVER)
+
+    def is_quiet(b):
+        since_change, pending = b.execute_script(PAGE_ACTIVITY)
+        return since_change >= quiet * 1000 and pending == 0
+
+    try:
+        WebDriverWait(browser, timeout, poll_frequency = 0.1).until(is_quiet)
+    except TimeoutException:
+        logging.info(f"page still changing after {timeout} seconds")
+
+
+def scroll_to_end(browser, quiet: float = 1.0, timeout: float = 15.0) -> int:
+    """
+    Description
+    -----------
+    Scroll an infinite-scroll page until no more content loads
+
+    After each scroll, move on as soon as the page grows; stop once the
+    page has gone quiet without growing
+
+    Parameters
+    ----------
+    browser: selenium webdriver
+    quiet: float
+        seconds without DOM changes before the page is considered done
+    timeout: float
+        longest wait for new content after a single scroll
+
+    Returns
+    -------
+    number of scrolls made
+    """
+
+    browser.execute_script(INSTALL_MUTATION_OBSERVER)
+    height = browser.execute_script(SCROLL_TO_BOTTOM)
+    scrolls = 1
+
+    while True:
+        start = time.monotonic()
+        grew = False
+
+        while time.monotonic() - start < timeout:
+            new_height = browser.execute_script("return document.body.scrollHeight;")
+            if new_height > height:
+                grew = True
+                break
+
+            since_change, pending = browser.execute_script(PAGE_ACTIVITY)
+            if since_change >= quiet * 1000 and pending == 0:
+                break
+            time.sleep(0.1)
+
+        if not grew:
+            return scrolls
+
+        height = browser.execute_script(SCROLL_TO_BOTTOM)
+        scrolls += 1
+
+
+def dismiss(browser, class_name: str):
+    """
+    Description
+    -----------
+    Click a pop-up's close button if it's on the page
+    (e.g. the "Sign up for Sephora" box)
+
+    Parameters
+    ----------
+    browser: selenium webdriver
+    class_name: str
+    """
+
+    for element in browser.find_elements(By.CLASS_NAME, class_name):
+        try:
+            element.click()
+        except WebDriverException:
+            pass
+
+
+def next_page(browser, class_name: str, marker_class: str,
+              timeout: float = 15.0) -> bool:
+    """
+    Description
+    -----------
+    Click the "next page" control and wait for the next page's
+    products to replace the current ones
+
+    Parameters
+    ----------
+    browser: selenium webdriver
+    class_name: str
+        class of the "next page" button
+    marker_class: str
+        class of an element that is replaced when the page changes
+        (e.g. the product links)
+    timeout: float
+
+    Returns
+    -------
+    True if another page was loaded, False if there is no next page
+    """
+
+    buttons = [b for b in browser.find_elements(By.CLASS_NAME, class_name)
+               if b.is_displayed() and b.is_enabled()
+               and b.get_attribute("aria-disabled") != "true"]
+    if not buttons:
+        return False
+
+    markers = browser.find_elements(By.CLASS_NAME, marker_class)
+    buttons[-1].click()
+
+    try:
+        if markers:
+            WebDriverWait(browser, timeout).until(
+                expected_conditions.staleness_of(markers[0]))
+        WebDriverWait(browser, timeout).until(
+            expected_conditions.presence_of_element_located(
+                (By.CLASS_NAME, marker_class)))
+    except TimeoutException:
+        logging.info("next page did not load")
+        return False
+
+    return True
+
+
+def collect_pages(browser, url: str, link_class: str, next_page_class: str = None,
+                  dismiss_class: str = None, max_pages: int = 50,
+                  quiet: float = 1.0) -> list:
+    """
+    Description
+    -----------
+    Load a listing page, scroll each page of results to the end,
+    and follow the "next page" control
+
+    Parameters
+    ----------
+    browser: selenium webdriver
+    url: str
+    link_class: str
+        class of the product links (used to detect page changes)
+    next_page_class: str
+        class of the "next page" button (None to stay on the first page)
+    dismiss_class: str
+        class of a pop-up close button to click first
+    max_pages: int
+    quiet: float
+        seconds without DOM changes before a page is considered loaded
+
+    Returns
+    -------
+    page_sources: list of str, one for each page of results
+    """
+
+    browser.get(url)
+    wait_until_quiet(browser, quiet = quiet)
+
+    if dismiss_class:
+        dismiss(browser, dismiss_class)
+
+    page_sources = []
+    while len(page_sources) < max_pages:
+        scroll_to_end(browser, quiet = quiet)
+        page_sources.append(browser.page_source)
+
+        if not next_page_class or not next_page(browser, next_page_class, link_class):
+            break
+
+    return page_sources
@@ -0,0 +1,356 @@
+from sephora_setup import INCI_PATH, INGREDIENT_SYNONYMS
+from ingredients import normalize_name
+import pandas as pd
+import numpy as np
+import re
+
+
+def name_variants(name: str) -> list:
+    """
+    Description
+    -----------
+    List the ways a raw ingredient name might be written in the dictionary,
+    most specific first
+    e.g. "water / aqua / eau" -> ["water / aqua / eau", "water", "aqua", "eau"]
+         "aqua (water)" -> ["aqua (water)", "aqua", "water"]
+
+    Parameters
+    ----------
+    name: str
+
+    Returns
+    -------
+    variants: list of str
+    """
+
+    name = normalize_name(name)
+    variants = [name]
+
+    # text outside and inside parentheses
+    outside = normalize_name(re.sub(r"\(.*?\)", " ", name))
+    inside = re.findall(r"\((.*?)\)", name)
+
+    # alternatives separated by spaced slashes (unspaced slashes are part
+    # of a single name, e.g. "caprylic/capric triglyceride")
+    for part in [outside] + inside:
+        variants.append(part)
+        variants += [normalize_name(p) for p in part.split(" / ")]
+
+    # keep the first occurrence of each variant
+    return [v for i, v in enumerate(variants) if v and v not in variants[:i]]
+
+
+
+class IngredientDictionary:
+    """
+    A class used to map raw ingredient names to integer ingredient IDs.
+
+    Every spelling of the same ingredient ("aqua (water)", "water / aqua /
+    eau", "water", ...) resolves to one ID, and each distinct name is only
+    stored once. Names that are not in the dictionary are given new IDs
+    the first time they are seen.
+
+    Attributes
+    ----------
+    names: list of str
+        canonical name for each ID (the ID is the position in the list)
+    frozen: bool
+        if true, nothing more is added: intern() only looks names up
+        (see freeze)
+    """
+
+    def __init__(self, canonical_names = (), synonyms: dict = None):
+        """
+        Parameters
+        ----------
+        canonical_names: iterable of str
+            known ingredient names, e.g. the EU INCI names
+        synonyms: dict
+            alternative name -> canonical name
+        """
+
+        self.names = []
+        self.frozen = False
+        self._ids = {}  # canonical name -> ID
+        self._lookup = {} # any known spelling -> ID
+
+        for name in canonical_names:
+            self._add(normalize_name(name))
+
+        for synonym, canonical in (synonyms or {}).items():
+            self._lookup[normalize_name(synonym)] = self._add(normalize_name(canonical))
+
+
+    @classmethod
+    def from_inci(cls, path: str = INCI_PATH,
+                  synonyms: dict = INGREDIENT_SYNONYMS) -> "IngredientDictionary":
+        """
+        Description
+        -----------
+        Seed the dictionary with the names in inci_descriptions.csv
+        (written by scrape_ingredient_database.py)
+
+        Parameters
+        ----------
+        path: str
+        synonyms: dict
+            alternative name -> canonical name
+
+        Returns
+        -------
+        IngredientDictionary
+        """
+
+        inci_names = pd.read_csv(path, usecols = ["name"])["name"].dropna()
+        return cls(inci_names.unique(), synonyms)
+
+
+    def _add(self, canonical: str) -> int:
+        assert not self.frozen, "can't add names to a frozen dictionary"
+        if canonical not in self._ids:
+            self._ids[canonical] = len(self.names)
+            self._lookup[canonical] = len(self.names)
+            self.names.append(canonical)
+        return self._ids[canonical]
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def freeze(self) -> "IngredientDictionary":
+        """
+        Description
+        -----------
+        Stop the dictionary from growing, e.g. once a long-running service
+        has loaded its reference data: IDs then never change, and readers on
+        other threads need no locking
+
+        Returns
+        -------
+        self
+        """
+
+        self.frozen = True
+        return self
+
+
+    def find(self, name: str) -> int:
+        """
+        Description
+        -----------
+        Look up the ID of a raw ingredient name without adding it
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        ID: int, or None if no variant of the name is known
+        """
+
+        if name is None:
+            return None
+
+        for variant in name_variants(name):
+            if variant in self._lookup:
+                return self._lookup[variant]
+        return None
+
+
+    def id_of(self, name: str) -> int:
+        """
+        Description
+        -----------
+        find(), for tables: the ID of a raw ingredient name, never adding it
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        ID: int, or -1 for a missing or unknown name
+        """
+
+        if name is None or (isinstance(name, float) and np.isnan(name)):
+            return -1
+
+        ingredient_id = self.find(name)
+        return -1 if ingredient_id is None else ingredient_id
+
+
+    def intern(self, name: str) -> int:
+        """
+        Description
+        -----------
+        Return the ID of a raw ingredient name, adding it as a new
+        ingredient if no variant of it is known; the raw spelling is
+        remembered, so it resolves straight away next time
+        (a frozen dictionary only looks the name up, see id_of)
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        ID: int, or -1 for a missing name (or an unknown one, if frozen)
+        """
+
+        if self.frozen:
+            return self.id_of(name)
+
+        if name is None or (isinstance(name, float) and np.isnan(name)):
+            return -1
+
+        key = normalize_name(name)
+        if key in self._lookup:
+            return self._lookup[key]
+
+        ingredient_id = self.find(key)
+        if ingredient_id is None:
+            ingredient_id = self._add(key)
+
+        self._lookup[key] = ingredient_id
+        return ingredient_id
+
+
+    def canonical(self, name: str) -> str:
+        """
+        Returns
+        -------
+        the canonical name for a raw ingredient name
+        """
+
+        ingredient_id = self.intern(name)
+        return None if ingredient_id < 0 else self.names[ingredient_id]
+
+
+    def encode(self, ingredient_table: pd.DataFrame, column: str = "ingredient",
+               add_new: bool = True) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Convert a long format ingredients table to compact integer codes:
+        the ingredient column is replaced by "ingredient_id" (int32, -1 for
+        missing), product names become categoricals, and rank becomes int16
+
+        Parameters
+        ----------
+        ingredient_table: DataFrame
+            as written by make_dataframe / ProductWriter
+        column: str
+            name of the column holding the raw ingredient names
+        add_new: bool
+            if false, the dictionary is only read: names it doesn't know
+            get ID -1 instead of being added (see id_of)
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        # look up each distinct raw name once, then map back onto every row
+        raw = ingredient_table[column].astype("category")
+        to_id = self.intern if add_new else self.id_of
+        category_ids = np.array([to_id(name) for name in raw.cat.categories],
+                                dtype = np.int32)
+
+        codes = raw.cat.codes.to_numpy()
+        ids = np.where(codes >= 0, category_ids[codes], -1).astype(np.int32)
+
+        # (replacing the IDs of a table written by ProductWriter)
+        df = ingredient_table.drop(columns = [column, "ingredient_id"], errors = "ignore")
+        df.insert(df.columns.get_loc("rank") if "rank" in df.columns else len(df.columns),
+                  "ingredient_id", ids)
+
+        if "name" in df.columns:
+            df["name"] = df["name"].astype("category")
+        if "rank" in df.columns:
+            df["rank"] = df["rank"].astype(np.int16)
+
+        return df
+
+
+    def decode(self, encoded_table: pd.DataFrame) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Add the canonical "ingredient" name back to an encoded table
+        (as a categorical, so each name is still only stored once)
+
+        Parameters
+        ----------
+        encoded_table: DataFrame
+            as returned by encode()
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        df = encoded_table.copy()
+        df["ingredient"] = pd.Categorical.from_codes(
+            df["ingredient_id"].to_numpy(), categories = self.names)
+        return df
+
+
+    def to_csv(self, path: str):
+        """
+        Description
+        -----------
+        Save the synonym table: every known spelling, with its ID
+        and canonical name
+
+        Parameters
+        ----------
+        path: str
+        """
+
+        rows = sorted(self._lookup.items(), key = lambda item: (item[1], item[0]))
+        pd.DataFrame(
+            [(i, spelling, self.names[i]) for spelling, i in rows],
+            columns = ["ingredient_id", "spelling", "canonical"]
+        ).to_csv(path, index = False)
+
+
+    @classmethod
+    def from_csv(cls, path: str) -> "IngredientDictionary":
+        """
+        Description
+        -----------
+        Load a synonym table saved by to_csv(), keeping the same IDs
+
+        Parameters
+        ----------
+        path: str
+
+        Returns
+        -------
+        IngredientDictionary
+        """
+
+        df = pd.read_csv(path, keep_default_na = False)
+        dictionary = cls()
+
+        canonical = df.drop_duplicates("ingredient_id").sort_values("ingredient_id")
+        assert (canonical["ingredient_id"].to_numpy() == np.arange(len(canonical))).all(), (
+            f"{path} has gaps in its ingredient IDs")
+
+        for name in canonical["canonical"]:
+            dictionary._add(name)
+        dictionary._lookup.update(zip(df["spelling"], df["ingredient_id"].astype(int)))
+        return dictionary
+
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """
+    Returns
+    -------
+    bytes used by a DataFrame, including the strings it holds
+    """
+
+    return int(df.memory_usage(index = True, deep = True).sum())
@@ -0,0 +1,128 @@
+import threading
+import sqlite3
+import json
+import time
+
+
+class CheckpointStore:
+    """
+    A class used to save each product as soon as it has been processed,
+    so that an interrupted crawl can pick up where it left off.
+
+    Attributes
+    ----------
+    path: str
+        location of the SQLite database file
+    """
+
+    def __init__(self, path: str = "checkpoint.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                link TEXT PRIMARY KEY,
+                record TEXT,
+                completed_at REAL NOT NULL
+            )""")
+        self._db.commit()
+
+
+    def save(self, link: str, record: dict):
+        """
+        Description
+        -----------
+        Record that a product link has been processed
+
+        Parameters
+        ----------
+        link: str
+            full url of the product page
+        record: dict
+            parsed product info, or None if the product was skipped
+            (e.g. a kit/set), so it isn't fetched again
+        """
+
+        # ingredients may be a set, so store any set as a list
+        data = None if record is None else json.dumps(record, default = list)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?)",
+                (link, data, time.time()))
+            self._db.commit()
+
+
+    def completed_links(self, max_age: float = None) -> set:
+        """
+        Description
+        -----------
+        Find the product links that don't need to be fetched again
+
+        Parameters
+        ----------
+        max_age: float
+            if given, links completed more than max_age seconds ago are
+            treated as stale and left out (incremental mode)
+
+        Returns
+        -------
+        links: set of str
+        """
+
+        query = "SELECT link FROM products"
+        params = ()
+        if max_age is not None:
+            query += " WHERE completed_at >= ?"
+            params = (time.time() - max_age,)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        return set(link for (link,) in rows)
+
+
+    def records(self, links: list = None, chunk_size: int = 500):
+        """
+        Description
+        -----------
+        Load saved product records
+
+        Parameters
+        ----------
+        links: list of str
+            if given, return records for these links in this order
+            (links that are missing or were skipped are left out);
+            otherwise return every saved record, ordered by link
+        chunk_size: int
+            number of records read from the database at once
+
+        Returns
+        -------
+        generator of dict
+        """
+
+        if links is None:
+            with self._lock:
+                links = [link for (link,) in self._db.execute(
+                    "SELECT link FROM products ORDER BY link").fetchall()]
+
+        # load in chunks, so only a chunk of records is in memory at a time
+        for start in range(0, len(links), chunk_size):
+            chunk = links[start:start + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+
+            with self._lock:
+                saved = dict(self._db.execute(
+                    f"SELECT link, record FROM products WHERE link IN ({placeholders})",
+                    chunk).fetchall())
+
+            for link in chunk:
+                data = saved.get(link)
+                if data is not None:
+                    yield json.loads(data)
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,124 @@
+from sephora_setup import CHECKPOINT_PATH, OUTPUT_DIR, OUTPUT_FORMATS, PARSER_BACKEND
+import importlib
+import argparse
+import sys
+
+# every subcommand imports its modules only when it runs, so e.g. `screen`
+# never loads selenium, requests or bs4, and `--help` (or `screen --help`)
+# loads nothing heavy
+
+
+# subcommands that hand the rest of the command line to a module's main()
+DELEGATED = {
+    "serve": ("service", "run the screening service"),
+    "bench": ("benchmarks", "benchmark the scraper on the frozen corpus")
+}
+
+
+
+def crawl(args):
+    from sephora import get_sephora_products
+
+    get_sephora_products(use_cache = not args.no_cache,
+                         checkpoint_path = args.checkpoint or None,
+                         max_age = args.max_age)
+
+
+def parse_saved(args):
+    from sephora import parse_saved_pages
+
+    n_products = parse_saved_pages(args.directory, args.output_dir,
+                                   tuple(args.format or OUTPUT_FORMATS),
+                                   args.parser, args.workers)
+    print(f"parsed {n_products} products -> {args.output_dir}")
+
+
+def screen(args):
+    from screening import Screener
+
+    n_products = 0
+    for scores in Screener().screen_file(args.path, args.column, args.chunk_size,
+                                         args.output):
+        n_products += len(scores)
+    print(f"screened {n_products} products -> {args.output}")
+
+
+def build_inci(args):
+    from scrape_ingredient_database import build_inci
+    from sephora_setup import INCI_PATH, INCI_CATEGORIES_PATH
+
+    build_inci()
+    print(f"saved {INCI_PATH} and {INCI_CATEGORIES_PATH}")
+
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog = "comedogenic",
+        description = "Scrape Sephora ingredient lists and screen them for "
+                      "comedogenic ingredients")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    command = commands.add_parser("crawl", help = "crawl sephora.com")
+    command.add_argument("--no-cache", action = "store_true",
+                         help = "don't use the on-disk page cache")
+    command.add_argument("--checkpoint", default = CHECKPOINT_PATH,
+                         help = "checkpoint file ('' for none)")
+    command.add_argument("--max-age", type = float,
+                         help = "re-fetch checkpointed products older than this (seconds)")
+    command.set_defaults(run = crawl)
+
+    command = commands.add_parser("parse-saved", help = "parse saved product pages")
+    command.add_argument("directory", help = "searched recursively for .html files")
+    command.add_argument("--output-dir", default = OUTPUT_DIR)
+    command.add_argument("--format", action = "append",
+                         choices = ["csv", "parquet", "dataset"],
+                         help = "output format (can be repeated)")
+    command.add_argument("--parser", default = PARSER_BACKEND)
+    command.add_argument("--workers", type = int, default = None,
+                         help = "parsing processes (0 to parse on this thread)")
+    command.set_defaults(run = parse_saved)
+
+    command = commands.add_parser("screen", help = "screen a file of raw ingredient strings")
+    command.add_argument("path", help = ".csv, or text file with one string per line")
+    command.add_argument("--column", help = "column holding the strings in a .csv")
+    command.add_argument("--chunk-size", type = int, default = 10000)
+    command.add_argument("--output", default = "scores.csv")
+    command.set_defaults(run = screen)
+
+    command = commands.add_parser("build-inci", help = "download the EU INCI tables")
+    command.set_defaults(run = build_inci)
+
+    for name, (module, description) in DELEGATED.items():
+        commands.add_parser(name, help = f"{description} (see {name} --help)",
+                            add_help = False)
+
+    return parser
+
+
+def main(argv: list = None):
+    """
+    Description
+    -----------
+    Entry point of the `comedogenic` command
+    e.g. comedogenic screen products.csv --column "raw ingredients"
+
+    Parameters
+    ----------
+    argv: list of str
+        defaults to sys.argv[1:]
+    """
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if argv and argv[0] in DELEGATED:
+        module = importlib.import_module(DELEGATED[argv[0]][0])
+        sys.argv[0] = f"comedogenic {argv[0]}" # shown in the module's --help
+        return module.main(argv[1:])
+
+    args = make_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    main()
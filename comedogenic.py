@@ -0,0 +1,224 @@
+from ingredients import split_ingredients, normalize_name
+from sephora_setup import COMEDOGENIC_PATH
+from fuzzy import FuzzyMatcher
+import pandas as pd
+
+
+class ComedogenicIndex:
+    """
+    A class used to look up comedogenic ingredients.
+
+    The comedogenic list is loaded once into a hash index, so scoring a
+    product costs one lookup per ingredient.
+
+    Attributes
+    ----------
+    ratings: dict
+        normalized ingredient name -> comedogenic rating
+        (None if the source list doesn't give a rating)
+    """
+
+    def __init__(self, ingredients):
+        """
+        Parameters
+        ----------
+        ingredients: dict or iterable
+            ingredient name -> rating, or just ingredient names
+        """
+
+        if not isinstance(ingredients, dict):
+            ingredients = dict.fromkeys(ingredients)
+
+        self.ratings = {normalize_name(name): rating
+                        for name, rating in ingredients.items()}
+        self._fuzzy = None
+
+
+    @classmethod
+    def from_csv(cls, path: str = COMEDOGENIC_PATH) -> "ComedogenicIndex":
+        """
+        Description
+        -----------
+        Build the index from a .csv with an "ingredient" column
+        and an optional "rating" column
+
+        Parameters
+        ----------
+        path: str
+
+        Returns
+        -------
+        ComedogenicIndex
+        """
+
+        df = pd.read_csv(path)
+        assert "ingredient" in df.columns, (
+            f"{path} must have an 'ingredient' column")
+
+        if "rating" in df.columns:
+            ratings = df["rating"].astype(object).where(df["rating"].notna(), None)
+            return cls(dict(zip(df["ingredient"], ratings)))
+
+        return cls(df["ingredient"])
+
+
+    def __contains__(self, name: str) -> bool:
+        return name is not None and normalize_name(name) in self.ratings
+
+    def __len__(self):
+        return len(self.ratings)
+
+
+    def match(self, ingredients: list, fuzzy: bool = False) -> list:
+        """
+        Description
+        -----------
+        Find the comedogenic ingredients in an ordered ingredient list
+
+        Parameters
+        ----------
+        ingredients: list of str
+            formatted ingredients in the order they are listed on the product,
+            e.g. from split_ingredients()
+        fuzzy: bool
+            if true, also match names within a few typos of the list
+            (see fuzzy_matcher)
+
+        Returns
+        -------
+        matches: list of (rank, ingredient, rating) tuples
+            rank = 1 for the first ingredient
+        """
+
+        matches = []
+        for rank, ingredient in enumerate(ingredients, start = 1):
+            if ingredient is None:
+                continue
+
+            key = normalize_name(ingredient)
+            if key not in self.ratings and fuzzy:
+                key, _ = self.fuzzy_matcher().resolve(key)
+
+            if key in self.ratings:
+                matches.append((rank, ingredient, self.ratings[key]))
+
+        return matches
+
+
+    def fuzzy_matcher(self, max_distance: int = 2) -> FuzzyMatcher:
+        """
+        Description
+        -----------
+        Matcher that resolves misspelled names to names on the comedogenic
+        list (built on first use)
+
+        Parameters
+        ----------
+        max_distance: int
+            largest edit distance accepted as a match
+
+        Returns
+        -------
+        FuzzyMatcher
+        """
+
+        if self._fuzzy is None or self._fuzzy.max_distance != max_distance:
+            self._fuzzy = FuzzyMatcher(self.ratings, max_distance = max_distance)
+        return self._fuzzy
+
+
+    def annotate(self, ingredient_table: pd.DataFrame,
+                 column: str = "ingredient") -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Mark the comedogenic rows of a whole ingredients table at once
+        (the long format table written by make_dataframe / ProductWriter)
+
+        Parameters
+        ----------
+        ingredient_table: DataFrame
+            one row per ingredient per product
+        column: str
+            name of the column holding the ingredient names
+
+        Returns
+        -------
+        DataFrame
+            a copy of ingredient_table with "comedogenic" (bool) and
+            "comedogenic_rating" columns added
+        """
+
+        df = ingredient_table.copy()
+
+        # normalize each distinct name once, then map back onto every row
+        names = df[column].astype("category")
+        keys = names.cat.categories.map(normalize_name)
+        is_comedogenic = pd.Series([k in self.ratings for k in keys])
+        ratings = pd.Series([self.ratings.get(k) for k in keys], dtype = object)
+
+        codes = names.cat.codes.to_numpy()
+        known = codes >= 0 # code -1 means a missing ingredient
+
+        df["comedogenic"] = False
+        df.loc[known, "comedogenic"] = is_comedogenic.to_numpy()[codes[known]]
+        df["comedogenic_rating"] = None
+        df.loc[known, "comedogenic_rating"] = ratings.to_numpy()[codes[known]]
+
+        return df
+
+
+
+# ------------------------------- < DEFAULT > -------------------------------- #
+_loaded_indexes = {}
+
+
+def load_index(path: str = COMEDOGENIC_PATH) -> ComedogenicIndex:
+    """
+    Description
+    -----------
+    Return the index built from a comedogenic list .csv,
+    loading it only the first time each path is requested
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    ComedogenicIndex
+    """
+
+    if path not in _loaded_indexes:
+        _loaded_indexes[path] = ComedogenicIndex.from_csv(path)
+    return _loaded_indexes[path]
+
+
+def comedogenic(ingredients: str, index: ComedogenicIndex = None,
+                fuzzy: bool = False) -> pd.DataFrame:
+    """
+    Description
+    -----------
+    Find the comedogenic ingredients in a product's ingredient list,
+    along with their position in the list
+
+    Parameters
+    ----------
+    ingredients: str
+        raw ingredient string, e.g. "Water / Aqua / Eau, Sodium Laureth Sulfate, ..."
+    index: ComedogenicIndex
+        defaults to the index loaded from COMEDOGENIC_PATH
+    fuzzy: bool
+        if true, also match misspelled ingredient names
+
+    Returns
+    -------
+    DataFrame with columns "index" (1 = first ingredient) and "ingredient"
+    """
+
+    if index is None:
+        index = load_index()
+    matches = index.match(split_ingredients(ingredients), fuzzy = fuzzy)
+
+    return pd.DataFrame([(rank, ingredient) for rank, ingredient, _ in matches],
+                        columns = ["index", "ingredient"])
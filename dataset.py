@@ -0,0 +1,323 @@
+from writers import TABLE_COLUMNS
+from urllib.parse import quote
+import datetime
+import shutil
+import uuid
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs
+except ImportError: # the dataset output is optional
+    pa = None
+    ds = None
+
+
+# every table is partitioned by these columns (hive style, e.g.
+# products/crawl_date=2024-05-01/product_type=Moisturizers/part-....parquet)
+PARTITION_COLUMNS = ["crawl_date", "product_type"]
+
+# name of the dataset directory inside the output directory
+DATASET_DIRECTORY = "dataset"
+
+
+def _string():
+    # repeated strings (brands, ingredient names...) are stored once per file
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+def table_schema(table_type: str):
+    """
+    Description
+    -----------
+    Arrow schema of a table in the dataset
+
+    Parameters
+    ----------
+    table_type: str
+        "ingredients", "products", or "inci"
+
+    Returns
+    -------
+    pyarrow.Schema
+    """
+
+    if table_type == "inci":
+        return pa.schema([("name", pa.string()),
+                          ("description", pa.string()),
+                          ("functions", pa.list_(_string()))])
+
+    types = {"ingredient_id": pa.int32(), "rank": pa.int16()}
+    fields = [(c, types.get(c) or _string()) for c in TABLE_COLUMNS[table_type]]
+    # partition values live in the directory names, not in the files
+    fields += [(c, pa.string()) for c in PARTITION_COLUMNS]
+    return pa.schema(fields)
+
+
+def _partitioning(table_type: str):
+    schema = table_schema(table_type)
+    return ds.partitioning(pa.schema([schema.field(c) for c in PARTITION_COLUMNS]),
+                           flavor = "hive")
+
+
+
+class DatasetSink:
+    """
+    A class used to append rows of one table to a Parquet dataset,
+    partitioned by crawl date and product type, in fixed-size batches
+    (the dataset counterpart of writers.TableSink).
+
+    Like the .csv tables, which are rewritten by every crawl, a crawl
+    replaces any rows already filed under its crawl date, so running it
+    twice in one day doesn't duplicate them.
+
+    Attributes
+    ----------
+    table_type: str
+        one of ["ingredients", "products"]
+    path: str
+        directory of this table's dataset
+    crawl_date: str
+        ISO date the rows are filed under
+    batch_size: int
+    rows_written: int
+    """
+
+    def __init__(self, directory: str, table_type: str, crawl_date: str = None,
+                 batch_size: int = 1000):
+
+        assert table_type in TABLE_COLUMNS, (
+            "table_type must be 'ingredients' or 'products'")
+
+        if ds is None:
+            raise ImportError("dataset output requires pyarrow")
+
+        self.table_type = table_type
+        self.path = os.path.join(directory, table_type)
+        self.crawl_date = crawl_date or datetime.date.today().isoformat()
+        self.batch_size = batch_size
+        self.columns = TABLE_COLUMNS[table_type]
+        self.rows_written = 0
+
+        self._schema = table_schema(table_type)
+        self._buffer = []
+        self._product_types = []
+
+        # earlier crawls on the same date are replaced, not added to
+        shutil.rmtree(self.partition_path, ignore_errors = True)
+
+        # new files never overwrite those from other batches
+        self._sink_id = uuid.uuid4().hex
+        self._batches = 0
+
+
+    @property
+    def partition_path(self) -> str:
+        # directory of this crawl date's rows (partition values are uri-encoded)
+        return os.path.join(self.path, f"crawl_date={quote(self.crawl_date, safe = '')}")
+
+
+    def append(self, rows: list, product_type: str = None):
+        self._buffer += rows
+        self._product_types += [product_type] * len(rows)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Description
+        -----------
+        Write every buffered row and empty the buffer
+        """
+
+        if not self._buffer:
+            return
+
+        columns = list(zip(*self._buffer))
+        arrays = {c: list(values) for c, values in zip(self.columns, columns)}
+        arrays["crawl_date"] = [self.crawl_date] * len(self._buffer)
+        arrays["product_type"] = self._product_types
+
+        table = pa.Table.from_pydict(arrays, schema = self._schema)
+        ds.write_dataset(
+            table, self.path, format = "parquet",
+            partitioning = _partitioning(self.table_type),
+            basename_template = f"part-{self._sink_id}-{self._batches}-{{i}}.parquet",
+            existing_data_behavior = "overwrite_or_ignore"
+        )
+
+        self._batches += 1
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+        self._product_types = []
+
+
+    def close(self):
+        self.flush()
+
+
+
+def write_inci(inci_df, directory: str):
+    """
+    Description
+    -----------
+    Save the EU INCI descriptions as a single Parquet file with one row per
+    ingredient, and its functions as a list (rather than the melted table
+    make_ingredient_table writes, with a row per function slot)
+
+    Parameters
+    ----------
+    inci_df: DataFrame
+        returned by make_ingredient_table
+    directory: str
+        the dataset directory
+
+    Returns
+    -------
+    path of the written file
+    """
+
+    import pyarrow.parquet as pq
+
+    functions = (inci_df.dropna(subset = ["function"])
+                        .assign(function = lambda df: df["function"].str.strip())
+                        .query("function != ''"))
+    functions = functions.groupby("name", sort = False)["function"].agg(list)
+
+    names = inci_df.drop_duplicates("name")
+    table = pa.Table.from_pydict({
+        "name": names["name"].tolist(),
+        "description": names["description"].tolist(),
+        "functions": [functions.get(name, []) for name in names["name"]]
+    }, schema = table_schema("inci"))
+
+    os.makedirs(os.path.join(directory, "inci"), exist_ok = True)
+    path = os.path.join(directory, "inci", "inci.parquet")
+    pq.write_table(table, path)
+    return path
+
+
+
+class ProductDataset:
+    """
+    A class used to read the dataset written by a crawl. Tables are
+    opened lazily, memory-mapped, and only the requested columns and
+    partitions are read.
+
+    e.g. ProductDataset("dataset").to_pandas(
+             "ingredients", columns = ["name", "ingredient_id", "rank"],
+             product_type = "Moisturizers")
+
+    Attributes
+    ----------
+    directory: str
+    """
+
+    def __init__(self, directory: str = DATASET_DIRECTORY):
+        if ds is None:
+            raise ImportError("reading the dataset requires pyarrow")
+
+        self.directory = directory
+        self._filesystem = pyarrow.fs.LocalFileSystem(use_mmap = True)
+        self._tables = {}
+
+
+    def table(self, table_type: str):
+        """
+        Description
+        -----------
+        Open one table without reading any of its data
+
+        Parameters
+        ----------
+        table_type: str
+            "ingredients", "products", or "inci"
+
+        Returns
+        -------
+        pyarrow.dataset.Dataset
+        """
+
+        if table_type not in self._tables:
+            path = os.path.join(self.directory, table_type)
+            partitioning = None if table_type == "inci" else _partitioning(table_type)
+            self._tables[table_type] = ds.dataset(
+                path, format = "parquet", partitioning = partitioning,
+                schema = table_schema(table_type), filesystem = self._filesystem)
+        return self._tables[table_type]
+
+
+    @property
+    def products(self):
+        return self.table("products")
+
+    @property
+    def ingredients(self):
+        return self.table("ingredients")
+
+    @property
+    def inci(self):
+        return self.table("inci")
+
+
+    def read(self, table_type: str, columns: list = None, crawl_date: str = None,
+             product_type: str = None, filter = None):
+        """
+        Description
+        -----------
+        Read (part of) a table
+
+        Parameters
+        ----------
+        table_type: str
+        columns: list of str
+            only these columns are read (None for all)
+        crawl_date: str
+            only read this crawl's partition
+        product_type: str
+            only read this product type's partition
+        filter: pyarrow.dataset.Expression
+            any other filter, e.g. ds.field("rank") <= 5
+
+        Returns
+        -------
+        pyarrow.Table
+        """
+
+        conditions = [filter] if filter is not None else []
+        if crawl_date is not None:
+            conditions.append(ds.field("crawl_date") == crawl_date)
+        if product_type is not None:
+            conditions.append(ds.field("product_type") == product_type)
+
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        return self.table(table_type).to_table(columns = columns, filter = expression)
+
+
+    def to_pandas(self, table_type: str, **kwargs):
+        """
+        Description
+        -----------
+        read() as a DataFrame (dictionary-encoded columns become categoricals)
+        """
+
+        return self.read(table_type, **kwargs).to_pandas()
+
+
+    def crawl_dates(self) -> list:
+        """
+        Returns
+        -------
+        the crawl dates in the products table, oldest first
+        """
+
+        dates = set()
+        for fragment in self.products.get_fragments():
+            expression = ds.get_partition_keys(fragment.partition_expression)
+            dates.add(expression.get("crawl_date"))
+        return sorted(d for d in dates if d is not None)
@@ -0,0 +1,605 @@
+from concurrent.futures import ThreadPoolExecutor
+from http_client import HttpClient, get_client
+from metrics import METRICS
+from urllib.parse import urlsplit
+from collections import deque
+import threading
+import requests
+import logging
+import random
+import time
+
+
+# responses worth retrying; the throttling ones also cut concurrency
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+
+
+class FetchError(requests.RequestException):
+    """
+    Raised by fetch_page when a page can't be downloaded, so a failed
+    request is never parsed as if it were the page
+    """
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"could not fetch {url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+
+
+class HostRateLimiter:
+    """
+    A class used to space out requests to the same host.
+
+    Attributes
+    ----------
+    requests_per_second: float
+        maximum number of requests started per second for any single host
+        (None or 0 disables rate limiting)
+    """
+
+    def __init__(self, requests_per_second: float = None):
+        self.requests_per_second = requests_per_second
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+
+    def wait(self, url: str):
+        """
+        Description
+        -----------
+        Block until a request to the host of url is allowed to start
+
+        Parameters
+        ----------
+        url: str
+            full url of the request about to be made
+        """
+
+        host = urlsplit(url).netloc
+        interval = 1.0 / self.requests_per_second if self.requests_per_second else 0.0
+
+        # reserve the next free slot for this host, then sleep until it arrives
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            if interval or slot > now:
+                self._next_slot[host] = slot + interval
+
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+    def pause(self, url: str, seconds: float):
+        """
+        Description
+        -----------
+        Hold back every request to the host of url for a while
+        (e.g. for the Retry-After of a 429 response)
+
+        Parameters
+        ----------
+        url: str
+        seconds: float
+        """
+
+        host = urlsplit(url).netloc
+        with self._lock:
+            resume = time.monotonic() + seconds
+            self._next_slot[host] = max(self._next_slot.get(host, 0.0), resume)
+
+
+
+class CircuitBreaker:
+    """
+    A class used to stop sending requests to a host that keeps failing.
+
+    After failure_threshold failures in a row the host's circuit opens:
+    requests wait instead of being sent. Once reset_timeout has passed a
+    single trial request is let through (half-open); if it succeeds the
+    circuit closes, otherwise it opens again for twice as long (up to
+    max_reset_timeout). A host that has been failing for give_up_after
+    seconds is given up on, so a dead site ends the crawl instead of
+    stalling it.
+
+    Attributes
+    ----------
+    failure_threshold: int
+    reset_timeout: float
+    max_reset_timeout: float
+    give_up_after: float
+    """
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 5.0,
+                 max_reset_timeout: float = 120.0, give_up_after: float = 600.0):
+
+        assert failure_threshold >= 1, "failure_threshold must be at least 1"
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.give_up_after = give_up_after
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+
+    def _host(self, url: str) -> dict:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = {"failures": 0, "failing_since": None,
+                                 "open_until": None, "timeout": self.reset_timeout,
+                                 "trial": False}
+        return self._hosts[host]
+
+
+    def state(self, url: str) -> str:
+        """
+        Returns
+        -------
+        "closed", "open", or "half-open" for the host of url
+        """
+
+        with self._lock:
+            host = self._host(url)
+            if host["open_until"] is None:
+                return "closed"
+            if host["trial"] or time.monotonic() >= host["open_until"]:
+                return "half-open"
+            return "open"
+
+
+    def acquire(self, url: str) -> bool:
+        """
+        Description
+        -----------
+        Block until a request to the host of url may be sent
+
+        Parameters
+        ----------
+        url: str
+
+        Returns
+        -------
+        False if the host has been given up on, otherwise True
+        """
+
+        while True:
+            with self._lock:
+                host = self._host(url)
+                now = time.monotonic()
+
+                if host["open_until"] is None:
+                    return True
+                if now - host["failing_since"] > self.give_up_after:
+                    return False
+                if now >= host["open_until"] and not host["trial"]:
+                    host["trial"] = True
+                    return True
+
+                delay = max(host["open_until"] - now, 0.05)
+
+            time.sleep(min(delay, 1.0))
+
+
+    def success(self, url: str):
+        with self._lock:
+            self._close(url)
+
+
+    def _close(self, url: str):
+        host = self._host(url)
+        if host["open_until"] is not None:
+            logging.info(f"circuit closed for {urlsplit(url).netloc}")
+        host.update(failures = 0, failing_since = None, open_until = None,
+                    timeout = self.reset_timeout, trial = False)
+
+
+    def throttled(self, url: str):
+        # a 429 means the host is up: it ends a trial like a success does,
+        # but doesn't count for or against a closed circuit
+        with self._lock:
+            if self._host(url)["trial"]:
+                self._close(url)
+
+
+    def failure(self, url: str):
+        with self._lock:
+            host = self._host(url)
+            now = time.monotonic()
+            host["failures"] += 1
+            host["failing_since"] = host["failing_since"] or now
+
+            if host["trial"]:
+                # the trial request failed: stay open, for longer
+                host["timeout"] = min(host["timeout"] * 2, self.max_reset_timeout)
+                host["open_until"] = now + host["timeout"]
+                host["trial"] = False
+
+            elif host["open_until"] is None and host["failures"] >= self.failure_threshold:
+                host["open_until"] = now + host["timeout"]
+                METRICS.increment("circuit_opened")
+                logging.info(f"circuit opened for {urlsplit(url).netloc} after "
+                             f"{host['failures']} failures")
+
+
+
+class AdaptiveConcurrency:
+    """
+    A class used to adapt the number of requests in flight to each host
+    (additive increase, multiplicative decrease, as in TCP congestion control).
+
+    Every successful request raises the host's limit by 1 / limit (so about
+    +1 for each limit's worth of successes); a throttled request (429, 503,
+    or a timeout) cuts it by the decrease factor. Only requests sent after
+    the last cut can cut it again, so one burst of throttling counts once.
+
+    Attributes
+    ----------
+    initial: float
+    minimum: float
+    maximum: float
+    decrease: float
+        factor the limit is multiplied by when throttled
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 32,
+                 decrease: float = 0.5):
+
+        assert 1 <= minimum <= initial <= maximum, (
+            "limits must satisfy 1 <= minimum <= initial <= maximum")
+        assert 0 < decrease < 1, "decrease must be between 0 and 1"
+
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self._limits = {}
+        self._in_flight = {}
+        self._decreases = {} # host -> number of cuts so far
+        self._condition = threading.Condition()
+
+
+    def limit(self, url: str) -> float:
+        with self._condition:
+            return self._limits.get(urlsplit(url).netloc, self.initial)
+
+
+    def acquire(self, url: str) -> int:
+        """
+        Description
+        -----------
+        Block until another request to the host of url may be in flight
+
+        Returns
+        -------
+        token to pass to release
+        """
+
+        host = urlsplit(url).netloc
+        with self._condition:
+            while self._in_flight.get(host, 0) >= int(self._limits.get(host, self.initial)):
+                self._condition.wait()
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            return self._decreases.get(host, 0)
+
+
+    def release(self, url: str, outcome: str, token: int):
+        """
+        Description
+        -----------
+        Record how a request ended and free its slot
+
+        Parameters
+        ----------
+        url: str
+        outcome: str
+            "ok", "throttled", or anything else to leave the limit alone
+        token: int
+            returned by acquire
+        """
+
+        host = urlsplit(url).netloc
+        with self._condition:
+            self._in_flight[host] -= 1
+            limit = self._limits.get(host, self.initial)
+
+            if outcome == "ok":
+                limit = min(limit + 1 / limit, self.maximum)
+
+            elif outcome == "throttled" and token == self._decreases.get(host, 0):
+                limit = max(limit * self.decrease, self.minimum)
+                self._decreases[host] = token + 1
+                logging.info(f"throttled by {host}: concurrency down to {limit:.1f}")
+
+            self._limits[host] = limit
+            self._condition.notify_all()
+
+
+
+class FetchEngine:
+    """
+    A class used to download many pages concurrently.
+
+    Pages are fetched by a bounded thread pool; results are always returned
+    in the same order as the urls that were passed in. How many requests
+    are actually in flight adapts to how the host responds (see
+    AdaptiveConcurrency), retryable failures are retried with jittered
+    exponential backoff (honoring Retry-After), and a host that keeps
+    failing is backed off entirely (see CircuitBreaker).
+
+    Attributes
+    ----------
+    max_workers: int
+        maximum number of requests in flight at once
+    requests_per_second: float
+        per-host rate limit (None to disable)
+    retries: int
+        number of additional attempts after a failed request
+    backoff: float
+        base delay in seconds between retries, doubled after each attempt
+    max_backoff: float
+        longest delay between retries
+    client: HttpClient
+        pooled session used for every request (defaults to the shared client)
+    concurrency: AdaptiveConcurrency
+    breaker: CircuitBreaker
+    """
+
+    def __init__(self, max_workers: int = 8, requests_per_second: float = 4.0,
+                 retries: int = 3, backoff: float = 1.0, max_backoff: float = 60.0,
+                 client: HttpClient = None, concurrency: AdaptiveConcurrency = None,
+                 breaker: CircuitBreaker = None):
+
+        assert max_workers >= 1, "max_workers must be at least 1"
+        assert retries >= 0, "retries must be non-negative"
+
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.concurrency = concurrency or AdaptiveConcurrency(
+            initial = max(1, max_workers // 2), maximum = max_workers)
+        self.breaker = breaker or CircuitBreaker()
+        self._client = client
+
+
+    @property
+    def client(self) -> HttpClient:
+        # looked up on every request, so set_client also redirects this engine
+        return self._client if self._client is not None else get_client()
+
+
+    def _attempt(self, url: str) -> tuple:
+        # one request: (content or None, outcome, Retry-After seconds or None,
+        # status code or None)
+        token = self.concurrency.acquire(url)
+        outcome = "error"
+
+        try:
+            self.rate_limiter.wait(url)
+            try:
+                page = self.client.get(url)
+            except requests.Timeout as e:
+                outcome = "throttled" # a host that stops answering is overloaded
+                logging.info(f"timed out fetching {url}: {e}")
+                return None, outcome, None, None
+            except requests.RequestException as e:
+                logging.info(f"error fetching {url}: {e}")
+                return None, outcome, None, None
+
+            status = page.status_code
+            if status < 400:
+                outcome = "ok"
+                return page.content, outcome, None, status
+
+            if status not in RETRY_STATUSES:
+                # e.g. 404: the host is fine, the page just isn't there
+                outcome = "permanent"
+                return None, outcome, None, status
+
+            if status in THROTTLE_STATUSES:
+                outcome = "throttled"
+                METRICS.increment("fetch_throttled")
+            logging.info(f"status {status} fetching {url}")
+            return None, outcome, _retry_after(page), status
+
+        finally:
+            self.concurrency.release(url, outcome, token)
+
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Description
+        -----------
+        Download a single page, retrying retryable failures (timeouts,
+        connection errors, 408, 429 and 5xx responses) with backoff
+
+        Parameters
+        ----------
+        url: str
+
+        Returns
+        -------
+        content: bytes, or None if the page couldn't be downloaded
+        """
+
+        return self._fetch(url)[0]
+
+
+    def _fetch(self, url: str) -> tuple:
+        # (content, None) or (None, reason)
+        reason = "no attempts made"
+
+        for attempt in range(self.retries + 1):
+            if not self.breaker.acquire(url):
+                reason = "host has been failing for too long"
+                METRICS.increment("circuit_rejections")
+                break
+
+            try:
+                content, outcome, retry_after, status = self._attempt(url)
+            except Exception:
+                self.breaker.failure(url) # ends a trial, if this was one
+                raise
+
+            if outcome == "ok":
+                self.breaker.success(url)
+                return content, None
+
+            if outcome == "permanent":
+                self.breaker.success(url)
+                reason = "page not found or not allowed"
+                break
+
+            # a 429 means the host is up but wants us to slow down, which the
+            # concurrency limit and Retry-After already take care of
+            if status == 429:
+                self.breaker.throttled(url)
+            else:
+                self.breaker.failure(url)
+            reason = f"{outcome} after {attempt + 1} attempts"
+
+            if attempt < self.retries:
+                METRICS.increment("fetch_retries")
+                if retry_after is not None:
+                    # every request to this host waits, not just this one
+                    delay = min(retry_after, self.max_backoff)
+                    self.rate_limiter.pause(url, delay)
+                else:
+                    # full jitter, so retries from many threads don't line up
+                    delay = random.uniform(0, min(self.max_backoff,
+                                                  self.backoff * 2 ** attempt))
+                time.sleep(delay)
+
+        logging.info(f"giving up on {url}: {reason}")
+        METRICS.increment("fetch_failures")
+        return None, reason
+
+
+    def fetch_page(self, url: str) -> bytes:
+        """
+        Description
+        -----------
+        fetch(), but raising FetchError instead of returning None
+
+        Parameters
+        ----------
+        url: str
+
+        Returns
+        -------
+        content: bytes
+        """
+
+        content, reason = self._fetch(url)
+        if content is None:
+            raise FetchError(url, reason)
+        return content
+
+
+    def fetch_all(self, urls: list):
+        """
+        Description
+        -----------
+        Download every url using the thread pool
+
+        Parameters
+        ----------
+        urls: list of str
+
+        Returns
+        -------
+        generator of (url, content) tuples, in the same order as urls
+
+        At most 2 * max_workers pages are downloaded ahead of the caller,
+        so a slow consumer holds back the downloads instead of letting
+        pages pile up in memory
+        """
+
+        window = deque()
+        urls = iter(urls)
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            for url in urls:
+                window.append((url, executor.submit(self.fetch, url)))
+
+                if len(window) >= 2 * self.max_workers:
+                    url, future = window.popleft()
+                    yield url, future.result()
+
+            while window:
+                url, future = window.popleft()
+                yield url, future.result()
+
+
+
+def _retry_after(page) -> float:
+    # Retry-After in seconds (the HTTP-date form is rare enough to ignore)
+    try:
+        return max(float(page.headers.get("Retry-After")), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+
+# ------------------------------- < DEFAULT > -------------------------------- #
+_default_engine = None
+_default_lock = threading.Lock()
+
+
+def get_engine() -> FetchEngine:
+    """
+    Description
+    -----------
+    Return the FetchEngine shared by the whole crawl, creating it on first
+    use, so every request to a host counts towards the same circuit
+    breaker and concurrency limit
+
+    Returns
+    -------
+    FetchEngine
+    """
+
+    global _default_engine
+    with _default_lock:
+        if _default_engine is None:
+            _default_engine = FetchEngine()
+        return _default_engine
+
+
+def set_engine(engine: FetchEngine):
+    """
+    Description
+    -----------
+    Replace the shared FetchEngine (e.g. to change retries or rate limits)
+
+    Parameters
+    ----------
+    engine: FetchEngine
+    """
+
+    global _default_engine
+    with _default_lock:
+        _default_engine = engine
+
+
+def fetch_page(url: str) -> bytes:
+    """
+    Description
+    -----------
+    Download one page with the shared FetchEngine
+
+    Parameters
+    ----------
+    url: str
+
+    Returns
+    -------
+    content: bytes (raises FetchError if the page couldn't be downloaded)
+    """
+
+    return get_engine().fetch_page(url)
@@ -0,0 +1,263 @@
+from ingredients import normalize_name
+from collections import defaultdict
+from functools import lru_cache
+import time
+
+
+def edit_distance(a: str, b: str, max_distance: int = None) -> int:
+    """
+    Description
+    -----------
+    Levenshtein distance between two strings
+
+    Parameters
+    ----------
+    a: str
+    b: str
+    max_distance: int
+        if given, stop early once the distance must exceed this,
+        and return max_distance + 1
+
+    Returns
+    -------
+    distance: int
+    """
+
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start = 1):
+        current = [i]
+        for j, char_b in enumerate(b, start = 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+
+def ngrams(name: str, n: int = 3) -> set:
+    """
+    Description
+    -----------
+    Character n-grams of a name, padded so that short names
+    and word boundaries still produce n-grams
+
+    Parameters
+    ----------
+    name: str
+    n: int
+
+    Returns
+    -------
+    set of str
+    """
+
+    padded = f" {name} "
+    return set(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+
+class FuzzyMatcher:
+    """
+    A class used to resolve misspelled or variant ingredient names
+    to names in a dictionary (e.g. the comedogenic list or the EU INCI table).
+
+    A character n-gram inverted index narrows each lookup to the few
+    dictionary names that share enough n-grams with the query; only those
+    candidates are compared by edit distance. Resolved names are memoized,
+    since the same names repeat across many products.
+
+    Attributes
+    ----------
+    names: list of str
+        normalized dictionary names
+    max_distance: int
+        largest edit distance accepted as a match
+    n: int
+        n-gram length used by the index
+    """
+
+    def __init__(self, names, max_distance: int = 2, n: int = 3,
+                 cache_size: int = 100000):
+
+        assert max_distance >= 0, "max_distance must be non-negative"
+
+        self.names = sorted(set(normalize_name(name) for name in names
+                                if name is not None))
+        self.max_distance = max_distance
+        self.n = n
+
+        self._exact = set(self.names)
+        self._postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for gram in ngrams(name, n):
+                self._postings[gram].append(i)
+
+        # lru memo of already-resolved names (per matcher instance)
+        self._memo = lru_cache(maxsize = cache_size)(self._resolve)
+
+
+    def candidates(self, name: str) -> list:
+        """
+        Description
+        -----------
+        Find dictionary names sharing enough n-grams with name to possibly
+        be within max_distance edits of it
+
+        Each edit changes at most n of a name's n-grams, so a match must
+        share at least len(ngrams(name)) - n * max_distance of them
+
+        Parameters
+        ----------
+        name: str
+            normalized name
+
+        Returns
+        -------
+        list of int (positions in self.names)
+        """
+
+        grams = ngrams(name, self.n)
+        needed = max(len(grams) - self.n * self.max_distance, 1)
+
+        counts = defaultdict(int)
+        for gram in grams:
+            for i in self._postings.get(gram, ()):
+                counts[i] += 1
+
+        return [i for i, count in counts.items() if count >= needed]
+
+
+    def resolve(self, name: str) -> tuple:
+        """
+        Description
+        -----------
+        Find the closest dictionary name to a (possibly misspelled) name
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        (match, distance): the dictionary name and its edit distance,
+            or (None, None) if nothing is within max_distance
+        """
+
+        return self._memo(name)
+
+
+    def clear_cache(self):
+        self._memo.cache_clear()
+
+
+    def _resolve(self, name: str) -> tuple:
+        if name is None:
+            return None, None
+
+        name = normalize_name(name)
+        if name in self._exact:
+            return name, 0
+
+        best, best_distance = None, self.max_distance + 1
+        for i in self.candidates(name):
+            candidate = self.names[i]
+            distance = edit_distance(name, candidate, best_distance)
+
+            # ties go to the alphabetically first name, so results are stable
+            if distance < best_distance or (
+                    distance == best_distance and best is not None
+                    and candidate < best):
+                best, best_distance = candidate, distance
+
+        if best is None:
+            return None, None
+        return best, best_distance
+
+
+    def resolve_all(self, names) -> list:
+        """
+        Description
+        -----------
+        Resolve many names (e.g. a whole ingredient column)
+
+        Parameters
+        ----------
+        names: iterable of str
+
+        Returns
+        -------
+        list of dictionary names (None where nothing matched)
+        """
+
+        return [self.resolve(name)[0] for name in names]
+
+
+
+# ------------------------------ < BENCHMARK > ------------------------------- #
+def benchmark(matcher: FuzzyMatcher, names: list) -> dict:
+    """
+    Description
+    -----------
+    Time how long a matcher takes to resolve a batch of names
+
+    Parameters
+    ----------
+    matcher: FuzzyMatcher
+    names: list of str
+        e.g. 100,000 ingredient names from the ingredients table
+
+    Returns
+    -------
+    dict with the number of names, seconds taken, names per second,
+    and the share of names that were matched
+    """
+
+    matcher.clear_cache()
+    start = time.perf_counter()
+    resolved = matcher.resolve_all(names)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "names": len(names),
+        "seconds": elapsed,
+        "names_per_second": len(names) / elapsed if elapsed else float("inf"),
+        "matched": sum(r is not None for r in resolved) / max(len(names), 1)
+    }
+
+
+if __name__ == '__main__':
+    from sephora_setup import INCI_PATH
+    import pandas as pd
+    import random
+    import sys
+
+    # resolve a 100k batch of ingredients (with typos added)
+    # against the EU INCI names written by scrape_ingredient_database.py
+    inci_names = pd.read_csv(INCI_PATH)["name"].dropna().unique().tolist()
+    matcher = FuzzyMatcher(inci_names)
+
+    if len(sys.argv) > 1: # long format ingredients table
+        batch = pd.read_csv(sys.argv[1])["ingredient"].dropna().tolist()
+    else:
+        batch = inci_names
+
+    random.seed(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    def typo(name):
+        i = random.randrange(len(name))
+        return name[:i] + random.choice(letters) + name[i + 1:]
+
+    batch = [typo(random.choice(batch)) for _ in range(100000)]
+    print(benchmark(matcher, batch))
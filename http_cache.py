@@ -0,0 +1,322 @@
+import threading
+import hashlib
+import logging
+import sqlite3
+import time
+import gzip
+import os
+
+
+class ResponseCache:
+    """
+    A class used to store downloaded pages on disk between crawls.
+
+    Page bodies are gzip compressed and stored under the sha256 of their
+    content, so identical pages are only stored once. A small SQLite index
+    maps each url to its body along with the validators (ETag and
+    Last-Modified) needed to revalidate it with a conditional request.
+
+    Attributes
+    ----------
+    directory: str
+        folder holding the index and the compressed bodies
+    ttl: float
+        seconds a cached page is served without asking the server
+        (None to never expire, e.g. when re-running parsers offline)
+    max_bytes: int
+        cap on the total compressed size of stored bodies; the least
+        recently used pages are evicted once it is exceeded
+    """
+
+    def __init__(self, directory: str = "cache", ttl: float = 24 * 60 * 60,
+                 max_bytes: int = 2 * 1024 ** 3):
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.blob_directory = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_directory, exist_ok = True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"),
+                                   check_same_thread = False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._db.commit()
+
+        # running total of the bodies' size, so store() doesn't have to
+        # add them all up every time it checks max_bytes
+        (self._total_bytes,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT DISTINCT digest, size FROM entries)").fetchone()
+
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_directory, digest[:2], digest + ".gz")
+
+
+    def lookup(self, url: str) -> dict:
+        """
+        Description
+        -----------
+        Find the cache entry for a url
+
+        Parameters
+        ----------
+        url: str
+
+        Returns
+        -------
+        entry: dict with digest, etag, last_modified, fetched_at, and fresh,
+            or None if the url has not been cached
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, etag, last_modified, fetched_at "
+                "FROM entries WHERE url = ?", (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        digest, etag, last_modified, fetched_at = row
+        fresh = self.ttl is None or time.time() - fetched_at < self.ttl
+
+        return {
+            "digest": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "fresh": fresh
+        }
+
+
+    def conditional_headers(self, entry: dict) -> dict:
+        """
+        Description
+        -----------
+        Build the headers that ask the server to reply 304 if the page
+        has not changed since it was cached
+
+        Parameters
+        ----------
+        entry: dict returned by lookup()
+
+        Returns
+        -------
+        headers: dict
+        """
+
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+    def has_body(self, entry: dict) -> bool:
+        """
+        Returns
+        -------
+        True if the body of a cache entry (returned by lookup()) is on disk
+        """
+
+        return os.path.exists(self._blob_path(entry["digest"]))
+
+
+    def load(self, url: str, entry: dict) -> bytes:
+        """
+        Description
+        -----------
+        Read a cached body and mark the url as recently used
+
+        Parameters
+        ----------
+        url: str
+        entry: dict returned by lookup()
+
+        Returns
+        -------
+        content: bytes, or None if the body is missing from disk or
+            can't be read (see discard)
+        """
+
+        try:
+            with gzip.open(self._blob_path(entry["digest"]), "rb") as f:
+                content = f.read()
+        except (OSError, EOFError): # missing, or a truncated/corrupt gzip file
+            logging.info(f"cache body missing or unreadable for {url}")
+            return None
+
+        with self._lock:
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE url = ?",
+                             (time.time(), url))
+            self._db.commit()
+
+        return content
+
+
+    def refresh(self, url: str, headers: dict):
+        """
+        Description
+        -----------
+        Restart the ttl of a cached page after the server confirmed (304)
+        that it has not changed
+
+        Parameters
+        ----------
+        url: str
+        headers: dict
+            headers of the 304 response, which may carry new validators
+        """
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET fetched_at = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (now, now, headers.get("ETag"), headers.get("Last-Modified"), url))
+            self._db.commit()
+
+
+    def store(self, url: str, content: bytes, headers: dict):
+        """
+        Description
+        -----------
+        Save a downloaded page, then evict old pages if over max_bytes
+
+        Parameters
+        ----------
+        url: str
+        content: bytes
+            body of a 200 response
+        headers: dict
+            response headers (used for ETag and Last-Modified)
+        """
+
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+
+        # identical content is already on disk under the same name
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+        size = os.path.getsize(path)
+        now = time.time()
+
+        with self._lock:
+            old = self._db.execute("SELECT digest, size FROM entries WHERE url = ?",
+                                   (url,)).fetchone()
+            stored = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1",
+                                      (digest,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, headers.get("ETag"), headers.get("Last-Modified"),
+                 now, now, size))
+            self._db.commit()
+
+            if not stored:
+                self._total_bytes += size
+            if old and old[0] != digest:
+                self._remove_unreferenced(*old)
+
+        self.evict()
+
+
+    def discard(self, url: str):
+        """
+        Description
+        -----------
+        Forget a cached page whose body can't be loaded, along with every
+        other url that shares the body, so the next store() writes it again
+
+        Parameters
+        ----------
+        url: str
+        """
+
+        with self._lock:
+            row = self._db.execute("SELECT digest, size FROM entries WHERE url = ?",
+                                   (url,)).fetchone()
+            if row is None:
+                return
+            self._db.execute("DELETE FROM entries WHERE digest = ?", (row[0],))
+            self._db.commit()
+            self._remove_unreferenced(*row)
+
+
+    def _remove_unreferenced(self, digest: str, size: int) -> bool:
+        # caller must hold self._lock
+        # returns True if the body was no longer used by any url and was removed
+        in_use = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1",
+                                  (digest,)).fetchone()
+        if in_use:
+            return False
+
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            pass
+        self._total_bytes -= size
+        return True
+
+
+    def total_bytes(self) -> int:
+        """
+        Returns
+        -------
+        total compressed size of all distinct stored bodies
+        """
+
+        with self._lock:
+            return self._total_bytes
+
+
+    def evict(self):
+        """
+        Description
+        -----------
+        Drop least recently used pages until the cache fits in max_bytes
+        """
+
+        if self.max_bytes is None or self.total_bytes() <= self.max_bytes:
+            return
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT url, digest, size FROM entries "
+                "ORDER BY accessed_at").fetchall()
+
+            for url, digest, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+                # shared bodies only free space once their last url is gone
+                self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._remove_unreferenced(digest, size)
+
+                logging.debug(f"evicted {url} from cache")
+
+            self._db.commit()
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,300 @@
+from requests.adapters import HTTPAdapter
+from http_cache import ResponseCache
+from metrics import METRICS
+from urllib.parse import urlsplit
+from collections import deque
+import threading
+import requests
+import logging
+import time
+
+
+class RequestRecord:
+    """
+    A class used to represent a single completed request.
+
+    Attributes
+    ----------
+    url: str
+    status_code: int
+    elapsed: float
+        wall-clock seconds from sending the request to reading the body
+    n_bytes: int
+        size of the (decompressed) response body
+    from_cache: bool
+        True if the body was served from the ResponseCache
+    """
+
+    def __init__(self, url: str, status_code: int, elapsed: float, n_bytes: int,
+                 from_cache: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.n_bytes = n_bytes
+        self.from_cache = from_cache
+
+    def __repr__(self):
+        return (f"RequestRecord({self.url!r}, status={self.status_code}, "
+                f"elapsed={self.elapsed:.3f}s, bytes={self.n_bytes}, "
+                f"from_cache={self.from_cache})")
+
+
+
+class HttpClient:
+    """
+    A class used to share one pooled HTTP session across the scrapers.
+
+    Connections are kept alive and reused between requests to the same host,
+    responses are requested gzip/deflate compressed, and every request is
+    timed and measured.
+
+    Attributes
+    ----------
+    timeout: tuple of float
+        (connect timeout, read timeout) in seconds
+    max_connections_per_host: int
+        maximum number of simultaneous requests to a single host
+    requests_made: int
+        total number of requests completed
+    bytes_received: int
+        total size of all response bodies
+    total_elapsed: float
+        total seconds spent waiting on requests
+    cache_hits: int
+        number of requests answered by the cache (fresh or revalidated)
+    history: deque of RequestRecord
+        the most recent requests (at most history_size)
+    cache: ResponseCache
+        optional on-disk cache consulted before going to the network
+    """
+
+    def __init__(self, timeout: tuple = (5.0, 30.0),
+                 max_connections_per_host: int = 8,
+                 pool_hosts: int = 10,
+                 history_size: int = 1000,
+                 cache: ResponseCache = None):
+
+        assert max_connections_per_host >= 1, (
+            "max_connections_per_host must be at least 1")
+
+        self.timeout = timeout
+        self.max_connections_per_host = max_connections_per_host
+
+        # one adapter shared by http and https, so connections are pooled
+        adapter = HTTPAdapter(pool_connections = pool_hosts,
+                              pool_maxsize = max_connections_per_host,
+                              pool_block = True)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+        self.requests_made = 0
+        self.bytes_received = 0
+        self.total_elapsed = 0.0
+        self.cache_hits = 0
+        self.history = deque(maxlen = history_size)
+        self.cache = cache
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_connections_per_host)
+            return self._host_slots[host]
+
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Description
+        -----------
+        Send a GET request through the pooled session
+
+        Parameters
+        ----------
+        url: str
+        **kwargs:
+            passed on to requests.Session.get (e.g. headers);
+            timeout defaults to self.timeout
+
+        Returns
+        -------
+        requests.Response
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+
+        # serve fresh pages straight from the cache,
+        # and ask the server whether stale ones have changed
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and entry["fresh"]:
+            page = self._cached_response(url, entry)
+            if page is not None:
+                return page
+            self.cache.discard(url)
+            entry = None
+
+        # a 304 is only useful if the cached body can be loaded,
+        # so entries whose body is gone are dropped and fetched in full
+        if entry and not self.cache.has_body(entry):
+            self.cache.discard(url)
+            entry = None
+
+        request_kwargs = dict(kwargs)
+        if entry:
+            headers = dict(kwargs.get("headers") or {})
+            headers.update(self.cache.conditional_headers(entry))
+            request_kwargs["headers"] = headers
+
+        with self._host_slot(url):
+            try:
+                page = self.session.get(url, **request_kwargs)
+                content = page.content # read the body while the slot is held
+            except requests.RequestException:
+                METRICS.increment("http_failures")
+                raise
+            elapsed = time.perf_counter() - start
+
+        if entry and page.status_code == 304:
+            self.cache.refresh(url, page.headers)
+            cached = self._cached_response(url, entry, elapsed)
+            if cached is not None:
+                return cached
+
+            # the body became unreadable since it was checked:
+            # never hand back a bare 304, ask again without validators
+            self.cache.discard(url)
+            return self.get(url, **kwargs)
+
+        if self.cache and page.status_code == 200:
+            self.cache.store(url, content, page.headers)
+
+        self.record(RequestRecord(url, page.status_code, elapsed, len(content)))
+        return page
+
+
+    def _cached_response(self, url: str, entry: dict,
+                         elapsed: float = 0.0) -> requests.Response:
+        # build a 200 response from a cache entry (None if its body is gone)
+        start = time.perf_counter()
+        content = self.cache.load(url, entry)
+        if content is None:
+            return None
+
+        page = requests.Response()
+        page.url = url
+        page.status_code = 200
+        page._content = content
+        page.headers["X-From-Cache"] = "1"
+        if entry["etag"]:
+            page.headers["ETag"] = entry["etag"]
+        if entry["last_modified"]:
+            page.headers["Last-Modified"] = entry["last_modified"]
+
+        elapsed += time.perf_counter() - start
+        self.record(RequestRecord(url, 200, elapsed, len(content), from_cache = True))
+        return page
+
+
+    def record(self, request_record: RequestRecord):
+        """
+        Description
+        -----------
+        Add a completed request to the running totals and history
+
+        Parameters
+        ----------
+        request_record: RequestRecord
+        """
+
+        with self._lock:
+            self.requests_made += 1
+            self.bytes_received += request_record.n_bytes
+            self.total_elapsed += request_record.elapsed
+            self.cache_hits += request_record.from_cache
+            self.history.append(request_record)
+
+        METRICS.observe("fetch", request_record.elapsed)
+        METRICS.increment("http_requests")
+        METRICS.increment("http_bytes", request_record.n_bytes)
+        if request_record.from_cache:
+            METRICS.increment("cache_hits")
+        if request_record.status_code >= 400:
+            METRICS.increment("http_failures")
+
+        logging.debug(request_record)
+
+
+    def summary(self) -> dict:
+        """
+        Description
+        -----------
+        Summarize every request made through this client so far
+
+        Returns
+        -------
+        dict with request count, cache hits, total bytes, and mean latency
+        """
+
+        with self._lock:
+            n = self.requests_made
+            return {
+                "requests": n,
+                "cache_hits": self.cache_hits,
+                "bytes": self.bytes_received,
+                "mean_latency": self.total_elapsed / n if n else 0.0
+            }
+
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+
+
+# ------------------------------- < DEFAULT > -------------------------------- #
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    Description
+    -----------
+    Return the HttpClient shared by search_url, get_product_info, and
+    get_page, creating it on first use
+
+    Returns
+    -------
+    HttpClient
+    """
+
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+def set_client(client: HttpClient):
+    """
+    Description
+    -----------
+    Replace the shared HttpClient (e.g. to change timeouts or pool sizes)
+
+    Parameters
+    ----------
+    client: HttpClient
+    """
+
+    global _default_client
+    with _default_lock:
+        _default_client = client
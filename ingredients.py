@@ -0,0 +1,188 @@
+import time
+import re
+
+
+# compiled once, rather than on every call
+# parentheticals, e.g. Titanium Dioxide (CI 77891) -> Titanium Dioxide
+PARENTHETICAL_PATTERN = re.compile(r"\({1}.{1,20}\){1}\s")
+# new line characters, periods, and asterisks
+PUNCTUATION_PATTERN = re.compile(r"\n|\.|\*|\r")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+SEPARATOR = ", "
+
+
+def split_ingredients(raw_ingredients: str) -> list:
+    """
+    Description
+    -----------
+    Split a raw ingredient string into formatted ingredient names,
+    keeping the order they are listed in (i.e. their rank)
+    e.g. raw_ingredients = "Water, Titanium Dioxide (CI 77891) , Glycerin, Water"
+         ingredients = ["water", "titanium dioxide", "glycerin"]
+
+    Duplicates are dropped (the first occurrence keeps its place),
+    as are empty names, e.g. from a trailing comma
+
+    Parameters
+    ----------
+    raw_ingredients: str
+        string listing all ingredients
+
+    Returns
+    -------
+    ingredients: list of str
+        formatted ingredient strings, in order
+    """
+
+    raw_ingredients = PARENTHETICAL_PATTERN.sub("", str(raw_ingredients))
+    raw_ingredients = PUNCTUATION_PATTERN.sub(" ", raw_ingredients)
+
+    # dict keys keep insertion order, so this removes duplicates in order
+    ingredients = (ingr.strip().lower() for ingr in raw_ingredients.split(SEPARATOR))
+    return list(dict.fromkeys(ingr for ingr in ingredients if ingr))
+
+
+def split_ingredient_column(raw_ingredients):
+    """
+    Description
+    -----------
+    Batch version of split_ingredients: split a whole column of raw
+    ingredient strings at once
+
+    The column is joined into one string so that each regex and the
+    lowercasing run once over the whole column (in C) rather than once per
+    product; only the final split and de-duplication loop in python
+
+    Parameters
+    ----------
+    raw_ingredients: pandas Series of str
+        one raw ingredient string per product (missing values allowed)
+
+    Returns
+    -------
+    DataFrame in long format with columns "ingredient" and "rank",
+    indexed by the index of raw_ingredients (one row per ingredient;
+    products with no ingredient string get no rows)
+    """
+
+    import pandas as pd
+    import numpy as np
+
+    present = raw_ingredients.dropna()
+
+    # "." can't match the "\n", and "\s" can't match the "\x00", so no
+    # pattern match can span two products; the "\n" then becomes a space
+    text = "\x00\n".join(present.astype(str))
+    text = PARENTHETICAL_PATTERN.sub("", text)
+    text = PUNCTUATION_PATTERN.sub(" ", text).lower()
+
+    ingredients = []
+    counts = []
+    for product in text.split("\x00 "):
+        tokens = (ingr.strip() for ingr in product.split(SEPARATOR))
+        unique = list(dict.fromkeys(ingr for ingr in tokens if ingr))
+        ingredients += unique
+        counts.append(len(unique))
+
+    counts = np.array(counts, dtype = np.int64)
+    index = present.index.repeat(counts)
+
+    # rank restarts at 1 for each product
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    ranks = np.arange(len(ingredients)) - starts + 1
+
+    return pd.DataFrame({"ingredient": ingredients, "rank": ranks}, index = index)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Description
+    -----------
+    Put an ingredient name into the form used for lookups:
+    lowercase, with runs of whitespace collapsed to single spaces
+
+    Parameters
+    ----------
+    name: str
+
+    Returns
+    -------
+    str
+    """
+
+    return WHITESPACE_PATTERN.sub(" ", str(name)).strip().lower()
+
+
+# ------------------------------ < BENCHMARK > ------------------------------- #
+def _original_format_ingredients(raw_ingredients: str) -> set:
+    # the per-product method this module replaced, kept for benchmarking
+    raw_ingredients = str(raw_ingredients)
+    raw_ingredients = re.sub(r"\({1}.{1,20}\){1}\s", "", raw_ingredients)
+    raw_ingredients = re.sub(r"\n|\.|\*|\r", " ", raw_ingredients)
+    ingredients = raw_ingredients.split(", ")
+    return set([ingr.strip().lower() for ingr in ingredients])
+
+
+def benchmark(raw_strings: list, repeat: int = 3) -> dict:
+    """
+    Description
+    -----------
+    Compare the original per-product loop, split_ingredients, and
+    split_ingredient_column on a corpus of raw ingredient strings, and
+    check the batch and per-product results agree
+
+    Parameters
+    ----------
+    raw_strings: list of str
+    repeat: int
+        the best of this many runs is reported
+
+    Returns
+    -------
+    dict with the best seconds for each method, and "identical"
+    """
+
+    import pandas as pd
+
+    column = pd.Series(raw_strings)
+    methods = {
+        "original_loop": lambda: [_original_format_ingredients(r) for r in raw_strings],
+        "split_ingredients": lambda: [split_ingredients(r) for r in raw_strings],
+        "split_ingredient_column": lambda: split_ingredient_column(column)
+    }
+
+    results = {}
+    for name, method in methods.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            method()
+            timings.append(time.perf_counter() - start)
+        results[name] = min(timings)
+
+    batch = split_ingredient_column(column)
+    per_product = [split_ingredients(r) for r in raw_strings]
+    results["identical"] = (
+        batch.groupby(level = 0, sort = False)["ingredient"].agg(list).to_dict()
+        == {i: ingrs for i, ingrs in enumerate(per_product) if ingrs})
+
+    return results
+
+
+if __name__ == '__main__':
+    import pandas as pd
+    import random
+    import sys
+
+    # raw strings from a products table with a "raw ingredients" column,
+    # or a synthetic corpus built from the EU INCI names
+    if len(sys.argv) > 1:
+        raw_strings = pd.read_csv(sys.argv[1])["raw ingredients"].dropna().tolist()
+    else:
+        from sephora_setup import INCI_PATH
+        names = pd.read_csv(INCI_PATH)["name"].dropna().unique().tolist()
+        random.seed(0)
+        raw_strings = [", ".join(random.sample(names, random.randint(5, 40)))
+                       for _ in range(100000)]
+
+    print(benchmark(raw_strings))
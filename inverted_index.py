@@ -0,0 +1,339 @@
+from sephora_setup import INGREDIENT_SYNONYMS
+from canonical import IngredientDictionary
+import numpy as np
+import threading
+import os
+
+
+EMPTY = np.zeros(0, dtype = np.int32)
+
+
+
+class InvertedIndex:
+    """
+    A class used to find every product that contains an ingredient
+    without scanning the ingredient table.
+
+    For each canonical ingredient (see canonical.IngredientDictionary) the
+    index keeps a posting list: the sorted IDs of the products that contain
+    it, and its rank in each. Products can be added as they are crawled;
+    they are merged into the posting lists the next time those are read.
+    On disk, posting lists are delta-encoded and compressed.
+
+    Attributes
+    ----------
+    dictionary: canonical.IngredientDictionary
+    links: list of str
+        product link for each product ID (None for replaced products)
+    """
+
+    def __init__(self, dictionary: IngredientDictionary = None):
+        if dictionary is None:
+            dictionary = IngredientDictionary(synonyms = INGREDIENT_SYNONYMS)
+        self.dictionary = dictionary
+        self.links = []
+        self._ids = {} # link -> product ID
+        self._postings = {} # ingredient ID -> (product IDs, ranks) arrays
+        self._pending = {} # ingredient ID -> [(product ID, rank), ...] not merged yet
+        self._forward = {} # product ID -> ingredient IDs (so products can be replaced)
+        self._all = None # every current product ID, built when first needed
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._ids)
+
+
+    def __contains__(self, link: str) -> bool:
+        return link in self._ids
+
+
+    def add(self, product: dict) -> int:
+        """
+        Description
+        -----------
+        Add a product (replacing any earlier version with the same link)
+
+        Parameters
+        ----------
+        product: dict
+            as returned by Sephora.parse_product_page
+
+        Returns
+        -------
+        the product's ID
+        """
+
+        with self._lock:
+            link = product["link"]
+            if link in self._ids:
+                self._remove(self._ids.pop(link))
+
+            # IDs only ever increase, so appending keeps posting lists sorted
+            product_id = len(self.links)
+            self._all = None
+            self.links.append(link)
+            self._ids[link] = product_id
+
+            ingredient_ids = []
+            for rank, ingredient in enumerate(product["ingredients"], start = 1):
+                if ingredient is None:
+                    continue
+                ingredient_id = self.dictionary.intern(ingredient)
+                if ingredient_id in ingredient_ids:
+                    continue # e.g. "water" and "aqua" in the same list
+                ingredient_ids.append(ingredient_id)
+                self._pending.setdefault(ingredient_id, []).append((product_id, rank))
+
+            self._forward[product_id] = ingredient_ids
+            return product_id
+
+
+    def add_all(self, products) -> int:
+        """
+        Parameters
+        ----------
+        products: iterable of dict
+
+        Returns
+        -------
+        number of products added
+        """
+
+        n_products = 0
+        for product in products:
+            if product is not None:
+                self.add(product)
+                n_products += 1
+        return n_products
+
+
+    def remove(self, link: str):
+        with self._lock:
+            if link in self._ids:
+                self._remove(self._ids.pop(link))
+
+
+    def _remove(self, product_id: int):
+        self.links[product_id] = None
+        self._all = None
+        for ingredient_id in self._forward.pop(product_id, []):
+            products, ranks = self._posting(ingredient_id)
+            keep = products != product_id
+            self._postings[ingredient_id] = (products[keep], ranks[keep])
+
+
+    def _posting(self, ingredient_id: int) -> tuple:
+        # merge any pending products into the posting list
+        products, ranks = self._postings.get(ingredient_id, (EMPTY, EMPTY))
+
+        pending = self._pending.pop(ingredient_id, None)
+        if pending:
+            new = np.array(pending, dtype = np.int32)
+            products = np.concatenate([products, new[:, 0]])
+            ranks = np.concatenate([ranks, new[:, 1]]).astype(np.int16)
+            self._postings[ingredient_id] = (products, ranks)
+
+        return products, ranks
+
+
+
+    # -------------------------------- < QUERIES > ------------------------------- #
+    def lookup(self, ingredient: str, min_rank: int = 1, max_rank: int = None):
+        """
+        Description
+        -----------
+        Find the products that contain an ingredient
+
+        Parameters
+        ----------
+        ingredient: str
+            any spelling the dictionary knows
+        min_rank: int
+        max_rank: int
+            only products listing the ingredient between these positions
+            (1 is the first ingredient)
+
+        Returns
+        -------
+        product IDs: sorted numpy array (see product_links)
+        """
+
+        ingredient_id = self.dictionary.find(ingredient)
+        if ingredient_id is None:
+            return EMPTY
+
+        with self._lock:
+            products, ranks = self._posting(ingredient_id)
+
+        if min_rank > 1 or max_rank is not None:
+            keep = ranks >= min_rank
+            if max_rank is not None:
+                keep &= ranks <= max_rank
+            products = products[keep]
+
+        return products
+
+
+    def search(self, all_of = (), any_of = (), none_of = (),
+               max_rank: int = None):
+        """
+        Description
+        -----------
+        Boolean query over ingredients
+        e.g. search(all_of = ["niacinamide"], none_of = ["fragrance"])
+
+        Parameters
+        ----------
+        all_of: list of str
+            products must contain every one of these
+        any_of: list of str
+            products must contain at least one of these
+        none_of: list of str
+            products must contain none of these (at any rank)
+        max_rank: int
+            all_of and any_of ingredients must be within the first
+            max_rank positions
+
+        Returns
+        -------
+        product IDs: sorted numpy array
+        """
+
+        # start with the shortest posting list, so the result stays small
+        required = sorted((self.lookup(ingredient, max_rank = max_rank)
+                           for ingredient in all_of), key = len)
+
+        result = None
+        for products in required:
+            result = products if result is None else _intersect(result, products)
+
+        if any_of:
+            matches = np.unique(np.concatenate(
+                [self.lookup(ingredient, max_rank = max_rank) for ingredient in any_of]))
+            result = matches if result is None else _intersect(result, matches)
+
+        if result is None:
+            # only exclusions: start from every product
+            with self._lock:
+                if self._all is None:
+                    self._all = np.array(sorted(self._ids.values()), dtype = np.int32)
+                result = self._all
+
+        for ingredient in none_of:
+            result = result[~_isin(result, self.lookup(ingredient))]
+
+        return result
+
+
+    def product_links(self, product_ids) -> list:
+        return [self.links[i] for i in product_ids]
+
+
+
+    # ------------------------------- < STORAGE > -------------------------------- #
+    def save(self, path: str):
+        """
+        Description
+        -----------
+        Save the index to a compressed .npz file; each posting list is
+        stored as the gaps between product IDs, which compress far better
+        than the IDs themselves
+
+        Parameters
+        ----------
+        path: str
+        """
+
+        with self._lock:
+            for ingredient_id in list(self._pending):
+                self._posting(ingredient_id)
+
+            ingredient_ids = sorted(i for i, (p, _) in self._postings.items() if len(p))
+            postings = [self._postings[i] for i in ingredient_ids]
+
+            counts = np.array([len(p) for p, _ in postings], dtype = np.int32)
+            gaps = np.concatenate([np.diff(p, prepend = 0) for p, _ in postings] or [EMPTY])
+            ranks = np.concatenate([r for _, r in postings] or [EMPTY])
+
+            arrays = {
+                "ingredient_ids": np.array(ingredient_ids, dtype = np.int32),
+                "counts": counts,
+                "gaps": gaps.astype(np.int32),
+                "ranks": ranks.astype(np.int16),
+                "names": _encode_strings(self.dictionary.names),
+                "links": _encode_strings(link or "" for link in self.links)
+            }
+
+        # write to a temporary file first, so a crash can't leave half an index
+        temporary = path + ".tmp.npz"
+        np.savez_compressed(temporary, **arrays)
+        os.replace(temporary, path)
+
+
+    @classmethod
+    def load(cls, path: str, synonyms: dict = INGREDIENT_SYNONYMS) -> "InvertedIndex":
+        """
+        Description
+        -----------
+        Load an index saved by save() (or start an empty one if path
+        doesn't exist yet)
+
+        Parameters
+        ----------
+        path: str
+        synonyms: dict
+            alternative name -> canonical name
+
+        Returns
+        -------
+        InvertedIndex
+        """
+
+        if not os.path.exists(path):
+            return cls(IngredientDictionary(synonyms = synonyms))
+
+        with np.load(path) as data:
+            names = _decode_strings(data["names"])
+            index = cls(IngredientDictionary(names, synonyms))
+
+            index.links = [link or None for link in _decode_strings(data["links"])]
+            index._ids = {link: i for i, link in enumerate(index.links) if link is not None}
+
+            ends = np.cumsum(data["counts"])
+            gaps = data["gaps"]
+            ranks = data["ranks"]
+            for ingredient_id, start, end in zip(data["ingredient_ids"].tolist(),
+                                                 ends - data["counts"], ends):
+                products = np.cumsum(gaps[start:end], dtype = np.int32)
+                index._postings[ingredient_id] = (products, ranks[start:end].copy())
+                for product_id in products.tolist():
+                    index._forward.setdefault(product_id, []).append(ingredient_id)
+
+        return index
+
+
+
+def _isin(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # which elements of a are in b (both sorted): binary search of b for
+    # each element of a, much faster than np.isin when a is the shorter one
+    if not len(a) or not len(b):
+        return np.zeros(len(a), dtype = bool)
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return b[positions] == a
+
+
+def _intersect(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(a) > len(b):
+        a, b = b, a
+    return a[_isin(a, b)]
+
+
+def _encode_strings(strings) -> np.ndarray:
+    # newline-terminated utf-8, so no pickling is needed to load the file
+    text = "".join(s + "\n" for s in strings)
+    return np.frombuffer(text.encode("utf-8"), dtype = np.uint8)
+
+
+def _decode_strings(array: np.ndarray) -> list:
+    return array.tobytes().decode("utf-8").split("\n")[:-1]
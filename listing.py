@@ -0,0 +1,137 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from structured_data import embedded_states, walk_json
+from fetch import FetchEngine, get_engine
+import logging
+import math
+
+
+# keys that hold a link to a product page inside a product record
+PRODUCT_LINK_KEYS = ("targetUrl", "productUrl", "url")
+# keys that say how many products / pages the listing has in total
+TOTAL_PRODUCTS_KEYS = ("totalProducts", "total")
+PAGE_SIZE_KEYS = ("pageSize",)
+TOTAL_PAGES_KEYS = ("totalPages", "pageCount")
+
+
+def _first_int(node: dict, keys: tuple) -> int:
+    for key in keys:
+        value = node.get(key)
+        if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+            return value
+    return None
+
+
+def parse_listing(content: bytes) -> dict:
+    """
+    Description
+    -----------
+    Read the product links and paging information that a subcategory page
+    embeds as JSON (what its own javascript uses to render the grid)
+
+    Parameters
+    ----------
+    content: bytes
+        raw html of a subcategory page
+
+    Returns
+    -------
+    listing: dict with "links" (list of str, in page order) and
+        "total_pages" (int, or None if unknown), or None if the page
+        has no embedded product data
+    """
+
+    links = []
+    total_products = page_size = total_pages = None
+
+    for state in embedded_states(content):
+        for node in walk_json(state):
+            for key in PRODUCT_LINK_KEYS:
+                value = node.get(key)
+                if isinstance(value, str) and value.startswith("/product/"):
+                    links.append(value)
+                    break
+
+            # keep the first value found for each
+            total_products = total_products or _first_int(node, TOTAL_PRODUCTS_KEYS)
+            page_size = page_size or _first_int(node, PAGE_SIZE_KEYS)
+            total_pages = total_pages or _first_int(node, TOTAL_PAGES_KEYS)
+
+    if not links:
+        return None
+
+    if total_pages is None and total_products and page_size:
+        total_pages = math.ceil(total_products / page_size)
+
+    return {"links": list(dict.fromkeys(links)), "total_pages": total_pages}
+
+
+def page_url(url: str, page: int) -> str:
+    """
+    Description
+    -----------
+    Url of a given page of a listing (Sephora uses ?currentPage=N)
+
+    Parameters
+    ----------
+    url: str
+    page: int
+        1 for the first page
+
+    Returns
+    -------
+    str
+    """
+
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "currentPage"]
+    query.append(("currentPage", str(page)))
+    return urlunsplit(parts._replace(query = urlencode(query)))
+
+
+def get_listing_links(url: str, engine: FetchEngine = None,
+                      max_pages: int = 50, page_url = page_url) -> list:
+    """
+    Description
+    -----------
+    Collect every product link in a subcategory from its embedded JSON,
+    fetching the remaining pages of the listing in parallel
+
+    Parameters
+    ----------
+    url: str
+        full url of the subcategory page
+    engine: FetchEngine
+        (the shared engine from fetch.get_engine if None)
+    max_pages: int
+        upper limit on the number of pages fetched
+    page_url: function
+        (url, page number) -> url of that page; replace it to point at
+        saved fixture pages, e.g. corpus/listings/embedded/page2.html
+
+    Returns
+    -------
+    links: list of str, or None if the page has no embedded product data
+        (the caller should fall back to rendering the page in a browser)
+    """
+
+    engine = engine or get_engine()
+    first = parse_listing(engine.fetch_page(url))
+    if first is None:
+        logging.info(f"no embedded product data found at {url}")
+        return None
+
+    links = list(first["links"])
+    total_pages = min(first["total_pages"] or 1, max_pages)
+
+    if total_pages > 1:
+        urls = [page_url(url, page) for page in range(2, total_pages + 1)]
+
+        for other_url, content in engine.fetch_all(urls):
+            listing = parse_listing(content) if content else None
+            if listing is None:
+                logging.info(f"no embedded product data found at {other_url}")
+                continue
+            links += listing["links"]
+
+    logging.info(f"{len(links)} products found in {total_pages} pages of embedded data")
+    return list(dict.fromkeys(links))
@@ -0,0 +1,210 @@
+from sephora_setup import INCI_PATH
+from ingredients import split_ingredients
+import logging
+import bs4
+import os
+
+
+# text that marks a block as something other than the ingredient list
+# (notes that often follow it, e.g. "Clean at Sephora products are...");
+# plain substring checks on the lowercased block are much faster than
+# one case-insensitive regex with this many alternatives
+STOP_PHRASES = ("the ingredients", "free of", "clean at sephora", "vegan",
+                "gluten", "evaluated", "may change")
+STOP_PREFIXES = ("*", "+")
+
+# tags that start a new block of text
+BLOCK_TAGS = {"br", "p", "div", "li", "ul", "ol", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+# an INCI list has roughly one comma for every 2-3 words; prose has far fewer
+FULL_DENSITY = 0.4 # commas per word that earns the full comma score
+MIN_SCORE = 0.35 # blocks scoring lower are never taken to be the ingredients
+
+
+
+class IngredientLocator:
+    """
+    A class used to find the ingredient list in the details section of a
+    product page.
+
+    The section is split into blocks of text (at <br> and block tags) in a
+    single pass, each block is scored, and the best block is returned.
+    A block scores highly if it is dense in commas and its names are known
+    INCI ingredients, and is ruled out if it contains a stop phrase.
+
+    Without a dictionary, a list of one or two names has no commas to score
+    on, so if no block scores high enough the original positional rule is
+    used instead: the last block before the first stop phrase (skipping the
+    first block, e.g. "Ingredients:", when there is more than one).
+
+    Attributes
+    ----------
+    dictionary: canonical.IngredientDictionary
+        known ingredient names (None to score on comma density alone)
+    min_score: float
+    """
+
+    def __init__(self, dictionary = None, min_score: float = MIN_SCORE):
+        self.dictionary = dictionary
+        self.min_score = min_score
+
+
+    def blocks(self, section) -> list:
+        """
+        Description
+        -----------
+        Split a details section into blocks of text
+
+        Parameters
+        ----------
+        section: bs4.element.Tag
+
+        Returns
+        -------
+        blocks: list of str, in page order (empty blocks are dropped)
+        """
+
+        blocks = []
+        current = []
+
+        for node in section.descendants:
+            if isinstance(node, bs4.element.Tag):
+                if node.name in BLOCK_TAGS and current:
+                    blocks.append("".join(current))
+                    current = []
+            elif type(node) is bs4.element.NavigableString: # not comments, etc.
+                current.append(node)
+
+        if current:
+            blocks.append("".join(current))
+
+        return [b.strip() for b in blocks if b.strip()]
+
+
+    def score(self, block: str) -> float:
+        """
+        Description
+        -----------
+        Score how likely a block of text is to be the ingredient list
+
+        Parameters
+        ----------
+        block: str
+
+        Returns
+        -------
+        score: float
+            up to 1 for comma density, plus up to 1 for the share of its
+            names that are known ingredients; 0 if it contains a stop phrase
+        """
+
+        lowered = block.lower()
+        if lowered.startswith(STOP_PREFIXES) or any(p in lowered for p in STOP_PHRASES):
+            return 0.0
+
+        n_words = len(block.split())
+        density = min(block.count(",") / n_words / FULL_DENSITY, 1.0) if n_words else 0.0
+
+        if self.dictionary is None:
+            return density
+
+        names = split_ingredients(block)
+        if not names:
+            return density
+
+        known = sum(self.dictionary.find(name) is not None for name in names)
+        return density + known / len(names)
+
+
+    def locate(self, section) -> str:
+        """
+        Description
+        -----------
+        Find the ingredient list in a details section
+
+        Parameters
+        ----------
+        section: bs4.element.Tag
+
+        Returns
+        -------
+        ingredients: str, or None if no block scores at least min_score
+        (and, without a dictionary, the positional rule finds nothing)
+        """
+
+        best = None
+        best_key = None
+        blocks = self.blocks(section)
+
+        for block in blocks:
+            score = self.score(block)
+            if score < self.min_score:
+                continue
+
+            # on a tie, the block listing more names wins
+            key = (score, block.count(","))
+            if best_key is None or key > best_key:
+                best, best_key = block, key
+
+        if best is None and self.dictionary is None:
+            best = self._positional(blocks)
+
+        return best
+
+
+    def _positional(self, blocks: list) -> str:
+        # what find_ingredients did before blocks were scored
+        candidates = blocks if len(blocks) == 1 else blocks[1:]
+
+        found = None
+        for block in candidates:
+            lowered = block.lower()
+            if lowered.startswith(STOP_PREFIXES) or any(p in lowered for p in STOP_PHRASES):
+                break
+            found = block
+        return found
+
+
+
+_default_locator = None
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _find_data(path: str) -> str:
+    # data files are written relative to the working directory, which is
+    # usually the repository; when run from elsewhere, look there too
+    for candidate in (path, os.path.join(_MODULE_DIR, path)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def default_locator() -> IngredientLocator:
+    """
+    Description
+    -----------
+    Return a locator that knows the EU INCI names if inci_descriptions.csv
+    has been built (see scrape_ingredient_database.py), loading it only once
+    (INCI_PATH is looked for in the working directory, then beside this module)
+
+    Returns
+    -------
+    IngredientLocator
+    """
+
+    global _default_locator
+
+    if _default_locator is None:
+        dictionary = None
+        path = _find_data(INCI_PATH)
+        if path is not None:
+            from canonical import IngredientDictionary
+            dictionary = IngredientDictionary.from_inci(path)
+        else:
+            logging.warning(f"{INCI_PATH} not found (relative to {os.getcwd()} or "
+                            f"{_MODULE_DIR}): ingredient lists are located without "
+                            f"the INCI names; run scrape_ingredient_database.py to "
+                            f"download them")
+        _default_locator = IngredientLocator(dictionary)
+
+    return _default_locator
@@ -0,0 +1,390 @@
+from functools import wraps
+import threading
+import cProfile
+import logging
+import json
+import time
+import os
+
+try:
+    import pyinstrument
+except ImportError: # pyinstrument profiles are optional
+    pyinstrument = None
+
+
+# upper bounds (in seconds) of the timing histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    A class used to count observations (e.g. timings) in fixed buckets.
+
+    Attributes
+    ----------
+    buckets: tuple of float
+        upper bound of each bucket
+    counts: list of int
+        observations in each bucket (the last entry is for values
+        above every bound)
+    total: float
+        sum of all observations
+    count: int
+        number of observations
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+    def merge(self, other: dict):
+        for i, n in enumerate(other["counts"]):
+            self.counts[i] += n
+        self.total += other["sum"]
+        self.count += other["count"]
+
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": self.total,
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0
+        }
+
+
+
+class Metrics:
+    """
+    A class used to collect timings and counts for each stage of a crawl
+    (network, parsing, ingredient extraction, output).
+
+    Attributes
+    ----------
+    histograms: dict
+        stage name -> Histogram of seconds spent per call
+    counters: dict
+        counter name -> value (e.g. "http_bytes", "cache_hits",
+        "find_ingredients_failures")
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+
+    def increment(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+
+    def timer(self, name: str):
+        """
+        Description
+        -----------
+        Context manager that records how long its block takes under name,
+        and counts "<name>_failures" if the block raises
+
+        Parameters
+        ----------
+        name: str
+            stage name, e.g. "find_ingredients"
+        """
+
+        metrics = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                metrics.observe(name, time.perf_counter() - self.start)
+                if exc_type is not None:
+                    metrics.increment(f"{name}_failures")
+
+        return _Timer()
+
+
+    def timed(self, name: str):
+        """
+        Description
+        -----------
+        Decorator version of timer()
+
+        Parameters
+        ----------
+        name: str
+            stage name
+        """
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+                "counters": dict(self.counters)
+            }
+
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+    def snapshot_and_reset(self) -> dict:
+        """
+        Description
+        -----------
+        Return everything recorded so far and start again from zero
+        (used to send a worker process's metrics back to the main process)
+
+        Returns
+        -------
+        dict in the format of to_dict()
+        """
+
+        with self._lock:
+            snapshot = {
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+                "counters": dict(self.counters)
+            }
+            self.histograms = {}
+            self.counters = {}
+        return snapshot
+
+
+    def merge(self, snapshot: dict):
+        """
+        Description
+        -----------
+        Add a snapshot (e.g. from a worker process) into these metrics
+
+        Parameters
+        ----------
+        snapshot: dict in the format of to_dict()
+        """
+
+        with self._lock:
+            for name, histogram in snapshot["histograms"].items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(histogram["buckets"])
+                self.histograms[name].merge(histogram)
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def to_json(self, path: str = None) -> str:
+        """
+        Description
+        -----------
+        Export the metrics as JSON
+
+        Parameters
+        ----------
+        path: str
+            if given, the JSON is also written to this file
+
+        Returns
+        -------
+        str
+        """
+
+        text = json.dumps(self.to_dict(), indent = 2)
+        if path:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+
+    def to_prometheus(self, prefix: str = "comedogenic") -> str:
+        """
+        Description
+        -----------
+        Export the metrics in the Prometheus text exposition format
+
+        Parameters
+        ----------
+        prefix: str
+            prepended to every metric name
+
+        Returns
+        -------
+        str
+        """
+
+        data = self.to_dict()
+        lines = []
+
+        if data["histograms"]:
+            metric = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {metric} Seconds spent per call in each crawl stage.")
+            lines.append(f"# TYPE {metric} histogram")
+
+            for stage, h in sorted(data["histograms"].items()):
+                cumulative = 0
+                for bound, n in zip(h["buckets"] + ["+Inf"], h["counts"]):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {h["sum"]}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {h["count"]}')
+
+        for name, value in sorted(data["counters"].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+
+class Profiler:
+    """
+    A class used to profile a sample of calls (e.g. one product page in
+    every 100) with cProfile or pyinstrument, without slowing down the rest.
+
+    Attributes
+    ----------
+    sample_every: int
+        profile one call in this many (0 to turn profiling off)
+    directory: str
+        where the profiles are saved (.prof for cProfile, .html for pyinstrument)
+    use_pyinstrument: bool
+        use pyinstrument instead of cProfile (if it is installed)
+    """
+
+    def __init__(self, sample_every: int = 0, directory: str = "profiles",
+                 use_pyinstrument: bool = False):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.configure(sample_every, directory, use_pyinstrument)
+
+
+    def configure(self, sample_every: int = 0, directory: str = "profiles",
+                  use_pyinstrument: bool = False):
+        """
+        Description
+        -----------
+        Change what is profiled, e.g. from the crawl's settings, or in a
+        worker process from the settings() of the main process
+
+        Parameters
+        ----------
+        sample_every: int
+        directory: str
+        use_pyinstrument: bool
+            falls back to cProfile (with a warning) if pyinstrument
+            isn't installed
+        """
+
+        if use_pyinstrument and pyinstrument is None:
+            logging.warning("pyinstrument is not installed, profiling with cProfile")
+
+        self.sample_every = sample_every
+        self.directory = directory
+        self.use_pyinstrument = use_pyinstrument and pyinstrument is not None
+
+
+    def settings(self) -> dict:
+        """
+        Returns
+        -------
+        the arguments of configure() that reproduce this profiler's settings
+        """
+
+        return {"sample_every": self.sample_every, "directory": self.directory,
+                "use_pyinstrument": self.use_pyinstrument}
+
+
+    def _should_profile(self, name: str) -> int:
+        # returns the call number if this call should be profiled, else 0
+        if not self.sample_every:
+            return 0
+        with self._lock:
+            n = self._calls.get(name, 0) + 1
+            self._calls[name] = n
+        return n if (n - 1) % self.sample_every == 0 else 0
+
+
+    def profiled(self, name: str):
+        """
+        Description
+        -----------
+        Decorator that profiles a sample of the calls to a function
+
+        Parameters
+        ----------
+        name: str
+            used in the names of the saved profiles
+        """
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                n = self._should_profile(name)
+                if not n:
+                    return function(*args, **kwargs)
+
+                os.makedirs(self.directory, exist_ok = True)
+                path = os.path.join(self.directory, f"{name}-{os.getpid()}-{n}")
+
+                if self.use_pyinstrument:
+                    profiler = pyinstrument.Profiler()
+                    profiler.start()
+                    try:
+                        return function(*args, **kwargs)
+                    finally:
+                        profiler.stop()
+                        with open(path + ".html", "w") as f:
+                            f.write(profiler.output_html())
+
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(function, *args, **kwargs)
+                finally:
+                    profiler.dump_stats(path + ".prof")
+                    logging.debug(f"saved profile {path}.prof")
+
+            return wrapper
+        return decorator
+
+
+
+# ------------------------------- < DEFAULT > -------------------------------- #
+# shared by every module in a process
+METRICS = Metrics()
+PROFILER = Profiler()
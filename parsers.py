@@ -0,0 +1,324 @@
+from sephora_setup import PRODUCT_FIELDS, PRODUCT_DETAILS
+import time
+import bs4
+import os
+
+try:
+    import lxml
+except ImportError: # the lxml backend is optional
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError: # the selectolax backend is optional
+    HTMLParser = None
+
+
+# html.parser is pure python and always available; the others are C-accelerated
+BACKENDS = ["html.parser", "lxml", "selectolax"]
+
+
+def available_backends() -> list:
+    """
+    Returns
+    -------
+    names of the parser backends that can be used in this environment
+    """
+
+    installed = {"html.parser": True,
+                 "lxml": lxml is not None,
+                 "selectolax": HTMLParser is not None}
+    return [b for b in BACKENDS if installed[b]]
+
+
+def default_backend() -> str:
+    """
+    Returns
+    -------
+    the fastest bs4-compatible backend available ("lxml" or "html.parser")
+    """
+
+    return "lxml" if lxml is not None else "html.parser"
+
+
+def make_soup(content, backend: str = None, parse_only = None) -> bs4.BeautifulSoup:
+    """
+    Description
+    -----------
+    Build a BeautifulSoup tree using the tree builder for the given backend
+    (selectolax has no bs4 tree builder, so it uses lxml when available)
+
+    Parameters
+    ----------
+    content: bytes or str
+        raw html
+    backend: str
+        one of BACKENDS (defaults to default_backend())
+    parse_only: bs4.SoupStrainer
+        if given, only matching tags (and their contents) are kept
+
+    Returns
+    -------
+    soup: bs4.BeautifulSoup
+    """
+
+    backend = backend or default_backend()
+    assert backend in BACKENDS, f"backend must be one of {BACKENDS}"
+
+    builder = "html.parser" if backend == "html.parser" else default_backend()
+    return bs4.BeautifulSoup(content, builder, parse_only = parse_only)
+
+
+def find_all_in_page(content, tag: str, class_tag: str,
+                     backend: str = None) -> list:
+    """
+    Description
+    -----------
+    Find every tag of a given type and class in a page, without building
+    the parts of the tree that can't contain a match (unless backend is
+    html.parser, which builds the full tree as search_url always did)
+
+    Parameters
+    ----------
+    content: bytes or str
+        raw html
+    tag: str
+        e.g. "a", "div", "span", etc.
+    class_tag: str
+        the specific class to search for, e.g. "css-or7ouu"
+    backend: str
+        one of BACKENDS
+
+    Returns
+    -------
+    list of bs4.element.Tag
+    """
+
+    backend = backend or default_backend()
+    strainer = None
+    if backend != "html.parser":
+        strainer = bs4.SoupStrainer(tag, class_ = class_tag)
+
+    soup = make_soup(content, backend, parse_only = strainer)
+    return soup.find_all(tag, class_ = class_tag)
+
+
+# ------------------------------ < EXTRACTION > ------------------------------ #
+# the selectors used when no profile is given (see SELECTOR_PROFILES)
+DEFAULT_PROFILE = dict(PRODUCT_FIELDS, details = PRODUCT_DETAILS)
+
+
+def extract_product_fields(content, backend: str = None, profile: dict = None) -> dict:
+    """
+    Description
+    -----------
+    Extract every field of a selector profile (the text of the first match
+    for each field, and every match for "details") from a product page
+
+    Parameters
+    ----------
+    content: bytes or str
+        raw html of a product page
+    backend: str
+        "html.parser": full tree, one search per field (the original method)
+        "lxml": only the tags with a configured class are built,
+            then all fields are found in a single pass
+        "selectolax": fields are found with selectolax's css engine, and only
+            the details sections are converted to bs4 (for find_ingredients)
+    profile: dict
+        field -> (tag, class), usually including "details" (see
+        SELECTOR_PROFILES); defaults to PRODUCT_FIELDS and PRODUCT_DETAILS
+
+    Returns
+    -------
+    fields: dict
+        the text of each field in the profile (None if not found), and
+        "details": list of bs4.element.Tag for the details sections
+        (if the profile has "details")
+    """
+
+    backend = backend or default_backend()
+    assert backend in BACKENDS, f"backend must be one of {BACKENDS}"
+
+    profile = dict(profile or DEFAULT_PROFILE)
+    details = profile.pop("details", None)
+
+    if backend == "selectolax":
+        return _extract_selectolax(content, profile, details)
+
+    if backend == "lxml":
+        return _extract_single_pass(content, profile, details)
+
+    return _extract_per_field(content, profile, details)
+
+
+def _extract_per_field(content, selectors: dict, details: tuple) -> dict:
+    soup = bs4.BeautifulSoup(content, "html.parser")
+
+    fields = {}
+    for field, (tag, class_tag) in selectors.items():
+        found = soup.find(tag, class_ = class_tag)
+        fields[field] = found.get_text() if found else None
+
+    if details is not None:
+        tag, class_tag = details
+        fields["details"] = soup.find_all(tag, class_ = class_tag)
+    return fields
+
+
+def _extract_single_pass(content, selectors: dict, details: tuple) -> dict:
+    # only keep tags that carry one of the configured classes
+    classes = [c for _, c in selectors.values()] + ([details[1]] if details else [])
+    soup = make_soup(content, "lxml", parse_only = bs4.SoupStrainer(class_ = classes))
+
+    fields = dict.fromkeys(selectors)
+    if details is not None:
+        fields["details"] = []
+    wanted = {(tag, class_tag): field
+              for field, (tag, class_tag) in selectors.items()}
+
+    # tags come back in document order, so the first hit for a field
+    # is the same tag that soup.find() would have returned
+    for found in soup.find_all(class_ = classes):
+        for class_tag in found.get("class", []):
+            if details is not None and (found.name, class_tag) == tuple(details):
+                fields["details"].append(found)
+
+            field = wanted.get((found.name, class_tag))
+            if field and fields[field] is None:
+                fields[field] = found.get_text()
+
+    return fields
+
+
+def _extract_selectolax(content, selectors: dict, details: tuple) -> dict:
+    tree = HTMLParser(content)
+
+    fields = {}
+    for field, (tag, class_tag) in selectors.items():
+        found = tree.css_first(f"{tag}.{class_tag}")
+        fields[field] = found.text(deep = True) if found else None
+
+    if details is not None:
+        tag, class_tag = details
+        fields["details"] = [
+            make_soup(node.html, "html.parser").find(tag, class_ = class_tag)
+            for node in tree.css(f"{tag}.{class_tag}")
+        ]
+    return fields
+
+
+# ------------------------------ < BENCHMARK > ------------------------------- #
+def load_pages(directory: str) -> list:
+    """
+    Description
+    -----------
+    Read every saved .html page in a directory
+
+    Parameters
+    ----------
+    directory: str
+
+    Returns
+    -------
+    pages: list of (file name, bytes) tuples, sorted by file name
+    """
+
+    pages = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, file_name), "rb") as f:
+                pages.append((file_name, f.read()))
+    return pages
+
+
+def compare_backends(pages: list, backends: list = None) -> dict:
+    """
+    Description
+    -----------
+    Check that every backend produces exactly the same product records
+    as html.parser on a corpus of saved pages
+
+    Parameters
+    ----------
+    pages: list of (file name, bytes) tuples
+    backends: list of str
+        defaults to every available backend
+
+    Returns
+    -------
+    mismatches: dict
+        backend -> list of file names whose record differs from html.parser
+    """
+
+    from sephora import Sephora
+
+    backends = backends or available_backends()
+    reference = Sephora(parser = "html.parser")
+    expected = {name: reference.parse_product_page(name, content)
+                for name, content in pages}
+
+    mismatches = {}
+    for backend in backends:
+        sephora = Sephora(parser = backend)
+        mismatches[backend] = [
+            name for name, content in pages
+            if sephora.parse_product_page(name, content) != expected[name]
+        ]
+    return mismatches
+
+
+def benchmark_backends(pages: list, backends: list = None, repeat: int = 3) -> dict:
+    """
+    Description
+    -----------
+    Measure how many product pages per second each backend can parse
+    (full parse_product_page, including find_ingredients)
+
+    Parameters
+    ----------
+    pages: list of (file name, bytes) tuples
+    backends: list of str
+        defaults to every available backend
+    repeat: int
+        the best of this many runs is reported
+
+    Returns
+    -------
+    results: dict
+        backend -> pages per second
+    """
+
+    from sephora import Sephora
+
+    backends = backends or available_backends()
+
+    results = {}
+    for backend in backends:
+        sephora = Sephora(parser = backend)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for name, content in pages:
+                sephora.parse_product_page(name, content)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[backend] = len(pages) / best if best else float("inf")
+    return results
+
+
+if __name__ == '__main__':
+    import logging
+    import sys
+
+    logging.disable(logging.INFO) # parse_product_page logs every product
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else "saved_pages"
+    pages = load_pages(directory)
+
+    for backend, names in compare_backends(pages).items():
+        status = "identical" if not names else f"{len(names)} mismatches: {names}"
+        print(f"{backend:12s} {status}")
+
+    for backend, rate in benchmark_backends(pages).items():
+        print(f"{backend:12s} {rate:10.1f} pages/sec")
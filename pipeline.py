@@ -0,0 +1,210 @@
+from concurrent.futures import ProcessPoolExecutor
+from metrics import METRICS, PROFILER
+from collections import deque
+import threading
+import logging
+import queue
+import os
+
+
+# one Sephora per worker process, created on first use
+_worker_sephora = None
+
+
+def _init_worker(profiling: dict):
+    # workers may be spawned rather than forked, so nothing set in the main
+    # process can be relied on: the profiler settings are passed in
+    PROFILER.configure(**profiling)
+
+
+def parse_page(url: str, content: bytes, parser: str = None,
+               profile: dict = None) -> tuple:
+    """
+    Description
+    -----------
+    Parse one product page inside a worker process
+
+    Parameters
+    ----------
+    url: str
+        full url (or file name) of the product page
+    content: bytes
+        raw html of the product page
+    parser: str
+        html parser backend, one of parsers.BACKENDS
+    profile: dict
+        product page selectors (see Sephora.profile)
+
+    Returns
+    -------
+    (url, product, metrics) where product is the dict returned by
+    Sephora.parse_product_page (None for kits/sets), and metrics holds
+    what this worker recorded while parsing it
+    """
+
+    global _worker_sephora
+    if (_worker_sephora is None or _worker_sephora.parser != parser
+            or _worker_sephora.profile != profile):
+        from sephora import Sephora
+        _worker_sephora = Sephora(parser = parser, profile = profile)
+
+    product = _worker_sephora.parse_product_page(url, content)
+    return url, product, METRICS.snapshot_and_reset()
+
+
+
+class ParsePipeline:
+    """
+    A class used to parse product pages in a pool of worker processes,
+    separately from the threads that download them.
+
+    Downloaded pages go into a bounded queue. When the parsers fall behind
+    the queue fills up and downloading pauses (and vice versa), so memory
+    use stays bounded while every core is kept busy.
+
+    Attributes
+    ----------
+    n_workers: int
+        number of parsing processes
+    queue_size: int
+        maximum number of downloaded pages waiting to be parsed
+    parser: str
+        html parser backend, one of parsers.BACKENDS
+    profile: dict
+        product page selectors (see Sephora.profile)
+    profiling: dict
+        settings for the workers' profilers (see metrics.Profiler.configure);
+        defaults to those of this process's PROFILER when run() starts
+    """
+
+    def __init__(self, n_workers: int = None, queue_size: int = 64,
+                 parser: str = None, profile: dict = None, profiling: dict = None):
+
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.parser = parser
+        self.profile = profile
+        self.profiling = profiling
+
+        assert self.n_workers >= 1, "n_workers must be at least 1"
+        assert queue_size >= 1, "queue_size must be at least 1"
+
+
+    def run(self, pages):
+        """
+        Description
+        -----------
+        Parse a stream of pages
+
+        Parameters
+        ----------
+        pages: iterable of (url, content) tuples
+            e.g. FetchEngine.fetch_all(urls); read on a background thread
+
+        Returns
+        -------
+        generator of (url, product) tuples, in the same order as pages
+        """
+
+        pending = queue.Queue(maxsize = self.queue_size)
+        stop = threading.Event()
+        finished = object()
+
+        def produce():
+            try:
+                for page in pages:
+                    # wait for room in the queue, unless the consumer has quit
+                    while not stop.is_set():
+                        try:
+                            pending.put(page, timeout = 0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+            except Exception as e:
+                logging.info(f"page producer failed: {e}")
+                pending.put(e)
+            finally:
+                if not stop.is_set():
+                    pending.put(finished)
+
+        producer = threading.Thread(target = produce, daemon = True)
+        producer.start()
+
+        # parsed results are handed back in submission order; at most
+        # 2 * n_workers pages are being parsed at any time
+        in_flight = deque()
+        max_in_flight = 2 * self.n_workers
+
+        try:
+            profiling = self.profiling or PROFILER.settings()
+            with ProcessPoolExecutor(max_workers = self.n_workers,
+                                     initializer = _init_worker,
+                                     initargs = (profiling,)) as executor:
+                while True:
+                    item = pending.get()
+                    if item is finished:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+
+                    url, content = item
+                    in_flight.append(
+                        executor.submit(parse_page, url, content, self.parser,
+                                        self.profile))
+
+                    if len(in_flight) >= max_in_flight:
+                        yield self._collect(in_flight.popleft())
+
+                while in_flight:
+                    yield self._collect(in_flight.popleft())
+        finally:
+            stop.set()
+
+
+    def _collect(self, future) -> tuple:
+        # add the worker's metrics to this process's metrics
+        url, product, worker_metrics = future.result()
+        METRICS.merge(worker_metrics)
+        return url, product
+
+
+    def parse_directory(self, directory: str):
+        """
+        Description
+        -----------
+        Parse every saved .html product page in a directory
+        (no network access is needed)
+
+        Parameters
+        ----------
+        directory: str
+
+        Returns
+        -------
+        generator of (file name, product) tuples, sorted by file name
+        """
+
+        def read_pages():
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith((".html", ".htm")):
+                    with open(os.path.join(directory, file_name), "rb") as f:
+                        yield file_name, f.read()
+
+        return self.run(read_pages())
+
+
+
+if __name__ == '__main__':
+    from writers import ProductWriter
+    import sys
+
+    # parse a directory of saved pages into ingredients.csv and products.csv
+    directory = sys.argv[1] if len(sys.argv) > 1 else "saved_pages"
+    output_directory = sys.argv[2] if len(sys.argv) > 2 else "."
+
+    with ProductWriter(output_directory) as writer:
+        for file_name, product in ParsePipeline().parse_directory(directory):
+            if product is not None:
+                writer.write(product)
@@ -1,12 +1,13 @@
+from sephora_setup import INCI_PATH, INCI_CATEGORIES_PATH, OUTPUT_DIR, OUTPUT_FORMATS
+from fetch import fetch_page
 import pandas as pd
-import requests
-import bs4
+import parsers
+import os
 
 
 def get_page():
     url = "https://eur-lex.europa.eu/legal-content/EN/TXT/?uri=CELEX:01996D0335-20060209"
-    page = requests.get(url)
-    soup = bs4.BeautifulSoup(page.content, "html.parser")
+    soup = parsers.make_soup(fetch_page(url))
     return soup
 
 
@@ -47,6 +48,9 @@ def make_ingredient_table(soup) -> pd.DataFrame:
     functions = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11"]
     inci_df[functions] = inci_df.function.str.split("/", expand = True)
 
+    # newer versions of pandas won't melt into a name that's already a column
+    inci_df = inci_df.drop(columns = "function")
+
     inci_df = pd.melt(
         inci_df,
         id_vars = ['name', "description"],
@@ -55,7 +59,7 @@ def make_ingredient_table(soup) -> pd.DataFrame:
         value_name ='function'
     )
 
-    inci_df.to_csv("data/inci_descriptions.csv", index = False)
+    inci_df.to_csv(INCI_PATH, index = False)
     return inci_df
 
 
@@ -90,11 +94,42 @@ def make_category_table(soup) -> pd.DataFrame:
         columns =['category', 'description']
     )
 
-    category_df.to_csv("data/inci_categories.csv", index = False)
+    category_df.to_csv(INCI_CATEGORIES_PATH, index = False)
     return category_df
 
 
-if __name__ == '__main__':
+def build_inci(formats: tuple = OUTPUT_FORMATS) -> pd.DataFrame:
+    """
+    Description
+    -----------
+    Download the EU INCI page and save the ingredient and category tables
+    (INCI_PATH and INCI_CATEGORIES_PATH)
+
+    Parameters
+    ----------
+    formats: tuple of str
+        if "dataset" is included, the descriptions are also written to the
+        Parquet dataset in OUTPUT_DIR
+
+    Returns
+    -------
+    inci_df: DataFrame
+    """
+
+    os.makedirs(os.path.dirname(INCI_PATH) or ".", exist_ok = True)
+    os.makedirs(os.path.dirname(INCI_CATEGORIES_PATH) or ".", exist_ok = True)
+
     soup = get_page()
     inci_df = make_ingredient_table(soup)
-    category_df = make_category_table(soup)
+    make_category_table(soup)
+
+    # one row per ingredient, with its functions as a list (see dataset.py)
+    if "dataset" in formats:
+        from dataset import write_inci, DATASET_DIRECTORY
+        write_inci(inci_df, os.path.join(OUTPUT_DIR, DATASET_DIRECTORY))
+
+    return inci_df
+
+
+if __name__ == '__main__':
+    build_inci()
@@ -0,0 +1,261 @@
+from sephora_setup import INGREDIENT_SYNONYMS
+from ingredients import split_ingredient_column
+from canonical import IngredientDictionary
+from comedogenic import ComedogenicIndex, load_index
+import pandas as pd
+import numpy as np
+
+
+def inverse_rank(ranks: np.ndarray) -> np.ndarray:
+    # the first ingredient counts fully, the second half as much, and so on
+    return 1.0 / ranks
+
+
+
+class Screener:
+    """
+    A class used to screen many raw ingredient strings for comedogenic
+    ingredients at once.
+
+    The strings are tokenized together (see split_ingredient_column), every
+    name is looked up in the dictionary, and the results are held in a sparse
+    product x ingredient matrix, so each product's score is one sparse
+    matrix-vector product:
+
+        score = sum over comedogenic ingredients of rating * rank_weight(rank)
+
+    Attributes
+    ----------
+    index: ComedogenicIndex
+    dictionary: canonical.IngredientDictionary
+        maps ingredient names (and their synonyms) to IDs; comedogenic
+        ingredients are matched by ID, so "water / aqua / eau" matches "aqua".
+        Screening only reads it: names it doesn't know are counted, but
+        never added
+    rank_weight: function
+        numpy array of ranks -> array of weights
+    default_rating: float
+        rating used for comedogenic ingredients that have no rating
+    """
+
+    def __init__(self, index: ComedogenicIndex = None,
+                 dictionary: IngredientDictionary = None,
+                 rank_weight = inverse_rank, default_rating: float = 1.0):
+
+        self.index = index if index is not None else load_index()
+        if dictionary is None:
+            dictionary = IngredientDictionary(synonyms = INGREDIENT_SYNONYMS)
+        self.dictionary = dictionary
+        self.rank_weight = rank_weight
+        self.default_rating = default_rating
+
+        ids = np.array([self.dictionary.intern(name) for name in self.index.ratings],
+                       dtype = np.int64)
+        ratings = np.array([self.default_rating if rating is None else float(rating)
+                            for rating in self.index.ratings.values()],
+                           dtype = np.float64)
+
+        # a frozen dictionary gives -1 for names it doesn't know; those can't
+        # appear in a screened list either (see _encode), so they are left out
+        known = ids >= 0
+        self._ratings = np.zeros(len(self.dictionary), dtype = np.float64)
+        self._ratings[ids[known]] = ratings[known]
+
+
+    def _rating_vector(self) -> np.ndarray:
+        # names seen since the last call are not comedogenic, so pad with 0
+        missing = len(self.dictionary) - len(self._ratings)
+        if missing > 0:
+            self._ratings = np.concatenate([self._ratings, np.zeros(missing)])
+        return self._ratings
+
+
+    def matrix(self, raw_ingredients):
+        """
+        Description
+        -----------
+        Tokenize raw ingredient strings into a sparse product x ingredient
+        matrix holding each ingredient's rank (0 where a product doesn't
+        contain it); names the dictionary doesn't know are left out
+
+        Parameters
+        ----------
+        raw_ingredients: list or pandas Series of str
+            one raw ingredient string per product (missing values allowed)
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix of shape (products, len(dictionary))
+        """
+
+        return self._encode(raw_ingredients)[0]
+
+
+    def _encode(self, raw_ingredients) -> tuple:
+        # (matrix, number of names in each product the dictionary doesn't know)
+        import scipy.sparse as sparse
+
+        raw_ingredients = pd.Series(raw_ingredients).reset_index(drop = True)
+        long = split_ingredient_column(raw_ingredients)
+
+        # look names up without adding them, so screening free text
+        # never grows the dictionary (or the matrix's columns)
+        encoded = self.dictionary.encode(long.rename_axis("product").reset_index(),
+                                         add_new = False)
+        rows = encoded["product"].to_numpy()
+        ids = encoded["ingredient_id"].to_numpy()
+        ranks = encoded["rank"].to_numpy()
+
+        unknown = ids < 0
+        n_unknown = np.bincount(rows[unknown], minlength = len(raw_ingredients))
+        rows, ids, ranks = rows[~unknown], ids[~unknown], ranks[~unknown]
+
+        # "water" and "aqua" in one list share an ID: keep the first rank
+        # (building the matrix would otherwise add the two ranks together)
+        first = ~pd.DataFrame({"row": rows, "id": ids}).duplicated().to_numpy()
+
+        matrix = sparse.csr_matrix(
+            (ranks[first], (rows[first], ids[first])),
+            shape = (len(raw_ingredients), len(self.dictionary)))
+        return matrix, n_unknown
+
+
+    def score(self, raw_ingredients) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Screen a batch of raw ingredient strings
+
+        Parameters
+        ----------
+        raw_ingredients: list or pandas Series of str
+            one raw ingredient string per product
+
+        Returns
+        -------
+        DataFrame (one row per input string, with the input's index) with:
+            n_ingredients: number of distinct ingredients
+            n_comedogenic: number of comedogenic ingredients
+            first_comedogenic: rank of the first comedogenic ingredient (0 if none)
+            max_rating: highest comedogenic rating (0 if none)
+            score: rank-weighted sum of comedogenic ratings
+        """
+
+        index = raw_ingredients.index if isinstance(raw_ingredients, pd.Series) else None
+        ranks, n_unknown = self._encode(raw_ingredients)
+        ratings = self._rating_vector()
+
+        weights = ranks.copy()
+        weights.data = self.rank_weight(weights.data.astype(np.float64))
+
+        # keep only the comedogenic entries for the per-product summaries
+        comedogenic = ranks.multiply(ratings > 0).tocsr()
+        comedogenic.eliminate_zeros()
+        rated = comedogenic.copy()
+        rated.data = ratings[comedogenic.indices]
+
+        first = np.zeros(ranks.shape[0], dtype = np.int64)
+        has_any = np.diff(comedogenic.indptr) > 0
+        if has_any.any():
+            first[has_any] = np.minimum.reduceat(
+                comedogenic.data, comedogenic.indptr[:-1][has_any])
+
+        return pd.DataFrame({
+            "n_ingredients": np.diff(ranks.indptr) + n_unknown,
+            "n_comedogenic": np.diff(comedogenic.indptr),
+            "first_comedogenic": first,
+            "max_rating": rated.max(axis = 1).toarray().ravel(),
+            "score": weights @ ratings
+        }, index = index)
+
+
+    def screen_file(self, path: str, column: str = None, chunk_size: int = 10000,
+                    output: str = None):
+        """
+        Description
+        -----------
+        Screen a file of raw ingredient strings in chunks, so memory use
+        depends on chunk_size rather than on the size of the file
+
+        Parameters
+        ----------
+        path: str
+            a .csv (with the strings in `column`), or a text file with
+            one raw ingredient string per line (if column is None)
+        column: str
+            e.g. "raw ingredients" for the products table of a crawl
+        chunk_size: int
+            number of strings screened at once
+        output: str
+            if given, every chunk's scores are appended to this .csv
+
+        Returns
+        -------
+        generator of DataFrames (as returned by score), one per chunk,
+        indexed by line number in the input (0 = first string)
+        """
+
+        if output:
+            open(output, "w").close()
+
+        for n_chunk, chunk in enumerate(_read_chunks(path, column, chunk_size)):
+            scores = self.score(chunk)
+            if output:
+                scores.to_csv(output, mode = "a", header = n_chunk == 0,
+                              index_label = "row")
+            yield scores
+
+
+
+def _read_chunks(path: str, column: str, chunk_size: int):
+    # Series of raw strings, chunk by chunk, indexed by position in the file
+    if column is not None:
+        for chunk in pd.read_csv(path, usecols = [column], chunksize = chunk_size):
+            yield chunk[column]
+        return
+
+    with open(path, encoding = "utf-8") as f:
+        lines = []
+        start = 0
+        for line in f:
+            lines.append(line.rstrip("\n"))
+            if len(lines) == chunk_size:
+                yield pd.Series(lines, index = range(start, start + len(lines)))
+                start += len(lines)
+                lines = []
+        if lines:
+            yield pd.Series(lines, index = range(start, start + len(lines)))
+
+
+def screen(raw_ingredients, index: ComedogenicIndex = None) -> pd.DataFrame:
+    """
+    Description
+    -----------
+    Batch version of comedogenic(): screen many raw ingredient strings at once
+    e.g. screen(["Water, Isopropyl Myristate, Glycerin", "Aqua, Coconut Oil"])
+
+    Parameters
+    ----------
+    raw_ingredients: list or pandas Series of str
+    index: ComedogenicIndex
+        defaults to the index loaded from COMEDOGENIC_PATH
+
+    Returns
+    -------
+    DataFrame (see Screener.score)
+    """
+
+    return Screener(index).score(raw_ingredients)
+
+
+def main(argv: list = None):
+    # the arguments are parsed by cli.py, so `screen --help` needn't import pandas
+    import cli
+    import sys
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    return cli.main(["screen"] + argv)
+
+
+if __name__ == '__main__':
+    main()
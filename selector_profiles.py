@@ -0,0 +1,320 @@
+from sephora_setup import (SELECTOR_PROFILES, MIN_SELECTOR_COVERAGE,
+                           REQUIRED_FIELDS)
+from structured_data import embedded_product, format_price
+from locator import default_locator
+from collections import Counter
+from bs4 import NavigableString
+import parsers
+import logging
+import re
+
+# the product page selectors are generated class names, which change whenever
+# the site redeploys. This module checks them against a sample of pages before
+# a crawl (so a stale set fails in seconds rather than after hours of empty
+# records), falls back to the page's structured data (schema.org JSON-LD and
+# microdata) for fields the classes miss, and can derive a new set of classes
+# from pages that have structured data
+
+
+# schema.org property -> field, for microdata (itemprop attributes)
+MICRODATA_PROPERTIES = {"name": "name", "brand": "brand", "price": "price",
+                        "category": "product_type", "description": "description"}
+
+# every field a profile holds (the PRODUCT_FIELDS plus "details")
+PROFILE_FIELDS = tuple(parsers.DEFAULT_PROFILE)
+
+
+
+class SelectorError(Exception):
+    """
+    Raised when no selector profile can extract the required fields
+    from a sample of product pages
+    """
+
+
+
+# ---------------------------- < STRUCTURED DATA > ---------------------------- #
+def structured_fields(content) -> dict:
+    """
+    Description
+    -----------
+    Read product fields from a page's structured data rather than its class
+    names: the embedded JSON first (see structured_data.py), then microdata
+
+    Parameters
+    ----------
+    content: bytes or str
+        raw html of a product page
+
+    Returns
+    -------
+    fields: dict
+        any of "name", "brand", "price", "product_type", "description"
+        and "ingredients" that the page has
+    """
+
+    fields = microdata_fields(content)
+    fields.update(embedded_product(content))
+    return fields
+
+
+def microdata_fields(content) -> dict:
+    """
+    Description
+    -----------
+    Read product fields from a page's schema.org microdata (itemprop attributes)
+
+    Parameters
+    ----------
+    content: bytes or str
+        raw html of a product page
+
+    Returns
+    -------
+    fields: dict
+        any of "name", "brand", "price", "product_type" and "description"
+        that the page has (prices are formatted like the page's, e.g. "$78.00")
+    """
+
+    soup = parsers.make_soup(content)
+    fields = {}
+
+    for prop, field in MICRODATA_PROPERTIES.items():
+        found = soup.find(attrs = {"itemprop": prop})
+        if found is None:
+            continue
+
+        value = found.get("content") or found.get_text(" ", strip = True)
+        if prop == "price":
+            currency = soup.find(attrs = {"itemprop": "priceCurrency"})
+            value = format_price(value, currency and currency.get("content"))
+        if value:
+            fields[field] = value
+
+    return fields
+
+
+# ------------------------------- < PROFILES > -------------------------------- #
+def profile_coverage(pages: list, profile: dict, backend: str = None) -> dict:
+    """
+    Description
+    -----------
+    Measure how well a selector profile works on a sample of product pages
+
+    Parameters
+    ----------
+    pages: list of bytes or str
+        raw html of product pages
+    profile: dict
+        field -> (tag, class), see SELECTOR_PROFILES
+    backend: str
+        one of parsers.BACKENDS
+
+    Returns
+    -------
+    coverage: dict
+        field -> share of pages (0 to 1) on which the field was found
+    """
+
+    found = Counter()
+    for content in pages:
+        fields = parsers.extract_product_fields(content, backend, profile)
+        found.update(field for field, value in fields.items() if value)
+
+    return {field: found[field] / len(pages) if pages else 0.0
+            for field in profile}
+
+
+def choose_profile(pages: list, profiles: dict = None, backend: str = None,
+                   min_coverage: float = MIN_SELECTOR_COVERAGE,
+                   required: tuple = REQUIRED_FIELDS, locator = None) -> tuple:
+    """
+    Description
+    -----------
+    Pick the first selector profile that finds every required field on at
+    least min_coverage of a sample of product pages, or derive a new one
+    from the pages' structured data (see heal_profile)
+
+    Parameters
+    ----------
+    pages: list of bytes or str
+        raw html of a sample of product pages
+    profiles: dict
+        name -> profile, newest first (defaults to SELECTOR_PROFILES)
+    backend: str
+        one of parsers.BACKENDS
+    min_coverage: float
+    required: tuple of str
+        fields that must be found
+    locator: IngredientLocator
+        passed to heal_profile
+
+    Returns
+    -------
+    (name, profile), where name is "healed" for a derived profile
+
+    Raises
+    ------
+    SelectorError if no profile works
+    """
+
+    assert pages, "need at least one sample page"
+    profiles = SELECTOR_PROFILES if profiles is None else profiles
+
+    def works(profile):
+        coverage = profile_coverage(pages, profile, backend)
+        return all(coverage.get(f, 0.0) >= min_coverage for f in required), coverage
+
+    report = {}
+    for name, profile in profiles.items():
+        ok, report[name] = works(profile)
+        if ok:
+            return name, profile
+
+    healed = heal_profile(pages, min_coverage = min_coverage, required = required,
+                          locator = locator)
+    if healed is not None:
+        ok, report["healed"] = works(healed)
+        if ok:
+            logging.info(f"selector profiles {list(profiles)} are out of date, "
+                         f"using healed profile {healed}")
+            return "healed", healed
+
+    summary = "; ".join(
+        f"{name}: " + ", ".join(f"{f} {coverage.get(f, 0.0):.0%}" for f in required)
+        for name, coverage in report.items())
+    raise SelectorError(f"no selector profile finds {', '.join(required)} on "
+                        f"{min_coverage:.0%} of {len(pages)} sample pages ({summary}); "
+                        f"the site's class names have probably changed, "
+                        f"add a new profile to SELECTOR_PROFILES")
+
+
+def heal_profile(pages: list, min_coverage: float = MIN_SELECTOR_COVERAGE,
+                 required: tuple = REQUIRED_FIELDS, locator = None) -> dict:
+    """
+    Description
+    -----------
+    Work out a selector profile from pages that have structured data:
+    each field's (tag, class) is the innermost element whose text matches
+    the structured value, and the details sections are the sibling elements
+    (sharing a tag and class) one of which holds an ingredient list (found
+    with the locator, which must have an ingredient dictionary).
+    Classes are voted on across pages, and fields that can't be worked out
+    (e.g. the page's structured data has no category) keep their selector
+    from the newest of SELECTOR_PROFILES
+
+    Parameters
+    ----------
+    pages: list of bytes or str
+        raw html of product pages
+    min_coverage: float
+        a selector must be voted for by this share of pages
+    required: tuple of str
+        fields that must be worked out
+    locator: IngredientLocator
+        used to recognise the ingredient list (defaults to default_locator());
+        without a dictionary, "details" can't be worked out
+
+    Returns
+    -------
+    profile: dict, or None if a required field can't be worked out
+    """
+
+    locator = locator or default_locator()
+    votes = {field: Counter() for field in PROFILE_FIELDS}
+
+    # without the INCI names almost any block of text passes for the
+    # ingredients (see IngredientLocator), so the details class is only
+    # worked out with them
+    find_details = locator.dictionary is not None
+    if not find_details:
+        logging.warning("no ingredient dictionary loaded: the details selector "
+                        "can't be worked out from the pages")
+
+    for content in pages:
+        known = structured_fields(content)
+        soup = parsers.make_soup(content)
+
+        for field in votes:
+            if field == "details":
+                selector = _details_selector(soup, locator) if find_details else None
+            elif field in known:
+                selector = _field_selector(soup, field, known[field])
+            else:
+                selector = None
+            if selector is not None:
+                votes[field][selector] += 1
+
+    profile = dict(next(iter(SELECTOR_PROFILES.values())))
+    for field, counts in votes.items():
+        selector, n_votes = (counts.most_common(1) or [(None, 0)])[0]
+        if n_votes >= min_coverage * len(pages):
+            profile[field] = selector
+        elif field in required:
+            return None
+    return profile
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _numbers(text: str) -> list:
+    return [float(n) for n in re.findall(r"\d+(?:\.\d+)?", text.replace(",", ""))]
+
+
+def _matches(field: str, text: str, value: str) -> bool:
+    text = _normalize(text)
+    if field == "price": # e.g. "$78.00" on the page, "78.00" in the data
+        amounts = _numbers(value)
+        return bool(amounts) and len(text) < 40 and amounts[0] in _numbers(text)
+    return text == _normalize(value)
+
+
+def _field_selector(soup, field: str, value: str) -> tuple:
+    # the innermost classed element whose text is the field's value, and
+    # which is also the first element in the page with that tag and class
+    matches = [tag for tag in soup.find_all(class_ = True)
+               if tag.name not in ("script", "style", "meta")
+               and _matches(field, tag.get_text(), value)]
+
+    for tag in reversed(matches): # descendants come after their ancestors
+        for class_tag in tag.get("class", []):
+            if soup.find(tag.name, class_ = class_tag) is tag:
+                return tag.name, class_tag
+    return None
+
+
+def _details_selector(soup, locator) -> tuple:
+    # a group of sibling elements with the same tag and class, one of which
+    # (usually the third, after description and usage) holds the ingredients.
+    # The ingredient list is located once, in the whole page, and only the
+    # elements holding it are candidates (outermost first, as they come in
+    # the page)
+    ingredients = locator.locate(soup.body or soup)
+    holder = _holder(soup, ingredients) if ingredients else None
+    if holder is None:
+        return None
+
+    for tag in reversed([holder] + list(holder.parents)):
+        for class_tag in tag.get("class", []):
+            group = soup.find_all(tag.name, class_ = class_tag)
+            if 1 < len(group) <= 6 and len({id(t.parent) for t in group}) == 1:
+                return tag.name, class_tag
+    return None
+
+
+def _holder(soup, text: str):
+    # the innermost element holding a block of text: a block is the strings
+    # between block tags joined together, so it starts with one of them
+    best, best_depth = None, -1
+    for string in soup.find_all(string = True):
+        start = string.strip()
+        if type(string) is not NavigableString or not start or not text.startswith(start):
+            continue
+
+        holder = next((tag for tag in string.parents if text in tag.get_text()), None)
+        depth = len(list(holder.parents)) if holder is not None else -1
+        if depth > best_depth:
+            best, best_depth = holder, depth
+    return best
@@ -1,35 +1,63 @@
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium import webdriver
-from sephora_setup import *
-import pandas as pd
-import requests
+from listing import get_listing_links
+from metrics import METRICS, PROFILER
+from sephora_setup import (BASE_URL, CACHE_DIR, CACHE_TTL, CACHE_MAX_BYTES,
+                           CHECKPOINT_PATH, OUTPUT_DIR, OUTPUT_FORMATS,
+                           OUTPUT_BATCH_SIZE, PRODUCT_CATEGORY_CLASS,
+                           PRODUCT_LINK_CLASS, NEXT_PAGE_CLASS, SIGNUP_CLOSE_CLASS,
+                           EXCLUDE_SUBCATEGORIES, LISTING_BACKEND, BROWSER_POOL_SIZE,
+                           METRICS_PATH, PROFILE_SAMPLE_EVERY, PROFILE_DIR,
+                           PROFILE_PYINSTRUMENT,
+                           PARSER_BACKEND, PARSE_WORKERS, INDEX_PATH,
+                           SELECTOR_SAMPLE_SIZE)
+from http_client import HttpClient, get_client, set_client
+from http_cache import ResponseCache
+from checkpoint import CheckpointStore
+from writers import (ProductWriter, TABLE_COLUMNS, DICTIONARY_FILE, product_rows,
+                     load_dictionary)
+import parsers
+from ingredients import split_ingredients
+from locator import IngredientLocator, default_locator
+from pipeline import ParsePipeline
+from fetch import FetchEngine, get_engine, fetch_page
+from selector_profiles import SelectorError, choose_profile, microdata_fields
+from structured_data import embedded_product
 import logging
-import time
-import bs4
 import re
 import os
 
-# to do: come up with a better method than 10 commas :-)
-# this misses short INCI lists entirely
-# idea: keep going to the next sibling until we reach the bottom
-# if the bottom has the "clean @ sephora" stuff or whatever
-# go one above that
-# the INCI list is almost always the last thing that contains a fair amount of commas
-
-# to do: figure out why the scrolling only seems to work for the first subcategory
-# maybe i need to close the browser thing entirely each time instead of using the cached one?
+# selenium (browsers.py), pandas and numpy (inverted_index.py) are imported
+# where they are used, so importing this module for parsing stays cheap
 
 # to do: add ratings to product info
 
-def get_sephora_products():
+def get_sephora_products(use_cache: bool = True,
+                         checkpoint_path: str = CHECKPOINT_PATH,
+                         max_age: float = None):
     """
     Description
     -----------
     Main function to pull info from sephora.com, format it, and save it
 
+    Parameters
+    ----------
+    use_cache: bool
+        if true, keep downloaded pages in CACHE_DIR and only re-download
+        pages that are older than CACHE_TTL and have changed on the server
+    checkpoint_path: str
+        SQLite file where each product is saved as soon as it is processed;
+        a restarted crawl skips products already saved there
+        (None to disable checkpointing)
+    max_age: float
+        incremental mode: also re-fetch saved products that were processed
+        more than max_age seconds ago (None to never re-fetch saved products)
+
     Returns
     -------
-    Saves ingredients.csv and products.csv
+    Saves ingredients.csv and products.csv (plus .parquet files if
+    "parquet" is in OUTPUT_FORMATS, and a partitioned Parquet dataset if
+    "dataset" is) and the ingredient IDs' synonym table to OUTPUT_DIR,
+    the updated ingredient index to INDEX_PATH,
+    and crawl metrics to METRICS_PATH
     """
 
     # set up logging
@@ -39,8 +67,29 @@ def get_sephora_products():
                         datefmt = "%d-%b-%y %H:%M:%S'",
                         level = logging.INFO)
 
+    # profile a sample of product pages, if PROFILE_SAMPLE_EVERY is set
+    PROFILER.configure(PROFILE_SAMPLE_EVERY, PROFILE_DIR, PROFILE_PYINSTRUMENT)
+
+    if use_cache:
+        cache = ResponseCache(CACHE_DIR, ttl = CACHE_TTL, max_bytes = CACHE_MAX_BYTES)
+        set_client(HttpClient(cache = cache))
+
+    checkpoint = CheckpointStore(checkpoint_path) if checkpoint_path else None
+
+    # every finished product is also added to the ingredient -> products index
+    from inverted_index import InvertedIndex
+    index = InvertedIndex.load(INDEX_PATH)
+
+    # products are written out in batches as they are parsed, rather than
+    # held in memory until the end of the crawl (with the index's ingredient IDs)
+    writer = ProductWriter(OUTPUT_DIR, formats = OUTPUT_FORMATS,
+                           batch_size = OUTPUT_BATCH_SIZE,
+                           dictionary = index.dictionary)
+
     # create instance of Sephora class
-    sephora = Sephora()
+    sephora = Sephora(checkpoint = checkpoint, writer = writer,
+                      keep_products = False, parser = PARSER_BACKEND,
+                      index = index)
 
     # get links to all the subcategory pages
     #for subcategory in SUBCATEGORIES:
@@ -48,32 +97,103 @@ def get_sephora_products():
     sephora.get_subcategory_links("skincare")
     n_subcategories = len(sephora.subcategory_links)
     logging.info(f"found {n_subcategories} subcategories\n\n")
+    if n_subcategories == 0:
+        raise SelectorError(f"no subcategory links ({PRODUCT_CATEGORY_CLASS}) found; "
+                            f"the site's class names have probably changed")
 
     # for each subcategory page, get links to all product pages
     for i, subcategory in enumerate(sephora.subcategory_links):
         logging.info(f"getting product links for subcategory {i+1}/{n_subcategories} -> {subcategory}")
-        sephora.get_product_links(subcategory, testing = True)
+        sephora.get_product_links(subcategory)
 
     n_products = len(sephora.product_links)
     logging.info(f"found {n_products} products\n\n")
+    if n_products == 0:
+        raise SelectorError(f"no product links ({PRODUCT_LINK_CLASS}) found; "
+                            f"the site's class names have probably changed")
 
-    # for each product page, get all product information
-    for i, product in enumerate(sephora.product_links):
-        logging.info(f"getting product info for product {i+1}/{n_products}")
-        sephora.get_product_info(product)
+    # check the product page selectors on a few pages before crawling them all
+    sephora.check_selectors(sorted(sephora.product_links))
 
-    # create and save dataframes
-    ingredient_table = make_dataframe(
-        product_info = sephora.product_info,
-        table_type = "ingredients"
-    )
+    # for each product page, get all product information
+    # (sorted so that product_info comes out in the same order every run)
+    sephora.get_product_infos(sorted(sephora.product_links), max_age = max_age,
+                              pipeline = ParsePipeline(n_workers = PARSE_WORKERS,
+                                                       parser = PARSER_BACKEND,
+                                                       profile = sephora.profile))
 
-    product_table = make_dataframe(
-        product_info = sephora.product_info,
-        table_type = "products"
-    )
+    # write out the last partial batches
+    writer.close()
+    sephora.close()
+    index.save(INDEX_PATH)
 
     logging.info(f"missing inci for {sephora.missing_products} products")
+    logging.info(f"http summary: {get_client().summary()}")
+
+    # time spent in each stage, bytes fetched, cache hits, and failures
+    METRICS.to_json(METRICS_PATH)
+
+
+
+def parse_saved_pages(directory: str, output_dir: str = OUTPUT_DIR,
+                      formats: tuple = OUTPUT_FORMATS, parser: str = PARSER_BACKEND,
+                      n_workers: int = PARSE_WORKERS) -> int:
+    """
+    Description
+    -----------
+    Parse product pages that were saved to disk (e.g. corpus/site/product)
+    and write the output tables, without fetching anything
+
+    Parameters
+    ----------
+    directory: str
+        searched recursively for .html files; each is taken to be the
+        page at BASE_URL + "product/" + its file name (without .html)
+    output_dir: str
+    formats: tuple of str
+        see OUTPUT_FORMATS
+    parser: str
+        html parser backend, one of parsers.BACKENDS
+    n_workers: int
+        number of parsing processes (None for one per cpu core, 0 to
+        parse on this thread)
+
+    Returns
+    -------
+    number of products written
+    """
+
+    paths = sorted(os.path.join(root, name)
+                   for root, _, names in os.walk(directory)
+                   for name in names if name.endswith(".html"))
+
+    def saved_pages():
+        for path in paths:
+            with open(path, "rb") as f:
+                content = f.read()
+            name = os.path.splitext(os.path.basename(path))[0]
+            yield BASE_URL + "product/" + name, content
+
+    writer = ProductWriter(output_dir, formats = formats,
+                           batch_size = OUTPUT_BATCH_SIZE)
+    sephora = Sephora(writer = writer, keep_products = False, parser = parser)
+
+    if n_workers == 0:
+        parsed = ((url, sephora.parse_product_page(url, content))
+                  for url, content in saved_pages())
+    else:
+        parsed = ParsePipeline(n_workers = n_workers, parser = parser).run(saved_pages())
+
+    n_products = 0
+    for url, product in parsed:
+        if product is not None:
+            sephora.add_product(product)
+            n_products += 1
+
+    writer.close()
+    logging.info(f"parsed {n_products} products from {len(paths)} saved pages "
+                 f"({sephora.missing_products} missing inci)")
+    return n_products
 
 
 
@@ -93,9 +213,46 @@ class Sephora:
         links to product pages (found on category pages)
     product_info: list of dict
         dictionary for each product
+    base_url: str
+        root url that all links are relative to
+        (point this at a local server to crawl saved pages)
+    checkpoint: CheckpointStore
+        if given, every processed product is saved here immediately
+    writer: ProductWriter
+        if given, every product is streamed to the output tables
+    keep_products: bool
+        if false, products are not collected in self.product_info
+        (use with a writer to keep memory flat on large crawls)
+    parser: str
+        html parser backend, one of parsers.BACKENDS
+        (None picks the fastest installed bs4-compatible backend)
+    browser_pool: BrowserPool
+        headless browsers shared by every get_product_links call
+        (started on first use)
+    locator: IngredientLocator
+        finds the ingredient list in a product's details
+        (None for default_locator(), which knows the EU INCI names if
+        they have been downloaded)
+    index: InvertedIndex
+        if given, every product is added to this ingredient -> products index
+    profile: dict
+        selectors for the fields of a product page: field -> (tag, class)
+        (None for the newest of SELECTOR_PROFILES; see check_selectors)
     """
 
-    def __init__(self):
+    def __init__(self, base_url: str = BASE_URL, checkpoint: CheckpointStore = None,
+                 writer: ProductWriter = None, keep_products: bool = True,
+                 parser: str = None, locator: IngredientLocator = None,
+                 index: "InvertedIndex" = None, profile: dict = None):
+        self.base_url = base_url
+        self.parser = parser or parsers.default_backend()
+        self.profile = profile
+        self.locator = locator or default_locator()
+        self.index = index
+        self.browser_pool = None
+        self.checkpoint = checkpoint
+        self.writer = writer
+        self.keep_products = keep_products
         self.subcategory_links = []
         self.product_links = set()
         self.product_info = []
@@ -125,9 +282,10 @@ class Sephora:
             "category_name must be 'skincare' or 'makeup-cosmetics'")
 
         subcategories = search_url(
-            url = BASE_URL + "shop/" + category_name,
+            url = self.base_url + "shop/" + category_name,
             class_type = "a",
-            class_tag = PRODUCT_CATEGORY_CLASS
+            class_tag = PRODUCT_CATEGORY_CLASS,
+            backend = self.parser
         )
 
         # get the links
@@ -137,18 +295,22 @@ class Sephora:
         self.subcategory_links += links
 
 
-    def get_product_links(self, subcategory_link: str, testing: bool = False):
+    def get_product_links(self, subcategory_link: str, testing: bool = False,
+                          listing: str = LISTING_BACKEND):
         """
         Description
         -----------
-        TODO: click "next page" and continue
-        (this currently grabs first 200 products by scrolling,
-         but there are still more pages) --> next page button is css-a8wls9
-
         Get links to every product on a given subcategory page
 
+        With listing = "json", links are read from the product data the
+        page embeds as JSON, fetching every page of the listing in parallel
+        (see listing.py). Otherwise, or if the page has no embedded data:
+
         Subcategory pages load as you scroll – this function uses
-        selenium to handle this. Scrolling code was adapted from:
+        selenium to handle this (see browsers.py). Each page of results is
+        scrolled until no new content loads, then the "next page" button
+        (NEXT_PAGE_CLASS) is followed until there are no more pages.
+        Scrolling code was originally adapted from:
         https://michaeljsanders.com/2017/05/12/scrapin-and-scrollin.html
 
         Parameters
@@ -156,59 +318,110 @@ class Sephora:
         subcategory_link: str
             link suffix for a subcategory page, e.g. "/shop/cleanser"
         testing: bool
-            if true, skip the scrolling code and only search the top of the page
+            if true, pages without embedded data are not scrolled: only
+            the top of the page is searched
+        listing: str
+            "json" to try the embedded JSON first, "browser" to always
+            render the page
 
         Returns
         -------
         Updates self.product_links with links for the specified subcategory
         """
 
+        assert listing in ["json", "browser"], "listing must be 'json' or 'browser'"
+
+        if listing == "json":
+            links = get_listing_links(self.base_url + subcategory_link)
+            if links is not None:
+                self.product_links.update(links)
+                return
+
         if testing:
             products = search_url(
-                url = BASE_URL + subcategory_link,
+                url = self.base_url + subcategory_link,
                 class_type = "a",
-                class_tag = PRODUCT_LINK_CLASS
+                class_tag = PRODUCT_LINK_CLASS,
+                backend = self.parser
             )
 
         else:
-            # setup for scrolling
-            browser = webdriver.Chrome(ChromeDriverManager().install())
-            browser.get(BASE_URL + subcategory_link + "?pageSize=300")
+            from browsers import BrowserPool, collect_pages
+
+            if self.browser_pool is None:
+                self.browser_pool = BrowserPool(size = BROWSER_POOL_SIZE)
+
+            # scroll through every page of results, closing the
+            # "Sign up for Sephora" box if it's there
+            with self.browser_pool.session() as browser:
+                page_sources = collect_pages(
+                    browser,
+                    url = self.base_url + subcategory_link + "?pageSize=300",
+                    link_class = PRODUCT_LINK_CLASS,
+                    next_page_class = NEXT_PAGE_CLASS,
+                    dismiss_class = SIGNUP_CLOSE_CLASS
+                )
 
-            # close the "Sign up for Sephora" box if it's there
-            try:
-                browser.find_element_by_class_name("css-wuwqem").click();
-            except:
-                pass
+            # use BeautifulSoup to search for the product links
+            products = []
+            for source_code in page_sources:
+                products += parsers.find_all_in_page(
+                    source_code, "a", PRODUCT_LINK_CLASS, backend = self.parser)
 
-            # scroll to the bottom, wait 2 seconds, continue until done
-            get_length_of_page = """
-                window.scrollTo(0, document.body.scrollHeight);
-                var lenOfPage = document.body.scrollHeight;
-                return lenOfPage;"""
+        links = set([c["href"] for c in products])
+        logging.info(f"{len(links)} products found\n")
+        self.product_links.update(links) # append to set
 
-            length_of_page = browser.execute_script(get_length_of_page)
 
-            finished = False
-            while not finished:
-                last_count = length_of_page
-                time.sleep(5)
-                length_of_page = browser.execute_script(get_length_of_page)
-                if last_count == length_of_page:
-                    finished = True
 
-            # now we can grab the full source code
-            source_code = browser.page_source
-            browser.close()
+    def close(self):
+        """
+        Description
+        -----------
+        Shut down any browsers started by get_product_links
+        """
 
-            # use BeautifulSoup to search for the product links
-            soup = bs4.BeautifulSoup(source_code, "html.parser")
-            products = soup.find_all("a", class_ = PRODUCT_LINK_CLASS)
+        if self.browser_pool is not None:
+            self.browser_pool.close()
+            self.browser_pool = None
 
-        links = set([c["href"] for c in products])
-        logging.info(f"{len(links)} products found\n")
-        self.product_links.update(links) # append to set
 
+    def check_selectors(self, product_links: list,
+                        sample_size: int = SELECTOR_SAMPLE_SIZE) -> str:
+        """
+        Description
+        -----------
+        Check the product page selectors on a sample of product pages spread
+        across product_links, and use the first of SELECTOR_PROFILES that
+        works (or one healed from the pages' structured data)
+
+        Parameters
+        ----------
+        product_links: list of str
+            link suffixes for product pages
+        sample_size: int
+
+        Returns
+        -------
+        name of the chosen profile (sets self.profile)
+
+        Raises
+        ------
+        SelectorError if no profile works, or none of the sample downloaded
+        """
+
+        step = max(1, len(product_links) // sample_size)
+        urls = [self.base_url + link for link in product_links[::step][:sample_size]]
+        pages = [content for _, content in get_engine().fetch_all(urls)
+                 if content is not None]
+
+        if not pages:
+            raise SelectorError(f"none of {len(urls)} sample product pages downloaded")
+
+        name, self.profile = choose_profile(pages, backend = self.parser,
+                                            locator = self.locator)
+        logging.info(f"using selector profile {name} ({len(pages)} sample pages)")
+        return name
 
 
     def get_product_info(self, product_link: str):
@@ -228,78 +441,176 @@ class Sephora:
         Updates self.product_info with a dictionary for the specified product
         """
 
-        # grab the page
-        url = BASE_URL + product_link
-        page = requests.get(url)
-        soup = bs4.BeautifulSoup(page.content, 'html.parser')
+        # grab the page (raises FetchError rather than parsing an error page)
+        url = self.base_url + product_link
+        record = self.parse_product_page(url, fetch_page(url))
+        self.save_product(url, record)
 
-        # find product info
-        name = self.safely_find(
-            soup = soup,
-            tag = "span",
-            class_tag = NAME_CLASS
-        )
+
+    def get_product_infos(self, product_links: list, engine: FetchEngine = None,
+                          max_age: float = None, pipeline: ParsePipeline = None):
+        """
+        Description
+        -----------
+        Get product info for many products, downloading the pages concurrently
+
+        Results are added to self.product_info in the same order as
+        product_links, regardless of the order the downloads finish in.
+        If self.checkpoint is set, products it already holds are not fetched
+        again, and their saved records are used instead
+
+        Parameters
+        ----------
+        product_links: list of str
+            link suffixes for product pages
+        engine: FetchEngine
+            controls concurrency, rate limiting, and retries
+            (the shared engine from fetch.get_engine if none is given)
+        max_age: float
+            re-fetch checkpointed products older than this many seconds
+        pipeline: ParsePipeline
+            if given, pages are parsed by its pool of worker processes
+            instead of on this thread
+
+        Returns
+        -------
+        Updates self.product_info with a dictionary for each product
+        """
+
+        if engine is None:
+            engine = get_engine()
+
+        all_urls = [self.base_url + link for link in product_links]
+        urls = all_urls
+
+        if self.checkpoint:
+            completed = self.checkpoint.completed_links(max_age = max_age)
+            urls = [url for url in all_urls if url not in completed]
+            logging.info(f"{len(all_urls) - len(urls)} products already checkpointed")
+
+        n_products = len(urls)
+
+        def downloaded_pages():
+            for i, (url, content) in enumerate(engine.fetch_all(urls)):
+                logging.info(f"getting product info for product {i+1}/{n_products}")
+
+                # failed downloads are not saved, so they are retried next run
+                if content is None:
+                    logging.info(f"failed to download {url}")
+                    continue
+
+                yield url, content
+
+        if pipeline is not None:
+            parsed = pipeline.run(downloaded_pages())
+        else:
+            parsed = ((url, self.parse_product_page(url, content))
+                      for url, content in downloaded_pages())
+
+        for url, record in parsed:
+            self.save_product(url, record)
+
+        # the checkpoint holds every finished product (including ones from
+        # earlier runs), so output is produced from it in product_links order
+        if self.checkpoint is not None:
+            for record in self.checkpoint.records(all_urls):
+                self.add_product(record)
+
+
+    @PROFILER.profiled("get_product_info")
+    @METRICS.timed("get_product_info")
+    def parse_product_page(self, url: str, content: bytes):
+        """
+        Description
+        -----------
+        Parse the html of a product page that has already been downloaded
+
+        Fields are read from the JSON the page embeds where it has them,
+        and otherwise from the html with the selector profile (and then
+        from the page's microdata)
+
+        Parameters
+        ----------
+        url: str
+            full url of the product page
+        content: bytes
+            raw html of the product page
+
+        Returns
+        -------
+        product: dict, or None if the product is a kit/set
+        """
+
+        # the JSON the page embeds (JSON-LD or page state) is read with a
+        # byte scan, and a tree is only built for the fields it doesn't have
+        fields = embedded_product(content)
+
+        profile = self.profile or parsers.DEFAULT_PROFILE
+        missing = {field: selector for field, selector in profile.items()
+                   if field != "details" and not fields.get(field)}
+        if not fields.get("ingredients"):
+            missing["details"] = profile["details"]
+
+        if not missing:
+            METRICS.increment("embedded_fast_path")
+        else:
+            found = parsers.extract_product_fields(content, backend = self.parser,
+                                                   profile = missing)
+            fields.update((field, value) for field, value in found.items() if value)
+
+            # then the page's microdata, for anything the selectors missed
+            if not all(fields.get(field) for field in missing):
+                microdata = microdata_fields(content)
+                if microdata:
+                    METRICS.increment("structured_fallbacks")
+                for field, value in microdata.items():
+                    fields.setdefault(field, value)
+
+        name = fields.get("name")
 
         logging.info(name)
 
         # skip kits/sets of products
         kit_pattern = re.compile(r"\sset\s|\skit\s", re.IGNORECASE)
 
-        if kit_pattern.search(name):
+        if name and kit_pattern.search(name):
             logging.info(f"skipping set: {name}")
             return None
 
-        brand = self.safely_find(
-            soup = soup,
-            tag = "span",
-            class_tag = BRAND_CLASS
-        )
-
-        price = self.safely_find(
-            soup = soup,
-            tag = "div",
-            class_tag = PRICE_CLASS
-        )
-
-        product_type = self.safely_find(
-            soup = soup,
-            tag = "a",
-            class_tag = PRODUCT_TYPE_CLASS
-        )
-
-        product_details = self.safely_find(
-            soup = soup,
-            tag = "div",
-            class_tag = PRODUCT_CLASS,
-            find_all = True
-        )
+        brand = fields.get("brand")
+        price = fields.get("price")
+        product_type = fields.get("product_type")
+        product_details = fields.get("details", [])
 
         # separate product_details into description, usage, and ingredients
-        description = None
+        description = fields.get("description")
         usage = None
 
-        if len(product_details) > 0:
+        if description is None and len(product_details) > 0:
             description = product_details[0].get_text()
 
-            # skip kits/sets of products
-            if kit_pattern.search(description):
-                logging.info(f"skipping set: {name}")
-                return None
+        # skip kits/sets of products
+        if description and kit_pattern.search(description):
+            logging.info(f"skipping set: {name}")
+            return None
 
         if len(product_details) > 1:
             usage = product_details[1].get_text()
 
-        final_ingredients = None
-        if len(product_details) > 2:
+        # embedded ingredients may hold html and notes, like the details section
+        raw_ingredients = None
+        if fields.get("ingredients"):
+            raw_ingredients = parsers.make_soup(fields["ingredients"], "html.parser")
+        elif len(product_details) > 2:
             raw_ingredients = product_details[2]
+
+        final_ingredients = None
+        if raw_ingredients is not None:
             try:
                 final_ingredients = self.find_ingredients(raw_ingredients)
             except:
                 final_ingredients = None
 
-        if not final_ingredients:
-            self.missing_products += 1
-
         # convert the ingredient string to a list of formatted ingredients
         formatted_ingredients = self.format_ingredients(
             raw_ingredients = final_ingredients,
@@ -309,16 +620,74 @@ class Sephora:
         logging.info(formatted_ingredients)
         logging.info("\n\n")
 
-        # save the final information
-        self.product_info.append({
+        return {
             "name": name,
             "link": url,
             "brand": brand,
             "price": price,
-            "raw ingredients": final_ingredients,
+            "raw ingredients": str(final_ingredients) if final_ingredients else None,
             "ingredients": formatted_ingredients,
             "product_type": product_type
-        })
+        }
+
+
+    def save_product(self, url: str, product: dict):
+        """
+        Description
+        -----------
+        Save the result of parsing a product page
+
+        With a checkpoint, the product is only recorded there
+        (get_product_infos outputs checkpointed products once the crawl is
+        done); otherwise it is output straight away with add_product
+
+        Parameters
+        ----------
+        url: str
+            full url of the product page
+        product: dict
+            returned by parse_product_page (None for skipped kits/sets)
+
+        Returns
+        -------
+        Updates self.checkpoint, or self.product_info and self.writer
+        """
+
+        if self.checkpoint is not None:
+            self.checkpoint.save(url, product)
+
+        elif product is not None:
+            self.add_product(product)
+
+
+    def add_product(self, product: dict):
+        """
+        Description
+        -----------
+        Output a finished product
+
+        Parameters
+        ----------
+        product: dict
+            returned by parse_product_page
+
+        Returns
+        -------
+        Updates self.product_info, self.writer, self.index, and
+        self.missing_products
+        """
+
+        if not product["raw ingredients"]:
+            self.missing_products += 1
+
+        if self.keep_products:
+            self.product_info.append(product)
+
+        if self.writer is not None:
+            self.writer.write(product)
+
+        if self.index is not None:
+            self.index.add(product)
 
 
     def safely_find(self, soup, tag: str, class_tag: str, find_all: bool = False):
@@ -354,11 +723,13 @@ class Sephora:
         return result
 
 
+    @METRICS.timed("find_ingredients")
     def find_ingredients(self, raw_ingredients):
         """
         Description
         -----------
         Helper function to locate ingredient list within product details
+        (each block of text is scored in one pass, see locator.py)
 
         Parameters
         ----------
@@ -369,92 +740,16 @@ class Sephora:
         ingredients: str
         """
 
-        ingredients = None
-
-        # define patterns that may occur after the ingredient list
-        stop_pattern = re.compile(
-            r"the ingredients|free of|clean at sephora|vegan|gluten|evaluated|may change|^\*|^\+",
-            re.IGNORECASE
-        )
-
-        # case when ingredients are the first and only item
-        if not raw_ingredients.br:
-            ingredients = next(raw_ingredients.children, None).string
-
-        # case when there are multiple items in the details sections
-        else:
-            # start with the first item
-            item_after_ingredients = raw_ingredients.br
-
-            # move through the details until we find ingredients
-            finished = False
-            while not finished:
-                item_after_ingredients = item_after_ingredients.next_sibling
-
-                # if no next_sibling, quit
-                if not item_after_ingredients or item_after_ingredients == "":
-                    finished = True
-                    continue
-
-                # check for patterns that indicate we've passed the ingredients
-                if isinstance(item_after_ingredients, bs4.element.Tag):
-                    if stop_pattern.search(item_after_ingredients.text):
-                        finished = True
-
-                elif isinstance(item_after_ingredients, bs4.element.NavigableString):
-                    if stop_pattern.search(item_after_ingredients):
-                        finished = True
-
-                # if there's more to look at, keep going
-                if item_after_ingredients.next_sibling:
-                    continue
-
-                # if we haven't found a stop_pattern and there's nothing left
-                # assume we've found the ingredients (i.e. ingredients are last)
-                else:
-                    ingredients = item_after_ingredients
-
-                    if isinstance(ingredients, bs4.element.Tag):
-                        if ingredients.text == "":
-                            ingredients = None
-
-                    finished = True
-
-
-            # if we found the item_after_ingredients but not the ingredients
-            # take the first previous_sibling that is not a new line character
-            if item_after_ingredients and not ingredients:
-                ingredients = item_after_ingredients
-                finished = False
-                while not finished:
-                    if not ingredients.previous_sibling:
-                        finished = True
-                        continue
-
-                    ingredients = ingredients.previous_sibling
-
-                    if isinstance(ingredients, bs4.element.NavigableString):
-                        if ingredients == '\n' or ingredients == " " or ingredients == "<br/>":
-                            continue
-                        else:
-                            finished = True
-
-        # case when details don't contain ingredients, but do contain other info
-        if isinstance(ingredients, bs4.element.Tag):
-            if stop_pattern.search(ingredients.text):
-                ingredients = None
-
-        if isinstance(ingredients, bs4.element.NavigableString):
-            if stop_pattern.search(ingredients):
-                ingredients = None
+        ingredients = self.locator.locate(raw_ingredients)
 
         # if none of that worked, we failed :-(
-        if not ingredients or ingredients == "\n":
+        if not ingredients:
             logging.info("-------------FAILED TO FIND INGREDIENTS-------------")
 
         return ingredients
 
 
+    @METRICS.timed("format_ingredients")
     def format_ingredients(self, raw_ingredients: str, product_name: str) -> list:
         """
         Description
@@ -474,28 +769,17 @@ class Sephora:
         Returns
         -------
         formatted_ingredients: list of str
-            List of formatted ingredient strings
+            List of formatted ingredient strings, in the order listed
         """
 
         # move on if no ingredient string was found
         if not raw_ingredients:
             return [None]
 
-        raw_ingredients = str(raw_ingredients)
-
-        # remove parentheticals
-        # e.g. Titanium Dioxide (CI 77891) -> Titanium Dioxide
-        regex = r"\({1}.{1,20}\){1}\s"
-        raw_ingredients = re.sub(regex, "", raw_ingredients)
-
-        # remove new line characters and periods
-        raw_ingredients = re.sub(r"\n|\.|\*|\r", " ", raw_ingredients)
+        # split into a list of strings, in order, without duplicates
+        # (see ingredients.py) -> list position is the ingredient's rank
+        formatted_ingredients = split_ingredients(raw_ingredients)
 
-        # split into a list of strings
-        ingredients = raw_ingredients.split(", ")
-        formatted_ingredients = set([ingr.strip().lower() for ingr in ingredients])
-
-        # use set ^ in case there are any duplicates
         logging.info(f"found {len(formatted_ingredients)} ingredients: {product_name}")
 
         return formatted_ingredients
@@ -504,7 +788,8 @@ class Sephora:
 
 
 # ------------------------------- < HELPERS > -------------------------------- #
-def search_url(url, class_type: str, class_tag: str) -> bs4.element.ResultSet:
+@METRICS.timed("search_url")
+def search_url(url, class_type: str, class_tag: str, backend: str = None) -> list:
     """
     Description
     -----------
@@ -517,19 +802,22 @@ def search_url(url, class_type: str, class_tag: str) -> bs4.element.ResultSet:
     class_tag: str
         the specific tag to search for, e.g. "css-or7ouu"
         (these are defined in sephora_setup.py)
+    backend: str
+        html parser backend, one of parsers.BACKENDS
 
     Returns
     -------
-    bs4.element.ResultSet object (iterable)
+    list of bs4.element.Tag
     """
-    page = requests.get(url)
-    soup = bs4.BeautifulSoup(page.content, "html.parser")
-    result = soup.find_all(class_type, class_ = class_tag)
+    content = fetch_page(url) # raises FetchError instead of returning an error page
+    result = parsers.find_all_in_page(content, class_type, class_tag,
+                                      backend = backend)
     return result
 
 
 
-def make_dataframe(product_info: list, table_type: str) -> pd.DataFrame:
+@METRICS.timed("make_dataframe")
+def make_dataframe(product_info: list, table_type: str) -> "pd.DataFrame":
     """
     Description
     -----------
@@ -548,36 +836,27 @@ def make_dataframe(product_info: list, table_type: str) -> pd.DataFrame:
     -------
     df: DataFrame
 
-    This function also saves the resulting dataframe as a .csv
+    This function also saves the resulting dataframe as a .csv, and for
+    "ingredients" the synonym table of its ingredient IDs as DICTIONARY_FILE
+    (for large crawls, stream products through a ProductWriter instead)
     """
 
+    import pandas as pd
+
     assert table_type in ["ingredients", "products"], (
         "table_type must be 'ingredients' or 'products'")
 
-    dataframes = []
-
-    for product in product_info:
-        if table_type == "ingredients":
-            product_dict = {
-                "name": product["name"],
-                "ingredient": list(product["ingredients"]),
-                "rank": list(range(1, len(product["ingredients"]) + 1))
-            }
-
-        if table_type == "products":
-            product_dict = {
-                "name": [product["name"]],
-                "brand": [product["brand"]],
-                "price": [product["price"]],
-                "link": [product["link"]]
-            }
-
-        dataframes.append(pd.DataFrame(product_dict))
+    dictionary = load_dictionary() if table_type == "ingredients" else None
 
-    df = pd.concat(dataframes)
+    # build all the rows first, then a single DataFrame
+    rows = [row for product in product_info
+                for row in product_rows(product, table_type, dictionary)]
+    df = pd.DataFrame(rows, columns = TABLE_COLUMNS[table_type])
 
     # save dataframe to csv
     df.to_csv(f"{table_type}.csv", index = False)
+    if dictionary is not None:
+        dictionary.to_csv(DICTIONARY_FILE)
 
     return df
 
@@ -1,7 +1,24 @@
+import os
+
 
 # base URL for all requests to Sephora website
 BASE_URL = "https://www.sephora.com/"
 
+# on-disk cache of downloaded pages (see http_cache.py)
+CACHE_DIR = "cache"
+CACHE_TTL = 24 * 60 * 60 # seconds before a cached page is revalidated
+CACHE_MAX_BYTES = 2 * 1024 ** 3 # least recently used pages evicted above this
+
+# sqlite file that records each finished product (see checkpoint.py)
+CHECKPOINT_PATH = "checkpoint.sqlite"
+
+# output tables written by get_sephora_products (see writers.py)
+OUTPUT_DIR = "."
+# add "parquet" to also write .parquet files, or "dataset" for a Parquet dataset
+# partitioned by crawl date and product type (see dataset.py); both need pyarrow
+OUTPUT_FORMATS = ("csv",)
+OUTPUT_BATCH_SIZE = 1000 # rows buffered per table before each write
+
 # html tags to identify various parts of sephora website
 # (found these by manually inspecting product pages)
 PRODUCT_CATEGORY_CLASS = "css-or7ouu" #a (e.g. Moisturizers)
@@ -11,6 +28,84 @@ BRAND_CLASS = "css-euydo4" #span (e.g. Drunk Elephant)
 PRICE_CLASS = "css-14hdny6" #div (e.g. $74.00)
 PRODUCT_CLASS = "css-pz80c5" #div (contains description, usage, ingredients)
 PRODUCT_TYPE_CLASS = "css-iasgl9" #a (e.g. Eye Masks)
+NEXT_PAGE_CLASS = "css-a8wls9" #button ("next page" on subcategory pages)
+SIGNUP_CLOSE_CLASS = "css-wuwqem" #button (closes "Sign up for Sephora" box)
+
+# how get_product_links lists a subcategory (see listing.py):
+# "json" reads the embedded product data (falling back to a browser if there
+# is none), "browser" always renders and scrolls the page
+LISTING_BACKEND = "json"
+
+# number of headless browsers used to scroll subcategory pages
+BROWSER_POOL_SIZE = 2
+
+# crawl metrics (see metrics.py), and optional profiling of product pages
+METRICS_PATH = "metrics.json"
+PROFILE_SAMPLE_EVERY = 0 # profile one product page in this many (0 = off)
+PROFILE_DIR = "profiles"
+PROFILE_PYINSTRUMENT = False # pyinstrument (pip install ".[profile]") instead of cProfile
+
+# fields extracted from each product page: field -> (tag, class)
+PRODUCT_FIELDS = {
+    "name": ("span", NAME_CLASS),
+    "brand": ("span", BRAND_CLASS),
+    "price": ("div", PRICE_CLASS),
+    "product_type": ("a", PRODUCT_TYPE_CLASS)
+}
+PRODUCT_DETAILS = ("div", PRODUCT_CLASS) # every match is kept, not just the first
+
+# versions of the product page selectors, newest first (see selector_profiles.py):
+# the class names above are generated by the site's build and change when it
+# redeploys, so when they do, add the new set here as a new profile
+# (selector_profiles.heal_profile can work it out from pages with structured data)
+SELECTOR_PROFILES = {
+    "v1": dict(PRODUCT_FIELDS, details = PRODUCT_DETAILS)
+}
+
+# before a crawl, a profile must find these fields on MIN_SELECTOR_COVERAGE of
+# SELECTOR_SAMPLE_SIZE product pages, or the crawl stops straight away
+SELECTOR_SAMPLE_SIZE = 8
+MIN_SELECTOR_COVERAGE = 0.75
+REQUIRED_FIELDS = ("name", "brand", "price", "details")
+
+# html parser used for product pages (see parsers.py)
+# one of "html.parser", "lxml", "selectolax", or None for the fastest installed
+PARSER_BACKEND = None
+
+# number of processes parsing product pages (None for one per cpu core)
+PARSE_WORKERS = None
+
+# sqlite query store of products, ingredients, and the INCI tables (see store.py)
+STORE_PATH = "ingredients.sqlite"
+
+# ingredient -> products inverted index, updated as products are crawled
+# (see inverted_index.py)
+INDEX_PATH = "ingredient_index.npz"
+
+# local screening service (see service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_BATCH = 1000 # most strings screened in one batch
+SERVICE_BATCH_WAIT = 0.002 # seconds a batch waits for more requests to join it
+
+# saved pages used by benchmarks.py (see corpus/README.md); they live in the
+# repository, so they are found from any working directory
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+# comedogenic ingredient list used by comedogenic.py
+# (.csv with an "ingredient" column and an optional "rating" column)
+COMEDOGENIC_PATH = "data/comedogenic_ingredients.csv"
+
+# EU INCI tables written by scrape_ingredient_database.py
+INCI_PATH = "data/inci_descriptions.csv"
+INCI_CATEGORIES_PATH = "data/inci_categories.csv"
+
+# alternative ingredient names -> canonical EU INCI name (see canonical.py)
+INGREDIENT_SYNONYMS = {
+    "water": "aqua",
+    "eau": "aqua",
+    "fragrance": "parfum"
+}
 
 # categories to search for products
 # add to this list as needed
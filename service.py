@@ -0,0 +1,511 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from sephora_setup import (COMEDOGENIC_PATH, INCI_PATH, INDEX_PATH, INGREDIENT_SYNONYMS,
+                           SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_BATCH,
+                           SERVICE_BATCH_WAIT)
+from metrics import METRICS
+import asyncio
+import logging
+import json
+import time
+import os
+
+# pandas, numpy and scipy are only imported by ReferenceData.load, which runs
+# after the service is already listening, so it starts in milliseconds
+
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+MAX_BODY_BYTES = 16 * 1024 ** 2
+
+
+
+class ReferenceData:
+    """
+    A class used to hold everything the service looks up, loaded once:
+    the comedogenic list (as a screening.Screener), the EU INCI
+    descriptions and functions, and the ingredient -> products index.
+
+    Attributes
+    ----------
+    screener: screening.Screener
+    index: inverted_index.InvertedIndex
+        (empty if INDEX_PATH hasn't been written by a crawl yet)
+    inci: dict
+        canonical ingredient name -> {"description": str, "functions": list}
+        (empty if INCI_PATH hasn't been built yet)
+    """
+
+    def __init__(self, comedogenic_path: str = COMEDOGENIC_PATH,
+                 inci_path: str = INCI_PATH, index_path: str = INDEX_PATH):
+
+        self.comedogenic_path = comedogenic_path
+        self.inci_path = inci_path
+        self.index_path = index_path
+        self.screener = None
+        self.index = None
+        self.inci = {}
+
+
+    def load(self) -> "ReferenceData":
+        from inverted_index import InvertedIndex
+        from comedogenic import ComedogenicIndex
+        from screening import Screener
+        import pandas as pd
+
+        # the screener and the index share one dictionary, so an ingredient
+        # has the same ID everywhere
+        self.index = InvertedIndex.load(self.index_path, INGREDIENT_SYNONYMS)
+        dictionary = self.index.dictionary
+
+        if os.path.exists(self.inci_path):
+            inci_df = pd.read_csv(self.inci_path)
+            for name, rows in inci_df.dropna(subset = ["name"]).groupby("name", sort = False):
+                functions = rows["function"].dropna().str.strip()
+                self.inci[dictionary.names[dictionary.intern(name)]] = {
+                    "description": rows["description"].iloc[0],
+                    "functions": [f for f in functions if f]
+                }
+
+        self.screener = Screener(ComedogenicIndex.from_csv(self.comedogenic_path),
+                                 dictionary)
+
+        # nothing is added once the reference data is loaded, so requests
+        # can't grow memory or change IDs under concurrent readers
+        dictionary.freeze()
+        return self
+
+
+    def describe(self, name: str) -> dict:
+        """
+        Description
+        -----------
+        Everything known about one ingredient
+
+        Parameters
+        ----------
+        name: str
+            any spelling the dictionary knows
+
+        Returns
+        -------
+        dict, or None if the ingredient is unknown
+        """
+
+        dictionary = self.screener.dictionary
+        ingredient_id = dictionary.find(name)
+        if ingredient_id is None:
+            return None
+
+        canonical = dictionary.names[ingredient_id]
+        ratings = self.screener._rating_vector()
+        inci = self.inci.get(canonical, {})
+
+        return {
+            "name": canonical,
+            "description": inci.get("description"),
+            "functions": inci.get("functions", []),
+            "comedogenic_rating": float(ratings[ingredient_id]),
+            "n_products": len(self.index.lookup(canonical))
+        }
+
+
+    def screen(self, raw_ingredients: list) -> list:
+        scores = self.screener.score(raw_ingredients)
+        return scores.to_dict("records")
+
+
+
+class MicroBatcher:
+    """
+    A class used to gather concurrent screening requests into batches.
+
+    Screening a batch of strings costs little more than screening one
+    (see screening.Screener), so rather than screening each request on its
+    own, the first request of a batch waits up to max_wait seconds for
+    others to arrive, and the whole batch is screened at once.
+
+    Attributes
+    ----------
+    function: function
+        list of str -> list of results, run in the service's worker thread
+    max_batch: int
+        a batch is screened as soon as it holds this many strings
+    max_wait: float
+        seconds the first request of a batch waits for others
+    """
+
+    def __init__(self, function, executor, max_batch: int = SERVICE_MAX_BATCH,
+                 max_wait: float = SERVICE_BATCH_WAIT):
+
+        self.function = function
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+
+
+    async def submit(self, strings: list) -> list:
+        """
+        Parameters
+        ----------
+        strings: list of str
+
+        Returns
+        -------
+        one result per string
+        """
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((strings, future))
+        return await future
+
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            size += len(batch[-1][0])
+
+        return batch
+
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._next_batch()
+            strings = [s for request, _ in batch for s in request]
+
+            METRICS.increment("service_batches")
+            METRICS.increment("service_strings", len(strings))
+            try:
+                with METRICS.timer("service_screen"):
+                    results = await loop.run_in_executor(self.executor,
+                                                         self.function, strings)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for request, future in batch:
+                if not future.done(): # the client may have gone away
+                    future.set_result(results[start:start + len(request)])
+                start += len(request)
+
+
+
+class ScreeningService:
+    """
+    A class used to serve screening requests over HTTP from warm, in-memory
+    reference data, so none of it is re-imported or rebuilt per request.
+
+    The service listens immediately and loads its reference data in the
+    background; requests that need it wait until it is ready.
+
+    Endpoints (all responses are JSON)
+    ---------
+    POST /screen         {"ingredients": str or [str, ...]}
+                         -> {"results": [scores, ...]} (see Screener.score)
+    GET /ingredient      ?name=niacinamide
+    GET /products        ?all_of=...&any_of=...&none_of=...&max_rank=...
+                         (each may be repeated) -> {"links": [...]}
+    GET /health          -> {"status": "loading", "ready" or "error", ...}
+    GET /metrics         -> Prometheus text
+
+    Attributes
+    ----------
+    reference: ReferenceData
+    batcher: MicroBatcher
+    """
+
+    def __init__(self, reference: ReferenceData = None,
+                 max_batch: int = SERVICE_MAX_BATCH,
+                 max_wait: float = SERVICE_BATCH_WAIT):
+
+        self.reference = reference or ReferenceData()
+        # screening runs on one thread, so batches never compete for the cpu
+        self._executor = ThreadPoolExecutor(max_workers = 1,
+                                            thread_name_prefix = "screening")
+        self.batcher = MicroBatcher(self.reference.screen, self._executor,
+                                    max_batch, max_wait)
+        self._ready = None
+        self._started = time.monotonic()
+        self._routes = {
+            ("POST", "/screen"): self._screen,
+            ("GET", "/ingredient"): self._ingredient,
+            ("GET", "/products"): self._products,
+            ("GET", "/health"): self._health,
+            ("GET", "/metrics"): self._metrics
+        }
+
+
+    def _call(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+
+    async def start(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+        """
+        Description
+        -----------
+        Start listening, and start loading the reference data
+
+        Parameters
+        ----------
+        host: str
+        port: int
+            0 for any free port
+
+        Returns
+        -------
+        asyncio.Server (see its .sockets for the port actually used)
+        """
+
+        server = await asyncio.start_server(self._handle, host, port)
+        self._ready = asyncio.ensure_future(self._call(self.reference.load))
+        self._ready.add_done_callback(self._log_ready)
+        return server
+
+
+    def _log_ready(self, future):
+        seconds = time.monotonic() - self._started
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.error(f"could not load reference data: {future.exception()!r}")
+        else:
+            logging.info(f"reference data loaded in {seconds:.2f}s")
+
+
+    async def _handle(self, reader, writer):
+        # one connection: answer requests until the client closes it
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                status, payload = await self._respond(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except _BadRequest as e:
+            writer.write(_response(e.status, {"error": str(e)}, False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def _respond(self, method: str, target: str, body: bytes) -> tuple:
+        url = urlsplit(target)
+        handler = self._routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self._routes):
+                return 405, {"error": f"{method} not allowed on {url.path}"}
+            return 404, {"error": f"no such endpoint: {url.path}"}
+
+        METRICS.increment("service_requests")
+        try:
+            return await handler(parse_qs(url.query), body)
+        except _BadRequest as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            METRICS.increment("service_errors")
+            logging.exception(f"error handling {method} {target}")
+            return 500, {"error": repr(e)}
+
+
+    async def _wait_ready(self):
+        if self._ready is None:
+            raise _BadRequest(503, "service not started")
+        await asyncio.shield(self._ready)
+
+
+
+    # ------------------------------- < ENDPOINTS > ------------------------------ #
+    async def _screen(self, query: dict, body: bytes) -> tuple:
+        try:
+            strings = json.loads(body)["ingredients"]
+        except (ValueError, KeyError, TypeError):
+            raise _BadRequest(400, 'body must be JSON like {"ingredients": "..."}')
+
+        if isinstance(strings, str):
+            strings = [strings]
+        if not isinstance(strings, list) or not all(
+                s is None or isinstance(s, str) for s in strings):
+            raise _BadRequest(400, "ingredients must be a string or a list of strings")
+
+        await self._wait_ready()
+        results = await self.batcher.submit(strings) if strings else []
+        return 200, {"results": results}
+
+
+    async def _ingredient(self, query: dict, body: bytes) -> tuple:
+        if "name" not in query:
+            raise _BadRequest(400, "missing ?name=")
+
+        await self._wait_ready()
+        description = await self._call(self.reference.describe, query["name"][0])
+        if description is None:
+            return 404, {"error": f"unknown ingredient: {query['name'][0]}"}
+        return 200, description
+
+
+    async def _products(self, query: dict, body: bytes) -> tuple:
+        try:
+            max_rank = int(query["max_rank"][0]) if "max_rank" in query else None
+        except ValueError:
+            raise _BadRequest(400, "max_rank must be an integer")
+
+        await self._wait_ready()
+        index = self.reference.index
+
+        def search():
+            product_ids = index.search(query.get("all_of", ()), query.get("any_of", ()),
+                                       query.get("none_of", ()), max_rank)
+            return index.product_links(product_ids)
+
+        return 200, {"links": await self._call(search)}
+
+
+    async def _health(self, query: dict, body: bytes) -> tuple:
+        health = {"uptime": round(time.monotonic() - self._started, 3)}
+        if self._ready is None or not self._ready.done():
+            health["status"] = "loading"
+        elif self._ready.exception() is not None:
+            health["status"] = "error"
+            health["error"] = repr(self._ready.exception())
+        else:
+            health["status"] = "ready"
+            health["products"] = len(self.reference.index)
+            health["comedogenic_ingredients"] = len(self.reference.screener.index)
+        return 200, health
+
+
+    async def _metrics(self, query: dict, body: bytes) -> tuple:
+        return 200, METRICS.to_prometheus()
+
+
+
+# --------------------------------- < HTTP > --------------------------------- #
+class _BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_request(reader) -> tuple:
+    # just enough HTTP/1.1 for JSON requests: (method, target, headers, body),
+    # or None once the client has closed the connection
+    line = await reader.readline()
+    if not line:
+        return None
+
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise _BadRequest(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_BYTES:
+        raise _BadRequest(413, f"request bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    return method.upper(), target, headers, body
+
+
+def _response(status: int, payload, keep_alive: bool = True) -> bytes:
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4"
+    else:
+        body = json.dumps(payload).encode("utf-8")
+        content_type = "application/json"
+
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+          service: ScreeningService = None):
+    """
+    Description
+    -----------
+    Run the screening service until interrupted
+
+    Parameters
+    ----------
+    host: str
+    port: int
+    service: ScreeningService
+        defaults to one using the paths in sephora_setup.py
+    """
+
+    service = service or ScreeningService()
+
+    async def run():
+        server = await service.start(host, port)
+        port_used = server.sockets[0].getsockname()[1]
+        seconds = time.monotonic() - service._started
+        logging.info(f"listening on http://{host}:{port_used}/ after {seconds * 1000:.0f}ms")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: list = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Serve ingredient screening over HTTP")
+    parser.add_argument("--host", default = SERVICE_HOST)
+    parser.add_argument("--port", type = int, default = SERVICE_PORT)
+    parser.add_argument("--max-batch", type = int, default = SERVICE_MAX_BATCH)
+    parser.add_argument("--batch-wait", type = float, default = SERVICE_BATCH_WAIT,
+                        help = "seconds a batch waits for more requests")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format = "%(asctime)s %(levelname)s %(message)s",
+                        level = logging.INFO)
+    serve(args.host, args.port,
+          ScreeningService(max_batch = args.max_batch, max_wait = args.batch_wait))
+
+
+if __name__ == '__main__':
+    main()
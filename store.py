@@ -0,0 +1,431 @@
+from sephora_setup import (STORE_PATH, CHECKPOINT_PATH, INCI_PATH,
+                           INCI_CATEGORIES_PATH, COMEDOGENIC_PATH, INGREDIENT_SYNONYMS)
+from canonical import IngredientDictionary
+import pandas as pd
+import threading
+import sqlite3
+import os
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ingredients (
+        id INTEGER PRIMARY KEY, -- ID from canonical.IngredientDictionary
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        link TEXT NOT NULL UNIQUE,
+        name TEXT,
+        brand TEXT,
+        price TEXT,
+        product_type TEXT
+    );
+    CREATE TABLE IF NOT EXISTS product_ingredients (
+        product_id INTEGER NOT NULL REFERENCES products (id),
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+        rank INTEGER NOT NULL,
+        PRIMARY KEY (product_id, rank)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS inci (
+        ingredient_id INTEGER PRIMARY KEY REFERENCES ingredients (id),
+        description TEXT
+    );
+    CREATE TABLE IF NOT EXISTS inci_functions (
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+        function TEXT NOT NULL,
+        PRIMARY KEY (ingredient_id, function)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS inci_categories (
+        category TEXT PRIMARY KEY,
+        description TEXT
+    );
+    CREATE TABLE IF NOT EXISTS comedogenic (
+        ingredient_id INTEGER PRIMARY KEY REFERENCES ingredients (id),
+        rating REAL
+    );
+
+    -- "which products contain X in the top N" is a range scan of this index
+    CREATE INDEX IF NOT EXISTS product_ingredients_by_ingredient
+        ON product_ingredients (ingredient_id, rank, product_id);
+    CREATE INDEX IF NOT EXISTS products_by_brand ON products (brand);
+    CREATE INDEX IF NOT EXISTS inci_functions_by_function ON inci_functions (function);
+"""
+
+
+
+class IngredientStore:
+    """
+    A class used to keep products, their ingredients, the EU INCI tables,
+    and the comedogenic list in one indexed SQLite database, so common
+    questions are answered by index lookups rather than by loading every
+    .csv into pandas.
+
+    Ingredient names are mapped to integer IDs with an IngredientDictionary,
+    so every spelling of an ingredient is stored, indexed, and queried as
+    the same ingredient.
+
+    Attributes
+    ----------
+    path: str
+        location of the SQLite database file
+    dictionary: canonical.IngredientDictionary
+    """
+
+    def __init__(self, path: str = STORE_PATH, synonyms: dict = INGREDIENT_SYNONYMS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(SCHEMA)
+
+        # rebuild the dictionary from the saved names, so IDs stay the same
+        names = [name for (name,) in self._db.execute(
+            "SELECT name FROM ingredients ORDER BY id")]
+        self.dictionary = IngredientDictionary(names, synonyms)
+        self._n_saved = len(names)
+        self._save_new_names()
+        self._db.commit()
+
+
+    def _save_new_names(self):
+        # add names the dictionary has interned since the last save
+        new_names = self.dictionary.names[self._n_saved:]
+        self._db.executemany(
+            "INSERT INTO ingredients (id, name) VALUES (?, ?)",
+            enumerate(new_names, start = self._n_saved))
+        self._n_saved = len(self.dictionary.names)
+
+
+
+    # -------------------------------- < LOADING > ------------------------------- #
+    def add_products(self, products) -> int:
+        """
+        Description
+        -----------
+        Add (or replace) products and their ingredients
+
+        Parameters
+        ----------
+        products: iterable of dict
+            as returned by Sephora.parse_product_page, e.g. from
+            CheckpointStore.records() or Sephora.product_info
+
+        Returns
+        -------
+        number of products added
+        """
+
+        n_products = 0
+        with self._lock:
+            for product in products:
+                if product is None:
+                    continue
+
+                self._db.execute(
+                    """INSERT INTO products (link, name, brand, price, product_type)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (link) DO UPDATE SET name = excluded.name,
+                           brand = excluded.brand, price = excluded.price,
+                           product_type = excluded.product_type""",
+                    (product["link"], product["name"], product["brand"],
+                     product["price"], product.get("product_type")))
+                (product_id,) = self._db.execute(
+                    "SELECT id FROM products WHERE link = ?", (product["link"],)).fetchone()
+
+                self._db.execute(
+                    "DELETE FROM product_ingredients WHERE product_id = ?", (product_id,))
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO product_ingredients VALUES (?, ?, ?)",
+                    ((product_id, self.dictionary.intern(ingredient), rank)
+                     for rank, ingredient in enumerate(product["ingredients"], start = 1)
+                     if ingredient is not None))
+                n_products += 1
+
+            self._save_new_names()
+            self._db.commit()
+
+        return n_products
+
+
+    def load_inci(self, inci_df: pd.DataFrame):
+        """
+        Description
+        -----------
+        Load the EU INCI descriptions and functions
+
+        Parameters
+        ----------
+        inci_df: DataFrame
+            inci_descriptions.csv, as written by make_ingredient_table
+            (columns "name", "description", and "function")
+        """
+
+        with self._lock:
+            ids = [self.dictionary.intern(name) for name in inci_df["name"]]
+            rows = pd.DataFrame({"id": ids, "description": inci_df["description"],
+                                 "function": inci_df["function"]})
+
+            descriptions = rows.drop_duplicates("id")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO inci VALUES (?, ?)",
+                zip(descriptions["id"].tolist(),
+                    descriptions["description"].astype(object)
+                        .where(descriptions["description"].notna(), None)))
+
+            functions = rows.dropna(subset = ["function"])
+            functions = functions[functions["function"].str.strip() != ""]
+            self._db.executemany(
+                "INSERT OR IGNORE INTO inci_functions VALUES (?, ?)",
+                zip(functions["id"].tolist(), functions["function"].str.strip()))
+
+            self._save_new_names()
+            self._db.commit()
+
+
+    def load_categories(self, category_df: pd.DataFrame):
+        """
+        Parameters
+        ----------
+        category_df: DataFrame
+            inci_categories.csv, as written by make_category_table
+        """
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO inci_categories VALUES (?, ?)",
+                zip(category_df["category"], category_df["description"]))
+            self._db.commit()
+
+
+    def load_comedogenic(self, index):
+        """
+        Parameters
+        ----------
+        index: comedogenic.ComedogenicIndex
+        """
+
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO comedogenic VALUES (?, ?)",
+                ((self.dictionary.intern(name), rating)
+                 for name, rating in index.ratings.items()))
+            self._save_new_names()
+            self._db.commit()
+
+
+
+    # -------------------------------- < QUERIES > ------------------------------- #
+    def query(self, sql: str, params = ()) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Run any SQL query against the store
+
+        Parameters
+        ----------
+        sql: str
+        params: tuple or dict
+
+        Returns
+        -------
+        DataFrame
+        """
+
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            columns = [c[0] for c in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns = columns)
+
+
+    def products_with_ingredient(self, ingredient: str, max_rank: int = None,
+                                 brand: str = None) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Find the products that contain an ingredient
+        e.g. products_with_ingredient("isopropyl myristate", max_rank = 5)
+
+        Parameters
+        ----------
+        ingredient: str
+            any spelling the dictionary knows
+        max_rank: int
+            only products listing it in the first max_rank positions
+        brand: str
+
+        Returns
+        -------
+        DataFrame with columns name, brand, price, link, product_type, rank
+        """
+
+        ingredient_id = self.dictionary.find(ingredient)
+        sql = """
+            SELECT p.name, p.brand, p.price, p.link, p.product_type, pi.rank
+            FROM product_ingredients pi JOIN products p ON p.id = pi.product_id
+            WHERE pi.ingredient_id = ? AND pi.rank <= ?"""
+        params = [-1 if ingredient_id is None else ingredient_id,
+                  max_rank if max_rank is not None else 2 ** 31]
+
+        if brand is not None:
+            sql += " AND p.brand = ?"
+            params.append(brand)
+
+        return self.query(sql + " ORDER BY pi.rank, p.name", params)
+
+
+    def products_with_comedogenic(self, max_rank: int = 5, min_rating: float = None,
+                                  brand: str = None) -> pd.DataFrame:
+        """
+        Description
+        -----------
+        Find the products with a comedogenic ingredient near the top
+        of their ingredient list
+
+        Parameters
+        ----------
+        max_rank: int
+            only ingredients in the first max_rank positions
+        min_rating: float
+            only ingredients rated at least this comedogenic
+        brand: str
+
+        Returns
+        -------
+        DataFrame with columns name, brand, link, ingredient, rank, rating
+        """
+
+        # CROSS JOIN makes sqlite start from the (short) comedogenic list and
+        # look each ingredient up in the index, instead of scanning every row
+
+        sql = """
+            SELECT p.name, p.brand, p.link, i.name AS ingredient, pi.rank, c.rating
+            FROM comedogenic c
+            CROSS JOIN product_ingredients pi ON pi.ingredient_id = c.ingredient_id
+            JOIN products p ON p.id = pi.product_id
+            JOIN ingredients i ON i.id = c.ingredient_id
+            WHERE pi.rank <= ?"""
+        params = [max_rank]
+
+        if min_rating is not None:
+            sql += " AND c.rating >= ?"
+            params.append(min_rating)
+        if brand is not None:
+            sql += " AND p.brand = ?"
+            params.append(brand)
+
+        return self.query(sql + " ORDER BY p.name, pi.rank", params)
+
+
+    def ingredients_of(self, link: str) -> pd.DataFrame:
+        """
+        Parameters
+        ----------
+        link: str
+            full url of the product page
+
+        Returns
+        -------
+        DataFrame with columns rank, ingredient, comedogenic_rating, in_inci
+        """
+
+        return self.query("""
+            SELECT pi.rank, i.name AS ingredient, c.rating AS comedogenic_rating,
+                   inci.ingredient_id IS NOT NULL AS in_inci
+            FROM products p
+            JOIN product_ingredients pi ON pi.product_id = p.id
+            JOIN ingredients i ON i.id = pi.ingredient_id
+            LEFT JOIN comedogenic c ON c.ingredient_id = pi.ingredient_id
+            LEFT JOIN inci ON inci.ingredient_id = pi.ingredient_id
+            WHERE p.link = ?
+            ORDER BY pi.rank""", (link,))
+
+
+    def ingredient_functions(self, ingredient: str) -> list:
+        """
+        Returns
+        -------
+        the EU INCI functions of an ingredient, e.g. ["EMOLLIENT", "SOLVENT"]
+        """
+
+        ingredient_id = self.dictionary.find(ingredient)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT function FROM inci_functions WHERE ingredient_id = ? ORDER BY function",
+                (-1 if ingredient_id is None else ingredient_id,)).fetchall()
+        return [function for (function,) in rows]
+
+
+    def most_common_ingredients(self, limit: int = 20,
+                                product_type: str = None) -> pd.DataFrame:
+        """
+        Parameters
+        ----------
+        limit: int
+        product_type: str
+            only count products of this type
+
+        Returns
+        -------
+        DataFrame with columns ingredient and products (number of products)
+        """
+
+        sql = """
+            SELECT i.name AS ingredient, COUNT(*) AS products
+            FROM product_ingredients pi JOIN ingredients i ON i.id = pi.ingredient_id"""
+        params = []
+
+        if product_type is not None:
+            sql += " JOIN products p ON p.id = pi.product_id WHERE p.product_type = ?"
+            params.append(product_type)
+
+        sql += " GROUP BY pi.ingredient_id ORDER BY products DESC, ingredient LIMIT ?"
+        return self.query(sql, params + [limit])
+
+
+    def close(self):
+        with self._lock:
+            self._db.execute("PRAGMA optimize") # keep the query planner's statistics current
+            self._db.close()
+
+
+
+def build_store(path: str = STORE_PATH, checkpoint_path: str = CHECKPOINT_PATH,
+                inci_path: str = INCI_PATH, categories_path: str = INCI_CATEGORIES_PATH,
+                comedogenic_path: str = COMEDOGENIC_PATH) -> IngredientStore:
+    """
+    Description
+    -----------
+    Build (or update) the store from whichever of the crawl checkpoint,
+    EU INCI tables, and comedogenic list exist
+
+    Returns
+    -------
+    IngredientStore
+    """
+
+    store = IngredientStore(path)
+
+    if inci_path and os.path.exists(inci_path):
+        store.load_inci(pd.read_csv(inci_path))
+    if categories_path and os.path.exists(categories_path):
+        store.load_categories(pd.read_csv(categories_path))
+    if comedogenic_path and os.path.exists(comedogenic_path):
+        from comedogenic import load_index
+        store.load_comedogenic(load_index(comedogenic_path))
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        from checkpoint import CheckpointStore
+        checkpoint = CheckpointStore(checkpoint_path)
+        store.add_products(checkpoint.records())
+        checkpoint.close()
+
+    return store
+
+
+if __name__ == '__main__':
+    store = build_store()
+    print(store.query("""SELECT (SELECT COUNT(*) FROM products) AS products,
+                                (SELECT COUNT(*) FROM product_ingredients) AS rows,
+                                (SELECT COUNT(*) FROM ingredients) AS ingredients"""))
+    store.close()
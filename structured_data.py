@@ -0,0 +1,277 @@
+import html
+import json
+import re
+
+# product pages embed what their own javascript renders as JSON: a schema.org
+# JSON-LD Product, and usually the page's state, which also holds the
+# ingredients. Reading it needs only a scan over the raw bytes for the script
+# tags and a json.loads of each, rather than a tree of the whole page
+
+
+# script tags that hold JSON: schema.org JSON-LD, and the page's state, e.g.
+# <script type="application/ld+json">{...}</script>
+# <script id="linkStore" type="text/json">{...}</script>
+# <script id="__NEXT_DATA__" type="application/json">{...}</script>
+JSON_SCRIPT_PATTERN = re.compile(
+    rb"<script[^>]*type=[\"'](?:application/ld\+json|application/json|text/json)[\"'][^>]*>"
+    rb"(.*?)</script>",
+    re.DOTALL | re.IGNORECASE)
+
+# schema.org Product property -> field
+JSON_LD_PROPERTIES = {"name": "name", "brand": "brand", "category": "product_type",
+                      "description": "description"}
+
+# keys in page state: a product is a node with both a name and a brand; its
+# price and ingredients may be kept beside it, in the SKU of the record
+# holding it (e.g. {"productDetails": {...}, "currentSku": {...}})
+SKU_KEYS = ("currentSku",)
+NAME_KEYS = ("displayName", "productName")
+BRAND_KEYS = ("brand", "brandName")
+PRODUCT_TYPE_KEYS = ("parentCategory", "category")
+DESCRIPTION_KEYS = ("longDescription", "shortDescription", "description")
+PRICE_KEYS = ("listPrice", "salePrice")
+INGREDIENT_KEYS = ("ingredientDesc", "ingredients")
+
+CURRENCY_SYMBOLS = {"USD": "$", "CAD": "$", "EUR": "€", "GBP": "£"}
+
+
+def embedded_states(content: bytes) -> list:
+    """
+    Description
+    -----------
+    Find and decode the JSON blobs embedded in a page (with a scan over the
+    raw bytes, without parsing the html)
+
+    Parameters
+    ----------
+    content: bytes
+        raw html
+
+    Returns
+    -------
+    states: list of decoded JSON objects (blobs that fail to decode are skipped)
+    """
+
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    states = []
+    if b"json" not in content: # most pages without embedded data stop here
+        return states
+
+    for match in JSON_SCRIPT_PATTERN.finditer(content):
+        try:
+            states.append(json.loads(match.group(1)))
+        except ValueError: # malformed or empty blob
+            continue
+    return states
+
+
+def walk_json(node):
+    """
+    Returns
+    -------
+    generator of every dict inside a decoded JSON object, in document order
+    """
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            yield node
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+
+def embedded_product(content: bytes) -> dict:
+    """
+    Description
+    -----------
+    Read a product page's fields from the JSON embedded in it, without
+    parsing the html
+
+    Parameters
+    ----------
+    content: bytes
+        raw html of a product page
+
+    Returns
+    -------
+    fields: dict
+        any of "name", "brand", "price", "product_type", "description" and
+        "ingredients" (as found, possibly html) that the page embeds;
+        prices are formatted like the page's, e.g. "$78.00"
+    """
+
+    fields = {}
+    for data in embedded_states(content):
+        product = find_json_ld_product(data)
+        if product is not None:
+            add_json_ld_product(fields, product)
+        else:
+            _add_state(fields, data)
+
+    return fields
+
+
+def find_json_ld_product(data) -> dict:
+    """
+    Returns
+    -------
+    the first schema.org Product in a decoded JSON-LD document
+    (a list of documents, or an @graph), or None
+    """
+
+    if isinstance(data, list):
+        for item in data:
+            product = find_json_ld_product(item)
+            if product is not None:
+                return product
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    types = data.get("@type")
+    types = types if isinstance(types, list) else [types]
+    if "Product" in types:
+        return data
+    return find_json_ld_product(data.get("@graph", []))
+
+
+def add_json_ld_product(fields: dict, product: dict):
+    """
+    Add the fields of a schema.org Product to fields
+    (fields that are already set are kept)
+    """
+
+    for prop, field in JSON_LD_PROPERTIES.items():
+        _set(fields, field, _first(product, (prop,)))
+
+    offers = product.get("offers") or {}
+    offers = offers[0] if isinstance(offers, list) and offers else offers
+    if isinstance(offers, dict):
+        _set(fields, "price", format_price(offers.get("price") or offers.get("lowPrice"),
+                                           offers.get("priceCurrency")))
+
+    _set(fields, "ingredients", product.get("ingredients"))
+
+
+def _add_state(fields: dict, state):
+    product, record = _find_state_product(state)
+    if product is None:
+        return
+
+    _set(fields, "name", _first(product, NAME_KEYS))
+    _set(fields, "brand", _first(product, BRAND_KEYS))
+    _set(fields, "description", _first(product, DESCRIPTION_KEYS))
+    _set(fields, "product_type", _first(record, PRODUCT_TYPE_KEYS)
+                                 or _first(product, PRODUCT_TYPE_KEYS))
+
+    # only this product's SKU and its own details, their own keys first: a
+    # page's state also holds related and recommended products (sometimes
+    # inside the product), with their own prices and ingredients
+    sources = [record[key] for key in SKU_KEYS if isinstance(record.get(key), dict)]
+    sources.append(product)
+    nested = [node for source in sources for node in _own_nodes(source)
+              if node is not source]
+
+    for node in sources + nested:
+        _set(fields, "price", format_price(_first(node, PRICE_KEYS)))
+        _set(fields, "ingredients", _first(node, INGREDIENT_KEYS))
+
+
+def _is_product(node) -> bool:
+    return (isinstance(node, dict) and _first(node, NAME_KEYS) is not None
+            and _first(node, BRAND_KEYS) is not None)
+
+
+def _own_nodes(node):
+    # walk_json, but without going into other products nested in node
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            if current is not node and _is_product(current):
+                continue
+            yield current
+            stack.extend(reversed(list(current.values())))
+        elif isinstance(current, list):
+            stack.extend(reversed(current))
+
+
+def _find_state_product(state) -> tuple:
+    # (product node, record holding it): the first product whose record also
+    # holds a SKU (the page's own product), else the first product, with
+    # itself as its record
+    first = None
+    for node in walk_json(state):
+        for child in node.values():
+            if not _is_product(child):
+                continue
+            if any(isinstance(node.get(key), dict) for key in SKU_KEYS):
+                return child, node
+            first = first or child
+
+    if first is None and _is_product(state):
+        first = state
+    return first, first
+
+
+def _first(node: dict, keys: tuple):
+    # the first of keys with a value, taking the name of a nested
+    # object (e.g. "brand": {"displayName": "Laneige"})
+    for key in keys:
+        value = node.get(key)
+        if isinstance(value, dict):
+            value = value.get("displayName") or value.get("name")
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def _set(fields: dict, field: str, value):
+    if field in fields or value is None:
+        return
+    if isinstance(value, list): # e.g. "ingredients": ["Water", "Glycerin"]
+        value = ", ".join(str(v) for v in value if isinstance(v, str))
+    value = str(value).strip()
+    if field != "ingredients": # ingredients go through the locator's html parsing
+        value = html.unescape(value)
+    if value:
+        fields[field] = value
+
+
+def format_price(price, currency: str = None) -> str:
+    """
+    Description
+    -----------
+    Format a price like the product page does, e.g. 78 -> "$78.00"
+    (prices that already carry a currency symbol are kept as they are)
+
+    Parameters
+    ----------
+    price: str, int or float
+    currency: str
+        ISO code, e.g. "USD" (the default)
+
+    Returns
+    -------
+    str, or None if price is empty
+    """
+
+    if price is None or isinstance(price, bool) or str(price).strip() == "":
+        return None
+
+    price = str(price).strip()
+    if price[0] in "$€£":
+        return price
+
+    try:
+        amount = f"{float(price.replace(',', '')):,.2f}"
+    except ValueError:
+        return price
+
+    symbol = CURRENCY_SYMBOLS.get(currency or "USD")
+    return symbol + amount if symbol else f"{amount} {currency}"
@@ -0,0 +1,10 @@
+from http_client import HttpClient
+import pytest
+
+
+@pytest.fixture
+def client():
+    # short timeouts, so a stalled request fails fast
+    client = HttpClient(timeout = (1.0, 0.5), max_connections_per_host = 32)
+    yield client
+    client.close()
@@ -0,0 +1,45 @@
+from benchmarks import FaultInjector
+import pathlib
+
+
+CORPUS_DIR = pathlib.Path(__file__).parent.parent / "corpus"
+SITE_DIR = CORPUS_DIR / "site" # served by serve_corpus by default
+PRODUCT_DIR = SITE_DIR / "product"
+LISTINGS_DIR = CORPUS_DIR / "listings"
+
+
+
+class ScriptedFaults(FaultInjector):
+    """
+    A FaultInjector that answers the first requests with the statuses in
+    script (None for the page itself, "hang" to stall for hang_seconds),
+    then misbehaves as configured (by default, not at all)
+    """
+
+    def __init__(self, script = (), **kwargs):
+        super().__init__(**kwargs)
+        self.script = list(script)
+
+    def enter(self) -> tuple:
+        with self._lock:
+            if not self.script:
+                scripted = False
+            else:
+                scripted = True
+                self._in_flight += 1
+                status, delay = self.script.pop(0), 0.0
+                if status == "hang":
+                    status, delay = None, self.hang_seconds
+                    self.requests["hang"] = self.requests.get("hang", 0) + 1
+                key = status or 200
+                self.requests[key] = self.requests.get(key, 0) + 1
+
+        if scripted:
+            return status, delay
+        return super().enter()
+
+
+
+def product_urls(base_url: str) -> list:
+    # the saved product pages, as served by serve_corpus
+    return [f"{base_url}product/{path.stem}" for path in sorted(PRODUCT_DIR.glob("*.html"))]
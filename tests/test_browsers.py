@@ -0,0 +1,71 @@
+import pathlib
+import pytest
+
+pytest.importorskip("selenium")
+
+from selenium.common.exceptions import WebDriverException
+from selenium import webdriver
+import browsers
+
+
+FIXTURE = pathlib.Path(__file__).parent.parent / "corpus" / "listings" / "infinite_scroll.html"
+
+# the fixture's first page holds 3 batches of 12 product links
+LINKS_PER_PAGE = 36
+
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.quit_calls = 0
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+
+@pytest.fixture(scope = "module")
+def chrome():
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    try:
+        browser = webdriver.Chrome(options = options)
+    except WebDriverException as error: # no chrome (or driver) installed
+        pytest.skip(f"headless chrome is not available: {error.msg}")
+
+    yield browser
+    browser.quit()
+
+
+def test_scroll_collects_every_batch(chrome):
+    # batches load 300-800ms after each scroll, well within the quiet time,
+    # so stopping after the first batch means the scroll was taken as quiet
+    pages = browsers.collect_pages(chrome, FIXTURE.as_uri(), "css-ix8km1",
+                                   dismiss_class = "css-wuwqem", quiet = 1.0)
+
+    links = chrome.find_elements("class name", "css-ix8km1")
+    assert len(pages) == 1
+    assert len(links) == LINKS_PER_PAGE
+    assert pages[0].count("/product/fixture-product-P") == LINKS_PER_PAGE
+
+
+def test_scroll_follows_next_page(chrome):
+    pages = browsers.collect_pages(chrome, FIXTURE.as_uri(), "css-ix8km1",
+                                   next_page_class = "css-a8wls9",
+                                   dismiss_class = "css-wuwqem", quiet = 1.0)
+
+    assert len(pages) == 3
+    assert all(page.count("/product/fixture-product-P") == LINKS_PER_PAGE
+               for page in pages)
+
+
+def test_release_broken_browser_after_close():
+    pool = browsers.BrowserPool(size = 1)
+    browser = FakeBrowser()
+    pool._all.append(browser)
+
+    pool.close()
+    pool.release(browser, broken = True) # the pool no longer holds it
+
+    assert browser.quit_calls == 2
+    assert pool._all == []
@@ -0,0 +1,74 @@
+from stand_in import PRODUCT_DIR, ScriptedFaults, product_urls
+from fetch import FetchEngine, FetchError
+from benchmarks import serve_corpus
+import pytest
+import time
+
+
+def make_engine(client, requests_per_second: float = None, retries: int = 3,
+                **kwargs) -> FetchEngine:
+    # no rate limit and short backoffs, so the tests run quickly
+    return FetchEngine(max_workers = 8, requests_per_second = requests_per_second,
+                       retries = retries, backoff = 0.01, max_backoff = 0.05,
+                       client = client, **kwargs)
+
+
+def test_fetch_all_keeps_url_order(client):
+    faults = ScriptedFaults(latency = 0.02) # responses finish out of order
+
+    with serve_corpus(faults = faults) as base_url:
+        urls = product_urls(base_url)
+        urls = urls[::-1] + urls[:5] # not sorted, and with repeats
+        results = list(make_engine(client).fetch_all(urls))
+
+    assert [url for url, _ in results] == urls
+    for url, content in results:
+        assert content == (PRODUCT_DIR / (url.rsplit("/", 1)[1] + ".html")).read_bytes()
+
+
+def test_retries_server_errors(client):
+    faults = ScriptedFaults([500, 503])
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+        content = make_engine(client).fetch(url)
+
+    assert content == (PRODUCT_DIR / (url.rsplit("/", 1)[1] + ".html")).read_bytes()
+    assert faults.requests == {500: 1, 503: 1, 200: 1}
+
+
+def test_gives_up_after_the_retry_budget(client):
+    faults = ScriptedFaults([500] * 10)
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+        engine = make_engine(client, retries = 2)
+
+        assert engine.fetch(url) is None
+        assert faults.requests == {500: 3} # the first attempt and 2 retries
+
+        with pytest.raises(FetchError):
+            engine.fetch_page(url)
+        assert faults.requests == {500: 6}
+
+
+def test_does_not_retry_missing_pages(client):
+    with serve_corpus(faults = ScriptedFaults()) as base_url:
+        engine = make_engine(client)
+        assert engine.fetch(base_url + "product/no-such-product-P1") is None
+
+
+def test_rate_limit_spaces_out_requests(client):
+    requests_per_second = 20.0
+
+    with serve_corpus(faults = ScriptedFaults()) as base_url:
+        urls = product_urls(base_url)[:6]
+        engine = make_engine(client, requests_per_second = requests_per_second)
+
+        start = time.monotonic()
+        results = list(engine.fetch_all(urls))
+        elapsed = time.monotonic() - start
+
+    # the first request starts straight away, the others one interval apart
+    assert all(content is not None for _, content in results)
+    assert elapsed >= (len(urls) - 1) / requests_per_second * 0.9
@@ -0,0 +1,113 @@
+from stand_in import ScriptedFaults, product_urls
+from fetch import AdaptiveConcurrency, CircuitBreaker, FetchEngine
+from benchmarks import serve_corpus
+import threading
+import time
+
+
+def make_engine(client, breaker = None, concurrency = None, retries: int = 6,
+                max_workers: int = 8) -> FetchEngine:
+    return FetchEngine(max_workers = max_workers, requests_per_second = None,
+                       retries = retries, backoff = 0.01, max_backoff = 0.05,
+                       client = client, breaker = breaker, concurrency = concurrency)
+
+
+# ---------------------------- < CIRCUIT BREAKER > ---------------------------- #
+def test_breaker_opens_after_repeated_server_errors(client):
+    breaker = CircuitBreaker(failure_threshold = 3, reset_timeout = 60.0)
+    faults = ScriptedFaults([500] * 3)
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+        engine = make_engine(client, breaker, retries = 2)
+
+        assert engine.fetch(url) is None
+        assert breaker.state(url) == "open"
+        assert faults.requests == {500: 3}
+
+
+def test_breaker_lets_one_trial_through_then_closes(client):
+    breaker = CircuitBreaker(failure_threshold = 3, reset_timeout = 0.3)
+    faults = ScriptedFaults([500] * 3)
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+
+        start = time.monotonic()
+        content = make_engine(client, breaker).fetch(url)
+        elapsed = time.monotonic() - start
+
+    # the 4th attempt waited for the circuit to half-open, and closed it
+    assert content is not None
+    assert elapsed >= 0.3
+    assert breaker.state(url) == "closed"
+    assert faults.requests == {500: 3, 200: 1}
+
+
+def test_half_open_breaker_holds_back_all_but_one_request():
+    url = "http://127.0.0.1:1/product/p"
+    breaker = CircuitBreaker(failure_threshold = 1, reset_timeout = 0.1)
+    breaker.failure(url)
+    assert breaker.state(url) == "open"
+
+    time.sleep(0.15)
+    assert breaker.acquire(url) # the trial
+
+    waiting = threading.Thread(target = breaker.acquire, args = (url,), daemon = True)
+    waiting.start()
+    waiting.join(0.3)
+    assert waiting.is_alive() # held back while the trial is out
+
+    breaker.success(url)
+    waiting.join(2.0)
+    assert not waiting.is_alive()
+    assert breaker.state(url) == "closed"
+
+
+def test_throttled_trial_closes_the_circuit(client):
+    # a 429 shows the host is up: the trial mustn't leave the circuit stuck
+    breaker = CircuitBreaker(failure_threshold = 2, reset_timeout = 0.1,
+                             give_up_after = 2.0)
+    faults = ScriptedFaults([500, 500, 429], retry_after = 0.01)
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+        content = make_engine(client, breaker).fetch(url)
+
+    assert content is not None
+    assert breaker.state(url) == "closed"
+    assert faults.requests == {500: 2, 429: 1, 200: 1}
+
+
+# ------------------------------ < CONCURRENCY > ------------------------------ #
+def test_concurrency_backs_off_when_throttled_and_recovers(client):
+    concurrency = AdaptiveConcurrency(initial = 8, maximum = 8)
+    faults = ScriptedFaults(latency = 0.05, max_in_flight = 2, retry_after = 0.01)
+
+    with serve_corpus(faults = faults) as base_url:
+        urls = product_urls(base_url)
+        engine = make_engine(client, concurrency = concurrency, retries = 20)
+
+        results = list(engine.fetch_all(urls))
+        assert all(content is not None for _, content in results)
+        assert faults.requests[429] > 0
+        backed_off = concurrency.limit(urls[0])
+        assert backed_off < 8
+
+        # the site stops throttling: each success raises the limit again
+        faults.max_in_flight = None
+        list(engine.fetch_all(urls * 3))
+        assert concurrency.limit(urls[0]) > backed_off
+
+
+def test_timeout_counts_as_throttling(client):
+    concurrency = AdaptiveConcurrency(initial = 4, maximum = 8)
+    faults = ScriptedFaults(["hang"], hang_seconds = 1.0) # beyond the 0.5s read timeout
+
+    with serve_corpus(faults = faults) as base_url:
+        url = product_urls(base_url)[0]
+        content = make_engine(client, concurrency = concurrency).fetch(url)
+
+    assert content is not None # retried after the timeout
+    assert faults.requests["hang"] == 1
+    assert concurrency.limit(url) < 4
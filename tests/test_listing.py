@@ -0,0 +1,106 @@
+from stand_in import CORPUS_DIR, LISTINGS_DIR, SITE_DIR
+from listing import get_listing_links, parse_listing
+from fetch import FetchEngine, get_engine, set_engine
+from benchmarks import serve_corpus, SUBCATEGORY_LINK
+import contextlib
+import pytest
+import json
+
+
+# the embedded listing fixture: 45 products, 20 per page, over 3 pages
+N_PRODUCTS = 45
+PAGE_SIZE = 20
+
+
+def fixture_page(base_url: str):
+    # page_url for the saved pages, in place of ?currentPage=N
+    return lambda url, page: f"{base_url}embedded/page{page}.html"
+
+
+@pytest.fixture
+def engine(client):
+    engine = FetchEngine(requests_per_second = None, retries = 0, client = client)
+    previous = get_engine()
+    set_engine(engine)
+    yield engine
+    set_engine(previous)
+
+
+def test_follows_every_page(engine):
+    with serve_corpus(LISTINGS_DIR) as base_url:
+        links = get_listing_links(base_url + "embedded/page1.html", engine,
+                                  page_url = fixture_page(base_url))
+
+    assert len(links) == N_PRODUCTS
+    assert links == [f"/product/embedded-product-P{200000 + n}?icid2=products grid:"
+                     f"p{200000 + n}" for n in range(N_PRODUCTS)]
+
+
+def test_stops_at_max_pages(engine):
+    with serve_corpus(LISTINGS_DIR) as base_url:
+        links = get_listing_links(base_url + "embedded/page1.html", engine,
+                                  max_pages = 2, page_url = fixture_page(base_url))
+
+    assert len(links) == 2 * PAGE_SIZE
+
+
+def test_drops_repeated_links(engine):
+    # every "other" page is the first page again
+    with serve_corpus(LISTINGS_DIR) as base_url:
+        links = get_listing_links(base_url + "embedded/page1.html", engine,
+                                  page_url = lambda url, page: url)
+
+    assert len(links) == PAGE_SIZE
+    assert len(set(links)) == PAGE_SIZE
+
+
+def test_parse_listing_keeps_first_of_each_link():
+    content = (b'<script type="application/json">{"products": ['
+               b'{"targetUrl": "/product/a-P1"}, {"targetUrl": "/product/b-P2"},'
+               b'{"targetUrl": "/product/a-P1"}], "totalPages": 1}</script>')
+
+    assert parse_listing(content) == {"links": ["/product/a-P1", "/product/b-P2"],
+                                      "total_pages": 1}
+
+
+def test_page_without_embedded_data(engine):
+    with serve_corpus(SITE_DIR) as base_url:
+        assert get_listing_links(base_url + SUBCATEGORY_LINK.lstrip("/"), engine) is None
+
+
+def test_falls_back_to_the_browser(engine, monkeypatch):
+    pytest.importorskip("selenium")
+    import browsers
+    from sephora import Sephora
+
+    with open(SITE_DIR / (SUBCATEGORY_LINK.strip("/") + ".html"), "rb") as f:
+        page_source = f.read().decode("utf-8")
+
+    rendered = []
+
+    class FakePool:
+        def __init__(self, size):
+            pass
+
+        def session(self):
+            return contextlib.nullcontext("browser")
+
+        def close(self):
+            pass
+
+    def collect_pages(browser, url, link_class, **kwargs):
+        rendered.append(url)
+        return [page_source]
+
+    monkeypatch.setattr(browsers, "BrowserPool", FakePool)
+    monkeypatch.setattr(browsers, "collect_pages", collect_pages)
+
+    with serve_corpus(SITE_DIR) as base_url:
+        sephora = Sephora(base_url = base_url.rstrip("/"))
+        sephora.get_product_links(SUBCATEGORY_LINK, listing = "json")
+
+    with open(CORPUS_DIR / "expected.json") as f:
+        expected = json.load(f)["product_links"]
+
+    assert len(rendered) == 1
+    assert sephora.product_links == set(expected)
@@ -0,0 +1,53 @@
+from selector_profiles import SelectorError, choose_profile
+from sephora_setup import SELECTOR_PROFILES
+from canonical import IngredientDictionary
+from locator import IngredientLocator
+from stand_in import PRODUCT_DIR
+from sephora import Sephora
+import parsers
+import pytest
+import json
+
+
+@pytest.fixture(scope = "module")
+def pages():
+    return [(path.name, path.read_bytes()) for path in sorted(PRODUCT_DIR.glob("*.html"))]
+
+
+def redeploy(content: bytes) -> bytes:
+    # the site's build renames every class, and the page gains JSON-LD
+    fields = parsers.extract_product_fields(content)
+    for tag, class_tag in SELECTOR_PROFILES["v1"].values():
+        content = content.replace(class_tag.encode(), b"x" + class_tag.encode())
+
+    product = {"@context": "https://schema.org", "@type": "Product",
+               "name": fields["name"], "brand": {"@type": "Brand", "name": fields["brand"]},
+               "offers": {"@type": "Offer", "price": (fields["price"] or "").lstrip("$"),
+                          "priceCurrency": "USD"}}
+    script = b'<script type="application/ld+json">' + json.dumps(product).encode() + b"</script>"
+    return content.replace(b"</head>", script + b"</head>", 1)
+
+
+def test_heals_a_stale_profile(pages):
+    expected = Sephora(parser = "html.parser")
+    records = [expected.parse_product_page(name, content) for name, content in pages]
+    dictionary = IngredientDictionary(sorted({name for r in records if r
+                                              for name in r["ingredients"] if name}))
+    redeployed = [(name, redeploy(content)) for name, content in pages]
+
+    name, profile = choose_profile([c for _, c in redeployed[:8]], backend = "html.parser",
+                                   locator = IngredientLocator(dictionary))
+    assert name == "healed"
+
+    sephora = Sephora(parser = "html.parser", profile = profile)
+    healed = [sephora.parse_product_page(name, content) for name, content in redeployed]
+    # the product type isn't in the JSON-LD, so only the other fields can heal
+    strip = lambda record: record and {k: v for k, v in record.items() if k != "product_type"}
+    assert [strip(r) for r in healed] == [strip(r) for r in records]
+
+
+def test_details_are_not_healed_without_a_dictionary(pages):
+    redeployed = [redeploy(content) for _, content in pages[:8]]
+
+    with pytest.raises(SelectorError):
+        choose_profile(redeployed, backend = "html.parser", locator = IngredientLocator())
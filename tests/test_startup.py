@@ -0,0 +1,14 @@
+import benchmarks
+
+
+def test_screen_help_starts_fast_without_heavy_imports():
+    result = benchmarks.startup_time(["screen", "--help"])
+
+    assert result["seconds"] < benchmarks.STARTUP_BUDGET
+    for module in ["pandas", "numpy", "selenium"]:
+        assert module not in result["modules"]
+
+
+def test_cold_screen_within_budget():
+    results, problems = benchmarks.check_startup(repeat = 1)
+    assert problems == []
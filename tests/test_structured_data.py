@@ -0,0 +1,34 @@
+from structured_data import embedded_product
+import json
+
+
+def page(state) -> bytes:
+    return b'<script type="application/json">' + json.dumps(state).encode() + b'</script>'
+
+
+def test_state_fields_come_from_the_matched_product():
+    related = {"displayName": "Other", "brandName": "Elsewhere", "listPrice": "$5.00",
+               "ingredientDesc": "Water", "parentCategory": {"displayName": "Lips"}}
+    state = {"page": {
+        "recommended": [related], # before the product itself
+        "product": {
+            "parentCategory": {"displayName": "Moisturizers"},
+            "productDetails": {"displayName": "Cream", "brand": {"displayName": "Laneige"},
+                               "relatedProducts": [related], # inside the product
+                               "content": {"ingredientDesc": "Aqua, Glycerin"}},
+            "currentSku": {"skuDetails": {"listPrice": "$30.00"}}}}}
+
+    assert embedded_product(page(state)) == {
+        "name": "Cream", "brand": "Laneige", "product_type": "Moisturizers",
+        "price": "$30.00", "ingredients": "Aqua, Glycerin"}
+
+
+def test_json_ld_product():
+    product = {"@context": "https://schema.org", "@type": "Product", "name": "Cream",
+               "brand": {"@type": "Brand", "name": "Laneige"},
+               "offers": {"price": 30, "priceCurrency": "USD"}}
+    content = (b'<script type="application/ld+json">' + json.dumps(product).encode()
+               + b'</script>')
+
+    assert embedded_product(content) == {"name": "Cream", "brand": "Laneige",
+                                         "price": "$30.00"}
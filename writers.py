@@ -0,0 +1,267 @@
+from metrics import METRICS
+import importlib.util
+import logging
+import os
+
+# product_rows needs neither pandas nor pyarrow. Creating a ProductWriter
+# imports pandas and numpy (for the csv sinks and canonical.py's dictionary);
+# pyarrow is only imported for the optional parquet output
+
+# the synonym table that resolves the ingredients table's ingredient_id column,
+# saved beside the tables (see canonical.IngredientDictionary.to_csv)
+DICTIONARY_FILE = "ingredient_ids.csv"
+
+
+# columns written for each table, in order
+TABLE_COLUMNS = {
+    "ingredients": ["name", "ingredient", "ingredient_id", "rank"],
+    "products": ["name", "brand", "price", "link"]
+}
+
+
+def product_rows(product: dict, table_type: str, dictionary = None) -> list:
+    """
+    Description
+    -----------
+    Convert one product dictionary into rows for the given table
+    ("ingredients" is long format: one row per ingredient, with its
+    ingredient ID and rank)
+
+    Parameters
+    ----------
+    product: dict
+        as returned by Sephora.parse_product_page
+    table_type: str
+        one of ["ingredients", "products"]
+    dictionary: canonical.IngredientDictionary
+        maps each ingredient name to its ID (needed for "ingredients")
+
+    Returns
+    -------
+    rows: list of tuple
+    """
+
+    assert table_type in TABLE_COLUMNS, (
+        "table_type must be 'ingredients' or 'products'")
+
+    if table_type == "ingredients":
+        assert dictionary is not None, "the ingredients table needs a dictionary"
+        return [(product["name"], ingredient, dictionary.intern(ingredient), rank)
+                for rank, ingredient in enumerate(product["ingredients"], start = 1)]
+
+    return [(product["name"], product["brand"], product["price"], product["link"])]
+
+
+
+class TableSink:
+    """
+    A class used to append rows of one table to .csv and/or .parquet files
+    in fixed-size batches.
+
+    Attributes
+    ----------
+    table_type: str
+        one of ["ingredients", "products"]
+    formats: tuple of str
+        any of "csv" and "parquet" ("dataset" is written by dataset.DatasetSink)
+    batch_size: int
+        number of buffered rows that triggers a write
+    rows_written: int
+    """
+
+    def __init__(self, directory: str, table_type: str,
+                 formats: tuple = ("csv",), batch_size: int = 1000):
+
+        assert table_type in TABLE_COLUMNS, (
+            "table_type must be 'ingredients' or 'products'")
+        assert set(formats) <= {"csv", "parquet", "dataset"}, (
+            "formats must be any of 'csv', 'parquet', and 'dataset'")
+        assert batch_size >= 1, "batch_size must be at least 1"
+
+        if "parquet" in formats and importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("parquet output requires pyarrow")
+
+        self.table_type = table_type
+        self.formats = tuple(formats)
+        self.batch_size = batch_size
+        self.columns = TABLE_COLUMNS[table_type]
+        self.rows_written = 0
+
+        self.csv_path = os.path.join(directory, f"{table_type}.csv")
+        self.parquet_path = os.path.join(directory, f"{table_type}.parquet")
+
+        self._buffer = []
+        self._parquet_writer = None
+
+        # start a fresh csv with just the header row
+        if "csv" in self.formats:
+            import pandas as pd
+            pd.DataFrame(columns = self.columns).to_csv(self.csv_path, index = False)
+
+
+    def append(self, rows: list):
+        self._buffer += rows
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+
+    @METRICS.timed("write_output")
+    def flush(self):
+        """
+        Description
+        -----------
+        Write every buffered row and empty the buffer
+        """
+
+        if not self._buffer:
+            return
+
+        import pandas as pd
+
+        df = pd.DataFrame(self._buffer, columns = self.columns)
+        if self.table_type == "ingredients":
+            df = df.astype({"ingredient_id": "int64", "rank": "int64"})
+
+        if "csv" in self.formats:
+            df.to_csv(self.csv_path, mode = "a", header = False, index = False)
+
+        if "parquet" in self.formats:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, schema = self._schema(),
+                                         preserve_index = False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.parquet_path,
+                                                        self._schema())
+            self._parquet_writer.write_table(table)
+
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+
+    def _schema(self):
+        # fixed schema, so a batch of all-null values can't change column types
+        import pyarrow as pa
+
+        fields = [(c, pa.int64() if c in ("ingredient_id", "rank") else pa.string())
+                  for c in self.columns]
+        return pa.schema(fields)
+
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+
+class ProductWriter:
+    """
+    A class used to stream products to the ingredients and products tables
+    as they are parsed, so memory use stays flat however large the crawl.
+
+    Ingredient names are also mapped to integer IDs (the ingredient_id
+    column), and the synonym table that resolves them is saved as
+    DICTIONARY_FILE when the writer is closed. The raw "ingredient" column
+    is kept beside the IDs, as the spelling found on the page, so the
+    files are no smaller than before; drop it when reading if only the
+    IDs are needed (canonical.IngredientDictionary.decode gives back the
+    canonical names).
+
+    Attributes
+    ----------
+    sinks: dict of TableSink
+        one sink per table type
+    dictionary: canonical.IngredientDictionary
+    dictionary_path: str
+    dataset_sinks: dict of dataset.DatasetSink
+        one sink per table type if "dataset" is in formats: a Parquet
+        dataset partitioned by crawl date and product type, written to
+        the "dataset" directory (see dataset.py)
+    """
+
+    def __init__(self, directory: str = ".", formats: tuple = ("csv",),
+                 batch_size: int = 1000, crawl_date: str = None, dictionary = None):
+        """
+        Parameters
+        ----------
+        dictionary: canonical.IngredientDictionary
+            e.g. the crawl's InvertedIndex.dictionary, so the tables share
+            its IDs (defaults to the synonym table saved in directory by an
+            earlier run, so IDs stay the same from one crawl to the next)
+        """
+
+        os.makedirs(directory, exist_ok = True)
+        self.dictionary_path = os.path.join(directory, DICTIONARY_FILE)
+        self.dictionary = (load_dictionary(self.dictionary_path) if dictionary is None
+                           else dictionary)
+        self.sinks = {
+            table_type: TableSink(directory, table_type,
+                                  [f for f in formats if f != "dataset"], batch_size)
+            for table_type in TABLE_COLUMNS
+        }
+
+        self.dataset_sinks = {}
+        if "dataset" in formats:
+            from dataset import DatasetSink, DATASET_DIRECTORY
+            self.dataset_sinks = {
+                table_type: DatasetSink(os.path.join(directory, DATASET_DIRECTORY),
+                                        table_type, crawl_date, batch_size)
+                for table_type in TABLE_COLUMNS
+            }
+
+
+    def write(self, product: dict):
+        """
+        Description
+        -----------
+        Add one product's rows to every table
+
+        Parameters
+        ----------
+        product: dict
+            as returned by Sephora.parse_product_page
+        """
+
+        for table_type, sink in self.sinks.items():
+            rows = product_rows(product, table_type, self.dictionary)
+            sink.append(rows)
+            if table_type in self.dataset_sinks:
+                self.dataset_sinks[table_type].append(rows, product.get("product_type"))
+
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+            logging.info(f"wrote {sink.rows_written} rows to {sink.table_type}")
+
+        for sink in self.dataset_sinks.values():
+            sink.close()
+            logging.info(f"wrote {sink.rows_written} rows to {sink.path}")
+
+        self.dictionary.to_csv(self.dictionary_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+
+def load_dictionary(path: str = DICTIONARY_FILE):
+    """
+    Returns
+    -------
+    canonical.IngredientDictionary: the synonym table saved at path by an
+    earlier run, or a new dictionary holding INGREDIENT_SYNONYMS
+    """
+
+    from canonical import IngredientDictionary
+    from sephora_setup import INGREDIENT_SYNONYMS
+
+    if os.path.exists(path):
+        return IngredientDictionary.from_csv(path)
+    return IngredientDictionary(synonyms = INGREDIENT_SYNONYMS)